@@ -0,0 +1,69 @@
+"""
+Microbenchmark of feature encoding on the inference hot path:
+_build_rows + PRE.transform (pandas + ColumnTransformer) against the
+FeatureEncoder.encode path, for one row and for a batch of all sensors.
+
+    python -m benchmarks.bench_encoder --sensors 100
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic import fit_small_model, make_counts, sensor_names
+from src import inference
+from src.encoder import FeatureEncoder
+from src.features import AEST
+
+
+def per_call_us(fn, repeat: int) -> float:
+    fn()  # warm
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - t0) / repeat * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature encoding microbenchmark")
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    pre, model = fit_small_model(make_counts(n_sensors=args.sensors, n_hours=24 * 7 * 3))
+    inference.install(inference.LoadedModel("synthetic", pre, model, FeatureEncoder.from_column_transformer(pre)))
+
+    ts = datetime(2025, 4, 17, 9, tzinfo=AEST)
+    sensors = sensor_names(args.sensors)
+    lags_24h = np.linspace(0, 900, args.sensors)
+    lags_168h = np.linspace(10, 1000, args.sensors)
+    one = (sensors[:1], ts, lags_24h[:1], lags_168h[:1])
+    batch = (sensors, ts, lags_24h, lags_168h)
+
+    results = {
+        "single_row_us": {
+            "pandas_column_transformer": per_call_us(lambda: pre.transform(inference._build_rows(*one)), args.repeat),
+            "feature_encoder": per_call_us(lambda: inference._encode(*one), args.repeat),
+        },
+        f"batch_{args.sensors}_us": {
+            "pandas_column_transformer": per_call_us(lambda: pre.transform(inference._build_rows(*batch)), args.repeat // 10),
+            "feature_encoder": per_call_us(lambda: inference._encode(*batch), args.repeat // 10),
+        },
+        "predict_single_us": {
+            "pandas_column_transformer": per_call_us(
+                lambda: model.predict(pre.transform(inference._build_rows(*one))), args.repeat // 10),
+            "feature_encoder": per_call_us(
+                lambda: inference.predict_current_hour_with_live_lags(sensors[0], ts, lags_24h[0], lags_168h[0]),
+                args.repeat // 10),
+        },
+    }
+    for timings in results.values():
+        timings["speedup"] = round(timings["pandas_column_transformer"] / timings["feature_encoder"], 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
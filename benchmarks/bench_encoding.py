@@ -0,0 +1,85 @@
+"""
+Peak RSS and fit time of training with each feature encoding (dense one-hot,
+sparse CSR one-hot, XGBoost native categorical). Every encoding runs in its
+own process so the peak RSS figures are independent.
+
+    python -m benchmarks.bench_encoding --sensors 100 --weeks 52 --rounds 200
+    python -m benchmarks.bench_encoding --full        # counts since 2020 from src.load
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+
+def run_one(args):
+    """Child process: encode + boost once, print one JSON line."""
+    from src import train
+
+    if args.full:
+        from src.load import CUTOFF, load_counts
+        ped = load_counts(start=CUTOFF)
+        cut_date = train.CUT_DATE_VAL
+    else:
+        from benchmarks.synthetic import make_counts
+        ped = make_counts(n_sensors=args.sensors, n_hours=24 * 7 * args.weeks)
+        cut_date = ped["Sensing_Date"].max() - pd.Timedelta(days=28)
+
+    feats = train.make_features(ped)
+    train_df, val_df = train.split(feats, cut_date)
+    rss_data = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t0 = time.perf_counter()
+    pre, arrays = train.encode(train_df, val_df, encoding=args.child)
+    t_encode = time.perf_counter() - t0
+    X = arrays["X_train"]
+    matrix_mb = (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes if hasattr(X, "indptr") else X.nbytes) / 1e6
+
+    t0 = time.perf_counter()
+    booster = train.boost(arrays, args.rounds, args.nthread, feature_types=getattr(pre, "feature_types", None))
+    t_fit = time.perf_counter() - t0
+
+    model = train.as_regressor(booster)
+    mae = float(abs(model.predict(arrays["X_val"]) - arrays["y_val"]).mean())
+    print(json.dumps({
+        "encoding": args.child,
+        "train_rows": len(train_df),
+        "train_matrix_mb": round(matrix_mb, 1),
+        "encode_s": round(t_encode, 2),
+        "fit_s": round(t_fit, 2),
+        "rounds": booster.num_boosted_rounds(),
+        "val_mae": round(mae, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_before_encode_mb": round(rss_data / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training encoding benchmark")
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--nthread", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="use the real counts (data/raw) instead of synthetic")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_one(args)
+
+    from src.train import ENCODINGS
+    results = []
+    for encoding in ENCODINGS:
+        cmd = [sys.executable, "-m", "benchmarks.bench_encoding", "--child", encoding] + sys.argv[1:]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Time and peak traced memory of the training feature step: the .pipe chain of
+add_* functions (one frame copy each, groupby-shift lags) against
+build_features (in place, hour-indexed lags). Also counts how many lag values
+the row-position shift gets wrong once hours are missing from the data.
+String columns held in pyarrow buffers are not traced, so copies of them
+are not in the peak figures.
+
+    python -m benchmarks.bench_features --sensors 100 --weeks 52
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import make_counts
+from src.features import add_day_of_week, add_is_holiday, add_lags, add_lockdown_flag, build_features
+
+
+def pipe_chain(df):
+    return (
+        df.pipe(add_is_holiday)
+        .pipe(add_lockdown_flag)
+        .pipe(add_day_of_week)
+        .pipe(add_lags, lags=(24, 168))
+    )
+
+
+def measure(fn, df) -> dict:
+    df = df.copy()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(df)
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 3), "peak_traced_mb": round(peak / 1e6, 1)}, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature pipeline benchmark")
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--gap-rate", type=float, default=0.01, help="fraction of rows dropped")
+    args = parser.parse_args()
+
+    df = make_counts(n_sensors=args.sensors, n_hours=24 * 7 * args.weeks)
+    frame_mb = df.memory_usage(deep=True).sum() / 1e6
+    results = {"rows": len(df), "frame_mb": round(frame_mb, 1)}
+    (results["pipe_chain"], _), (results["build_features"], _) = measure(pipe_chain, df), measure(build_features, df)
+
+    # Same frame with missing hours: row-position lags silently pick up the wrong hour
+    rng = np.random.default_rng(1)
+    gapped = df[rng.random(len(df)) >= args.gap_rate].reset_index(drop=True)
+    _, shifted = measure(pipe_chain, gapped)
+    _, indexed = measure(build_features, gapped)
+    full = build_features(df.copy()).set_index(["Sensor_Name", "Sensing_Date", "HourDay"])["lag_168h"]
+    truth = full.reindex(gapped.set_index(["Sensor_Name", "Sensing_Date", "HourDay"]).index).to_numpy()
+    present = ~np.isnan(indexed["lag_168h"].to_numpy())
+    results["gapped"] = {
+        "rows": len(gapped),
+        "pipe_chain_wrong_lag_168h": int(np.sum(~np.isnan(shifted["lag_168h"].to_numpy())
+                                                & (shifted["lag_168h"].to_numpy() != truth))),
+        "build_features_wrong_lag_168h": int(np.sum(indexed["lag_168h"].to_numpy()[present] != truth[present])),
+        "build_features_nan_lag_168h": int((~present).sum()),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Latency benchmark for live lag fetching against a local stub of the records
+endpoint. The stub adds a fixed delay per request to stand in for upstream RTT.
+
+Compares the previous implementation (blocking `requests.get` in a worker
+thread, 24h then 168h, new connection per call) with the pooled UpstreamClient
+making single-row queries, and, for all sensors at once, with its bulk
+per-hour queries.
+
+    python -m benchmarks.bench_upstream --rtt-ms 40 --requests 50 --sensors 100
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from src.api import AEST, fetch_live_lags_from_external_api
+from src.upstream import UpstreamClient
+
+
+def start_stub_server(rtt_ms: float, n_sensors: int) -> ThreadingHTTPServer:
+    single = json.dumps({"total_count": 1, "results": [{"pedestriancount": 42}]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # allow keep-alive
+        disable_nagle_algorithm = True  # headers and body are separate writes
+
+        def do_GET(self):
+            time.sleep(rtt_ms / 1000)
+            params = parse_qs(urlparse(self.path).query)
+            body = single
+            if "refine.sensor_name" not in params:  # bulk query: one page of every sensor's hour
+                offset, limit = int(params["offset"][0]), int(params["limit"][0])
+                body = json.dumps({"total_count": n_sensors, "results": [
+                    {"sensor_name": f"sensor{i}", "pedestriancount": 42}
+                    for i in range(offset, min(offset + limit, n_sensors))
+                ]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def legacy_fetch(url: str, sensor: str, current_ts: datetime) -> dict:
+    def _get_lag(hours_back: int) -> float:
+        target = current_ts - timedelta(hours=hours_back)
+        resp = requests.get(url, params={
+            "refine.sensing_date": target.strftime("%Y-%m-%d"),
+            "refine.hourday": str(target.hour),
+            "refine.sensor_name": sensor,
+            "limit": 1,
+        }, timeout=10)
+        resp.raise_for_status()
+        return float(resp.json()["results"][0]["pedestriancount"])
+
+    lag_24h = await asyncio.to_thread(_get_lag, 24)
+    lag_168h = await asyncio.to_thread(_get_lag, 168)
+    return {"lag_24h": lag_24h, "lag_168h": lag_168h}
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))] * 1000, 2),
+        "n": len(samples),
+    }
+
+
+async def run(url: str, n_requests: int, n_sensors: int) -> dict:
+    ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    sensors = [f"sensor{i}" for i in range(n_sensors)]
+    results = {}
+
+    # Single-sensor latency, one request at a time
+    legacy = []
+    for _ in range(n_requests):
+        t0 = time.perf_counter()
+        await legacy_fetch(url, "sensor0", ts)
+        legacy.append(time.perf_counter() - t0)
+    results["single_legacy"] = summarize(legacy)
+
+    async with UpstreamClient(url=url, bulk=False) as client:
+        await fetch_live_lags_from_external_api("sensor0", ts, client)  # open the pool
+        pooled = []
+        for _ in range(n_requests):
+            t0 = time.perf_counter()
+            await fetch_live_lags_from_external_api("sensor0", ts, client)
+            pooled.append(time.perf_counter() - t0)
+        results["single_pooled"] = summarize(pooled)
+
+        # Every sensor at once, as /predict/batch does
+        t0 = time.perf_counter()
+        await asyncio.gather(*(fetch_live_lags_from_external_api(s, ts, client) for s in sensors))
+        results["all_sensors_pooled_s"] = round(time.perf_counter() - t0, 3)
+
+    async with UpstreamClient(url=url) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(fetch_live_lags_from_external_api(s, ts, client) for s in sensors))
+        results["all_sensors_bulk_s"] = round(time.perf_counter() - t0, 3)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(legacy_fetch(url, s, ts) for s in sensors))
+    results["all_sensors_legacy_s"] = round(time.perf_counter() - t0, 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rtt-ms", type=float, default=40.0)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--sensors", type=int, default=100)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.rtt_ms, args.sensors)
+    url = f"http://127.0.0.1:{server.server_address[1]}/records"
+    try:
+        results = asyncio.run(run(url, args.requests, args.sensors))
+    finally:
+        server.shutdown()
+    print(json.dumps({"rtt_ms": args.rtt_ms, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark suite: throughput of the serving and feature paths on synthetic
+data shaped like the real counts (see benchmarks/synthetic.py), with a small
+model trained on the fly. Results are written as JSON for comparing commits.
+
+* predict_current_hour_with_live_lags (one row) and predict_batch (all sensors)
+* XGBRegressor.predict against the compiled trees (src/trees.py) per batch size
+* every src.features transform, at each --rows size (default 1M and 10M)
+* buffer startup on the full sensor set: parquet + init_buffers against the
+  memory-mapped columnar snapshot
+* end-to-end GET /predict in-process, upstream stubbed (cold and warm lag cache)
+
+    python -m benchmarks.suite --out bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --quick                      # 100k rows, fewer repeats
+    python -m benchmarks.suite --compare old.json new.json  # ratio new/old per benchmark
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import fit_small_model, make_counts, sensor_names
+from src import api, hourly, inference, trees, upstream
+from src.buffers import write_snapshot
+from src.encoder import FeatureEncoder
+from src.features import (AEST, add_day_of_week, add_is_holiday, add_lags, add_lockdown_flag,
+                          build_features)
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+        "p50_us": round(statistics.median(samples) * 1e6, 2),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 2),
+        "min_us": round(samples[0] * 1e6, 2),
+    }
+
+
+def measure(fn, repeat: int, setup=None, warmup: int = 1) -> dict:
+    """Per-call timings of fn(setup()) (or fn()); setup time is not counted."""
+    for _ in range(warmup):
+        fn(setup()) if setup else fn()
+    samples = []
+    gc.collect()
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t0 = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def install_model(n_sensors: int):
+    """Train the small synthetic model and make it the one src.inference serves."""
+    pre, model = fit_small_model(make_counts(n_sensors=n_sensors, n_hours=24 * 7 * 3))
+    inference.install(inference.LoadedModel("synthetic", pre, model, FeatureEncoder.from_column_transformer(pre)))
+
+
+def bench_inference(sensors: list[str], repeat: int) -> dict:
+    ts = datetime(2025, 4, 17, 9, tzinfo=AEST)
+    lags_24h = np.linspace(0, 900, len(sensors))
+    lags_168h = np.linspace(10, 1000, len(sensors))
+    return {
+        "predict_single_row": measure(
+            lambda: inference.predict_current_hour_with_live_lags(sensors[0], ts, 120.0, 95.0), repeat),
+        f"predict_batch_{len(sensors)}": measure(
+            lambda: inference.predict_batch(sensors, ts, lags_24h, lags_168h), max(repeat // 10, 5)),
+    }
+
+
+def bench_trees(sensors: list[str], repeat: int) -> dict:
+    """Raw scoring cost of both backends on the same encoded rows; checks they agree."""
+    m = inference.active()
+    compiled = trees.compile_model(m.model)
+    ts = datetime(2025, 4, 17, 9, tzinfo=AEST)
+    results = {}
+    for n in (1, 16, inference.COMPILED_MAX_ROWS, len(sensors)):
+        names = [sensors[i % len(sensors)] for i in range(n)]
+        rows = inference._encode(names, ts, np.linspace(0, 900, n), np.linspace(10, 1000, n), encoder=m.encoder)
+        np.testing.assert_allclose(compiled.predict(rows), m.model.predict(rows), rtol=1e-5, atol=1e-3)
+        results[f"xgboost_predict_{n}_rows"] = measure(lambda: m.model.predict(rows), repeat)
+        results[f"compiled_predict_{n}_rows"] = measure(lambda: compiled.predict(rows), repeat)
+    return results
+
+
+def bench_features(rows: int, n_sensors: int, repeat: int) -> dict:
+    df = make_counts(n_sensors=n_sensors, n_hours=-(-rows // n_sensors))
+    transforms = {
+        "add_is_holiday": add_is_holiday,
+        "add_lockdown_flag": add_lockdown_flag,
+        "add_day_of_week": add_day_of_week,
+        "add_lags": add_lags,
+        "build_features": build_features,
+    }
+    results = {}
+    for name, fn in transforms.items():
+        # build_features works in place, so every call gets its own copy
+        results[f"{name}_{len(df)}"] = measure(fn, repeat, setup=df.copy, warmup=0)
+    return results
+
+
+def bench_buffers(sensors: list[str], repeat: int) -> dict:
+    counts = make_counts(n_sensors=len(sensors), n_hours=336, start="2025-04-03")
+    n = len(sensors)
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet, snapshot = os.path.join(tmp, "recent.parquet"), os.path.join(tmp, "recent")
+        counts.groupby("Sensor_Name", observed=True).tail(168).to_parquet(parquet, index=False)
+        write_snapshot(counts, snapshot)
+        return {
+            f"init_buffers_{n}_sensors": measure(lambda: inference.init_buffers(counts), repeat),
+            f"startup_parquet_{n}_sensors": measure(
+                lambda: inference.init_buffers(pd.read_parquet(parquet)), repeat),
+            f"startup_snapshot_{n}_sensors": measure(lambda: inference.BUFFERS.load_snapshot(snapshot), repeat),
+        }
+
+
+async def _predict_requests(sensors: list[str], n: int, cold: bool) -> list[float]:
+    def handler(request):
+        params = request.url.params
+        if "refine.sensor_name" in params:
+            return httpx.Response(200, json={"total_count": 1, "results": [{"pedestriancount": 42}]})
+        offset, limit = int(params["offset"]), int(params["limit"])
+        return httpx.Response(200, json={"total_count": len(sensors), "results": [
+            {"sensor_name": s, "pedestriancount": 42} for s in sensors[offset:offset + limit]
+        ]})
+
+    samples = []
+    upstream_client = upstream.open_client(transport=httpx.MockTransport(handler), cache=upstream.LagCache())
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench") as client:
+            for i in range(n):
+                if cold:
+                    upstream_client.cache = upstream.LagCache()
+                t0 = time.perf_counter()
+                resp = await client.get("/predict", params={"sensor": sensors[i % len(sensors)]})
+                samples.append(time.perf_counter() - t0)
+                resp.raise_for_status()
+    finally:
+        await upstream.close_client()
+    return samples
+
+
+def bench_api(sensors: list[str], repeat: int) -> dict:
+    # Empty buffers and no hourly table: every request takes the on-demand path
+    inference.BUFFERS.clear()
+    hourly.publish(None)
+    results = {}
+    for name, cold in (("predict_e2e_upstream", True), ("predict_e2e_cached_lags", False)):
+        asyncio.run(_predict_requests(sensors, 5, cold))  # warm
+        results[name] = summarize(asyncio.run(_predict_requests(sensors, repeat, cold)))
+
+    now = hourly.current_hour()
+    hourly.publish(hourly.HourTable(now, dict.fromkeys(sensors, 100.0), (), now))
+    results["predict_e2e_hourly_table"] = summarize(asyncio.run(_predict_requests(sensors, repeat, False)))
+    hourly.publish(None)
+    return results
+
+
+def environment() -> dict:
+    import sklearn
+    import xgboost
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(AEST).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "xgboost": xgboost.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(old_path: str, new_path: str) -> dict:
+    """new/old ratio of the mean per benchmark present in both files (<1 is faster)."""
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    return {name: round(new[name]["mean_us"] / old[name]["mean_us"], 3)
+            for name in old if name in new and old[name]["mean_us"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference, feature and API benchmark suite")
+    parser.add_argument("--rows", default="1000000,10000000", help="comma-separated feature frame sizes")
+    parser.add_argument("--sensors", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls for the per-request benchmarks")
+    parser.add_argument("--feature-repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="100k feature rows, fewer repeats")
+    parser.add_argument("--only", nargs="+", choices=["inference", "trees", "features", "buffers", "api"])
+    parser.add_argument("--out", help="write the JSON here as well as to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+    if args.quick:
+        args.rows, args.repeat, args.feature_repeat = "100000", 50, 1
+    rows = [int(float(r)) for r in args.rows.split(",")]
+    groups = set(args.only or ["inference", "trees", "features", "buffers", "api"])
+
+    sensors = sensor_names(args.sensors)
+    results = {}
+    if groups & {"inference", "trees", "api"}:
+        install_model(args.sensors)
+    if "inference" in groups:
+        results.update(bench_inference(sensors, args.repeat))
+    if "trees" in groups:
+        results.update(bench_trees(sensors, args.repeat))
+    if "features" in groups:
+        for n in rows:
+            results.update(bench_features(n, args.sensors, args.feature_repeat))
+    if "buffers" in groups:
+        results.update(bench_buffers(sensors, max(args.repeat // 10, 5)))
+    if "api" in groups:
+        results.update(bench_api(sensors, args.repeat))
+
+    report = {"environment": environment(), "args": vars(args), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+"""
+Synthetic data for benchmarks, shaped like the real monthly-counts CSV
+(Sensor_Name, Sensing_Date, HourDay, Total_of_Directions), and a small
+model trained on it with the same preprocessing as src/train.py.
+"""
+
+import numpy as np
+import pandas as pd
+
+FEATURES_NUM = ["HourDay", "lag_24h", "lag_168h"]
+FEATURES_CAT = ["Sensor_Name", "is_holiday", "is_lockdown", "day_of_week"]
+
+
+def sensor_names(n_sensors: int) -> list[str]:
+    return [f"Sensor {i:03d} St-Example Ave" for i in range(n_sensors)]
+
+
+def make_counts(n_sensors: int = 100, n_hours: int = 24 * 7 * 4,
+                start: str = "2024-01-01", seed: int = 0) -> pd.DataFrame:
+    """Hourly counts for `n_sensors` over `n_hours`, one row per sensor-hour."""
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range(start, periods=n_hours, freq="h")
+    hours = ts.hour.to_numpy()
+    weekly = 1 + 0.3 * (ts.dayofweek.to_numpy() < 5)
+    base = rng.integers(20, 1500, n_sensors)
+
+    counts = (base[:, None] * weekly * (1.1 + np.sin((hours - 6) / 24 * 2 * np.pi))
+              + rng.integers(0, 40, (n_sensors, n_hours))).astype(np.int64)
+    return pd.DataFrame({
+        "Sensor_Name": np.repeat(sensor_names(n_sensors), n_hours),
+        "Sensing_Date": np.tile(ts.normalize(), n_sensors),
+        "HourDay": np.tile(hours, n_sensors),
+        "Total_of_Directions": counts.ravel(),
+    })
+
+
+def make_training_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Apply the src.features pipeline used by src/train.py."""
+    from src.features import build_features
+    return build_features(df.copy(), lags=(24, 168)).dropna(subset=["lag_24h", "lag_168h"])
+
+
+def fit_small_model(df: pd.DataFrame, n_estimators: int = 200, max_depth: int = 8):
+    """(pre, model) fitted like src/train.py, with fewer rounds."""
+    import xgboost as xgb
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    feats = make_training_frame(df)
+    pre = ColumnTransformer([
+        ("num", StandardScaler(), FEATURES_NUM),
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), FEATURES_CAT),
+    ])
+    X = pre.fit_transform(feats[FEATURES_NUM + FEATURES_CAT])
+    model = xgb.XGBRegressor(n_estimators=n_estimators, learning_rate=0.05, max_depth=max_depth,
+                             tree_method="hist", random_state=24)
+    model.fit(X, feats["Total_of_Directions"])
+    return pre, model
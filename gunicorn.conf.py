@@ -0,0 +1,29 @@
+"""
+Multi-worker serving:
+
+    gunicorn -c gunicorn.conf.py src.api:app
+
+The master loads the model and fills the shared buffer file once, then forks
+the workers (preload_app): they share the model's memory copy-on-write and map
+the same buffers, and one of them (elected by file lock) runs ingestion.
+Worker count: WEB_CONCURRENCY (default: one per CPU).
+"""
+
+import os
+
+os.environ.setdefault("PEDS_SHARED_BUFFERS", "/dev/shm/peds_buffers.bin")
+os.environ.setdefault("PEDS_INGEST_LOCK", "/dev/shm/peds_ingest.lock")
+# Parallelism comes from the workers; one prediction thread each avoids oversubscribing cores
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 60
+
+
+def on_starting(server):
+    from src.api import prepare_shared
+    prepare_shared()
+    server.log.info("Model and shared buffers (%s) ready", os.environ["PEDS_SHARED_BUFFERS"])
@@ -1,98 +1,269 @@
 # api.py
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import Depends, FastAPI, Header, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+import numpy as np
 import pandas as pd
-from src.inference import init_buffers, BUFFERS, predict_current_hour_with_live_lags
-from collections import deque
-import requests
-from datetime import datetime
+from src import inference
+from src.inference import (init_buffers, buffer_lags, MAX_HORIZON,
+                           predict_batch, predict_items, predict_recursive)
+from src.coalesce import MicroBatcher, SingleFlight
+from src import hourly, metrics, registry, stream
+from src.metrics import timed
+from src.buffers import SharedLagRing, hour_index
+from src.upstream import (CITY_API_URL, LAG_CACHE, RETRYABLE_STATUS, UpstreamClient, open_client, close_client,
+                          current_client)
+from src.ingest import CHECKPOINT_PATH, run_elected_ingestion, run_ingestion
 import asyncio
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
 
 AEST = timezone(timedelta(hours=10))
 
-# Prepare initial buffers from a snapshot (first app start)
-_hist = pd.read_parquet("data/interim/pedestrian_recent.parquet")
-init_buffers(_hist)
+# Background polling of the upstream API into BUFFERS (set PEDS_INGEST=0 to disable)
+INGEST_ENABLED = os.environ.get("PEDS_INGEST", "1") != "0"
 
-app = FastAPI()
+# Multi-worker serving (gunicorn.conf.py): buffers live in this memory-mapped file,
+# and the ingesting worker is elected with a lock on INGEST_LOCK_PATH
+SHARED_BUFFERS_PATH = os.environ.get("PEDS_SHARED_BUFFERS")
+INGEST_LOCK_PATH = os.environ.get("PEDS_INGEST_LOCK", "data/interim/ingest.lock")
 
-# Ensure this is your current v2.1 records endpoint
-CITY_API_URL = (
-    "https://melbournetestbed.opendatasoft.com/"
-    "api/explore/v2.1/catalog/"
-    "datasets/pedestrian-counting-system-monthly-counts-per-hour/records"
-)
+SNAPSHOT_PATH = "data/interim/pedestrian_recent"  # columnar snapshot (src.load.make_recent_snapshot)
+PARQUET_SNAPSHOT_PATH = "data/interim/pedestrian_recent.parquet"  # older snapshot format
 
-async def fetch_live_lags_from_external_api(sensor: str, current_ts: datetime) -> dict:
-    def _get_lag(hours_back: int) -> float:
-        target = current_ts - timedelta(hours=hours_back)
+# Model hot-swapping: the registry manifest is checked this often for a new current
+# version; admin endpoints require this token in X-Admin-Token and are disabled without it
+MODEL_WATCH_INTERVAL = float(os.environ.get("PEDS_MODEL_WATCH_INTERVAL", "30"))
+ADMIN_TOKEN = os.environ.get("PEDS_ADMIN_TOKEN")
+MODEL_VERSION_HEADER = "X-Model-Version"
 
-        api_params = {
-            "refine.sensing_date": target.strftime("%Y-%m-%d"),
-            "refine.hourday": str(target.hour),
-            "refine.sensor_name": sensor,
-            "limit": 1,
-        }
+# /predictions/stream: sensors scored (and written) per step when this hour's table
+# is not out yet, and the idle time after which a keep-alive is written
+STREAM_CHUNK = 16
+STREAM_KEEP_ALIVE = 15.0
 
-        try:
-            # Using CITY_API_URL which already includes the dataset
-            resp = requests.get(CITY_API_URL, params=api_params, timeout=10)
-            resp.raise_for_status()
-        except requests.HTTPError as e: # Catch HTTPError for more specific details
-            error_detail = f"External API error: Status {e.response.status_code} - {e.response.text}"
-            # Attempt to parse JSON error from response if possible
-            try:
-                error_content = e.response.json()
-                error_detail = f"External API error: {error_content}"
-            except ValueError: # response is not JSON
-                pass # use the text version
-            raise HTTPException(
-                status_code=e.response.status_code if e.response is not None else 500,
-                detail=error_detail
-            )
-        except requests.RequestException as e:
-            raise HTTPException(
-                status_code=503, # Service Unavailable
-                detail=f"Failed to connect to external API: {e}"
-            )
+# Most upstream lookups a single /forecast call may make to fill buffer gaps
+MAX_FORECAST_BACKFILL = 400
+
+# Days searched back for a same-hour count when the upstream cannot provide a lag
+FALLBACK_HOURS = 24 * 14  # the buffers hold two weeks
+
+
+def load_buffers():
+    """
+    Prepare initial buffers: resume from the last ingestion checkpoint,
+    otherwise start from the snapshot (first app start). The columnar snapshot
+    is memory-mapped and copied into the ring as one block; a parquet snapshot
+    from before that format goes through init_buffers.
+    """
+    if CHECKPOINT_PATH.exists():
+        inference.BUFFERS.load(CHECKPOINT_PATH)
+    elif os.path.isdir(SNAPSHOT_PATH):
+        inference.BUFFERS.load_snapshot(SNAPSHOT_PATH)
+    else:
+        _hist = pd.read_parquet(PARQUET_SNAPSHOT_PATH)
+        init_buffers(_hist)
+
+
+def load_serving_model():
+    """Serve the registry's current version, or the local artifacts when there is none."""
+    version = registry.current_version()
+    if version is None:
+        inference.load_model()
+    else:
+        inference.install(registry.load(version))
+
+
+def prepare_shared(path: str = SHARED_BUFFERS_PATH):
+    """
+    Multi-worker serving, run once in the master process before workers fork:
+    load the model (workers share its pages copy-on-write) and fill the shared
+    ring file that every worker maps.
+    """
+    load_serving_model()
+    inference.BUFFERS = SharedLagRing(path, create=True)
+    load_buffers()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load model and buffers before serving (unless the gunicorn master already
+    # did), then pay one-off costs with a warm-up prediction
+    t0 = time.perf_counter()
+    if inference.ACTIVE is None:
+        await asyncio.to_thread(load_serving_model)
+    shared = isinstance(inference.BUFFERS, SharedLagRing)
+    if not shared:
+        await asyncio.to_thread(load_buffers)
+    warm = await asyncio.to_thread(inference.warm_up)
+    log.info("Startup: model %.2fs, buffers + warm-up %.2fs (warm-up %.3fs)",
+             inference.MODEL_LOAD_SECONDS, time.perf_counter() - t0 - inference.MODEL_LOAD_SECONDS, warm)
+
+    # One pooled, keep-alive client shared by every request
+    client = open_client()
+    ingestion = None
+    if INGEST_ENABLED:
+        ingest = (run_elected_ingestion(client, inference.BUFFERS, INGEST_LOCK_PATH) if shared
+                  else run_ingestion(client, inference.BUFFERS))
+        ingestion = asyncio.create_task(ingest)
+    # Current-hour predictions for all sensors, rebuilt after each hour boundary
+    scheduler = asyncio.create_task(hourly.run_hourly())
+    # New model versions published to the registry are swapped in without a restart
+    watcher = asyncio.create_task(run_model_watcher())
+    yield
+    tasks = [t for t in (ingestion, scheduler, watcher) if t is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_client()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Model swaps, and the manifest changes that go with them, run one at a time
+MODEL_SWAP_LOCK = asyncio.Lock()
 
+
+async def _swap_model(version: str) -> inference.LoadedModel:
+    """
+    Load `version` from the registry and warm it with a batch prediction in a
+    worker thread, then swap it in. Requests that already took the old model
+    finish with it; the hourly table is rebuilt with the new one. The caller
+    holds MODEL_SWAP_LOCK.
+    """
+    t0 = time.perf_counter()
+    loaded = await asyncio.to_thread(registry.load, version)
+    await asyncio.to_thread(inference.warm_up, loaded)
+    previous = inference.install(loaded)
+    log.info("Model %s -> %s (load + warm-up %.2fs)",
+             previous.version if previous else None, version, time.perf_counter() - t0)
+    try:
+        table = await asyncio.to_thread(hourly.build_table, hourly.current_hour(), None, loaded)
+        hourly.publish(table)
+    except Exception:
+        log.exception("Rebuilding the hourly table for model %s failed", version)
+        hourly.publish(None)  # never serve the old model's table under the new version
+    return loaded
+
+
+async def activate_model(version: str) -> inference.LoadedModel:
+    """_swap_model under MODEL_SWAP_LOCK."""
+    async with MODEL_SWAP_LOCK:
+        return await _swap_model(version)
+
+
+async def run_model_watcher(interval: float = MODEL_WATCH_INTERVAL):
+    """Background task: swap in the registry's current version whenever it changes."""
+    while True:
         try:
-            body = resp.json()
-            results = body.get("results", []) # v2.1 uses "results"
-            if not results:
-                # It's possible the API returns 200 OK with empty results if no data matches
-                raise HTTPException(
-                    status_code=404, # Not Found, as no data matches the query
-                    detail=f"No data returned from external API for {hours_back}h lag. Sensor: {sensor}, Target time: {target.isoformat()}"
-                )
-            return float(results[0]["pedestriancount"])
-        except (ValueError, KeyError, IndexError) as e: # Added IndexError
-            raise HTTPException(
-                status_code=502, # Bad Gateway
-                detail=f"Unexpected response format from external API: {e}. Response: {resp.text[:200]}" # Log part of response
-            )
-
-    lag_24h = await asyncio.to_thread(_get_lag, 24)
-    lag_168h = await asyncio.to_thread(_get_lag, 168)
-    
-    return {
-        "lag_24h": lag_24h,
-        "lag_168h": lag_168h,
-    }
+            version = await asyncio.to_thread(registry.current_version)
+            if version is not None and version != inference.active().version:
+                async with MODEL_SWAP_LOCK:
+                    # read again: an admin swap may have changed the manifest while we waited
+                    version = await asyncio.to_thread(registry.current_version)
+                    if version is not None and version != inference.active().version:
+                        await _swap_model(version)
+        except Exception:
+            log.exception("Checking the model registry failed")
+        await asyncio.sleep(interval)
 
-# Route: /predict?sensor=...&hours=24
-@app.get("/predict")
-async def forecast_current_hour(sensor: str = Query(..., examples=["Your_Sensor_Name"])):
+
+async def fetch_live_lags_from_external_api(sensor: str, current_ts: datetime,
+                                            client: UpstreamClient | None = None,
+                                            lags: tuple[int, ...] = (24, 168)) -> dict:
     """
-    Predicts the pedestrian count for the specified sensor for the current hour
-    using live 24-hour and 168-hour lag data fetched from an external API.
+    Fetches the requested lags (default 24h and 168h) for `sensor` concurrently
+    through the shared upstream client. Outside the app lifespan a short-lived
+    client is used.
     """
-    current_ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    client = client or current_client()
+    if client is None:
+        async with UpstreamClient(cache=LAG_CACHE) as client:
+            return await fetch_live_lags_from_external_api(sensor, current_ts, client, lags)
+
+    values = await asyncio.gather(*(client.get_lag(sensor, current_ts, lag) for lag in lags))
 
+    return {f"lag_{lag}h": value for lag, value in zip(lags, values)}
+
+
+async def get_live_lags(sensor: str, current_ts: datetime) -> dict:
+    """
+    Resolves lag_24h and lag_168h from the in-memory buffers, going to the
+    external API only for the lags the buffers do not cover.
+    """
+    with timed("buffer_lags"):
+        live_lags = buffer_lags(sensor, current_ts)
+    missing = tuple(lag for lag in (24, 168) if f"lag_{lag}h" not in live_lags)
+    if missing:
+        with timed("upstream_fetch"):
+            fetched = await fetch_live_lags_from_external_api(sensor, current_ts, lags=missing)
+        live_lags = {**fetched, **live_lags}
+    return live_lags
+
+
+def fallback_lags(sensor: str, current_ts: datetime, lags: tuple[int, ...] = (24, 168)) -> dict:
+    """
+    Seasonal-naive stand-ins for lags: the count one or more lag periods
+    before each lag hour (lag_24h: the same hour on an earlier day, lag_168h:
+    the same hour of the week on an earlier week), from the buffers or from
+    earlier upstream lookups. A lag without one takes the other lag's value.
+    """
+    hour = hour_index(current_ts)
+    found = {}
+    for lag in lags:
+        for back in range(2 * lag, FALLBACK_HOURS + 1, lag):
+            value = inference.BUFFERS.get(sensor, hour - back)
+            if value is None:
+                value = LAG_CACHE.peek(sensor, current_ts - timedelta(hours=back))
+            if value is not None:
+                found[f"lag_{lag}h"] = value
+                break
+    if found:
+        stand_in = next(iter(found.values()))
+        found = {f"lag_{lag}h": found.get(f"lag_{lag}h", stand_in) for lag in lags}
+    return found
+
+
+async def resolve_lags(sensor: str, current_ts: datetime) -> tuple[dict, bool]:
+    """
+    (lags, degraded): get_live_lags, or, when the upstream is failing or its
+    circuit breaker is open, buffered lags completed with fallback_lags
+    (degraded=True). Failing means what the breaker counts as a failure
+    (RETRYABLE_STATUS, e.g. 429 rate limiting) or any 5xx; other errors (e.g.
+    no data) and sensors without any recent counts still raise.
+    """
+    try:
+        return await get_live_lags(sensor, current_ts), False
+    except HTTPException as e:
+        if e.status_code not in RETRYABLE_STATUS and e.status_code < 500:
+            raise
+        lags = {**fallback_lags(sensor, current_ts), **buffer_lags(sensor, current_ts)}
+        if "lag_24h" not in lags or "lag_168h" not in lags:
+            raise
+        return lags, True
+
+
+# Concurrent /predict calls for the same sensor and hour share one computation, and
+# the distinct sensors arriving within a few ms are scored in one model call
+PREDICT_FLIGHT = SingleFlight()
+PREDICT_BATCHER = MicroBatcher(predict_items)
+
+
+async def predict_sensor_hour(sensor: str, current_ts: datetime,
+                              model: inference.LoadedModel | None = None) -> tuple[float, bool]:
+    """
+    (prediction, degraded) for one sensor-hour with `model` (default: the
+    active one); errors are raised as HTTPException. degraded is True when the
+    lags are fallback estimates (see resolve_lags).
+    """
     # Fetch live lag data
     try:
-        # USER ACTION: Replace with your actual call to the implemented live lag fetching function
-        live_lags = await fetch_live_lags_from_external_api(sensor, current_ts)
+        live_lags, degraded = await resolve_lags(sensor, current_ts)
         live_lag_24h = live_lags["lag_24h"]
         live_lag_168h = live_lags["lag_168h"]
     except HTTPException as e:
@@ -100,21 +271,408 @@ async def forecast_current_hour(sensor: str = Query(..., examples=["Your_Sensor_
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Error fetching live lag data: {str(e)}")
 
-
-    # Run prediction for the current hour
+    # Run prediction for the current hour, batched with other sensors' requests
     try:
-        prediction_count = predict_current_hour_with_live_lags(
-            sensor=sensor,
-            ts=current_ts,
-            live_lag_24h=live_lag_24h,
-            live_lag_168h=live_lag_168h
-        )
+        with timed("batched_predict"):  # batch window + encode + model call
+            prediction = await PREDICT_BATCHER.submit((sensor, current_ts, live_lag_24h, live_lag_168h, model))
+        return prediction, degraded
     except Exception as e:
         # Catch errors from the prediction function itself (e.g., model expecting a feature not provided)
         raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
 
+
+# Route: /predict?sensor=...&hours=24
+@app.get("/predict")
+@timed("predict_request")
+async def forecast_current_hour(response: Response, sensor: str = Query(..., examples=["Your_Sensor_Name"])):
+    """
+    Predicts the pedestrian count for the specified sensor for the current hour.
+    Served from the precomputed hourly table when it has the sensor; otherwise
+    predicted on demand from live 24-hour and 168-hour lag data, read from the
+    in-memory buffers or fetched from an external API when the buffers have a gap.
+    While the external API is failing, lags fall back to same-hour counts from
+    earlier days and the response says "degraded": true. The X-Model-Version
+    header names the model version that made the prediction.
+    """
+    current_ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    table = hourly.current(current_ts)
+    prediction_count = table.predictions.get(sensor) if table is not None else None
+    degraded = False
+    if prediction_count is None:
+        model = inference.active()  # this request stays on this version, even across a swap
+        prediction_count, degraded = await PREDICT_FLIGHT.do(
+            (sensor, current_ts, model.version), lambda: predict_sensor_hour(sensor, current_ts, model))
+        version = model.version
+    else:
+        version = table.model_version
+    response.headers[MODEL_VERSION_HEADER] = str(version)
+
     return {
         "sensor_name": sensor,
         "timestamp": current_ts.isoformat(),
-        "predicted_count": int(round(prediction_count))
-    }
\ No newline at end of file
+        "predicted_count": int(round(prediction_count)),
+        "degraded": degraded,
+    }
+
+
+# Route: /predictions/current  (the whole precomputed table for this hour)
+@app.get("/predictions/current")
+async def current_predictions(response: Response):
+    """
+    Current-hour predictions for every sensor whose lags are in the buffers,
+    as published by the hourly scheduler (built here if this hour's table is
+    not out yet). Sensors without lags are listed under "missing".
+    """
+    current_ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    table = hourly.current(current_ts)
+    if table is None:
+        try:
+            table = await asyncio.to_thread(hourly.build_table, current_ts)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
+        hourly.publish(table)
+
+    response.headers[MODEL_VERSION_HEADER] = str(table.model_version)
+    return {
+        "timestamp": table.hour.isoformat(),
+        "computed_at": table.computed_at.isoformat(),
+        "predictions": [
+            {"sensor_name": sensor, "predicted_count": int(round(count))}
+            for sensor, count in table.predictions.items()
+        ],
+        "missing": list(table.missing),
+    }
+
+
+def _prediction_records(ts: datetime, predictions, version: str | None):
+    return [("prediction", {"sensor_name": sensor, "timestamp": ts.isoformat(),
+                            "predicted_count": int(round(count)), "model_version": version})
+            for sensor, count in predictions]
+
+
+def _hour_record(table: hourly.HourTable, sensors: set[str] | None) -> tuple[str, dict]:
+    return "hour", {
+        "timestamp": table.hour.isoformat(),
+        "computed_at": table.computed_at.isoformat(),
+        "model_version": table.model_version,
+        "missing": [s for s in table.missing if sensors is None or s in sensors],
+    }
+
+
+def _table_chunks(table: hourly.HourTable, sensors: set[str] | None, fmt: str):
+    """A published table as framed chunks of STREAM_CHUNK predictions, then its "hour" record."""
+    items = [(s, c) for s, c in table.predictions.items() if sensors is None or s in sensors]
+    for i in range(0, len(items), STREAM_CHUNK):
+        yield stream.frame(fmt, _prediction_records(table.hour, items[i:i + STREAM_CHUNK], table.model_version))
+    yield stream.frame(fmt, [_hour_record(table, sensors)])
+
+
+async def _computed_chunks(ts: datetime, sensors: set[str] | None, fmt: str, built: list):
+    """
+    This hour's predictions computed STREAM_CHUNK sensors at a time, each chunk
+    written as soon as it is scored. The resulting table is appended to `built`.
+    """
+    model = inference.active()
+    ready, lags_24h, lags_168h, missing = await asyncio.to_thread(hourly.table_lags, ts)
+    if sensors is not None:
+        keep = np.array([s in sensors for s in ready], dtype=bool)
+        ready, lags_24h, lags_168h = [s for s in ready if s in sensors], lags_24h[keep], lags_168h[keep]
+    predictions = {}
+    for i in range(0, len(ready), STREAM_CHUNK):
+        chunk = ready[i:i + STREAM_CHUNK]
+        preds = await asyncio.to_thread(inference.predict_batch, chunk, ts, lags_24h[i:i + STREAM_CHUNK],
+                                        lags_168h[i:i + STREAM_CHUNK], model=model)
+        predictions.update(zip(chunk, preds))
+        yield stream.frame(fmt, _prediction_records(ts, zip(chunk, preds), model.version))
+    built.append(hourly.make_table(ts, predictions, missing, model.version))
+
+
+async def prediction_stream(sensors: set[str] | None, fmt: str, updates: int | None = None):
+    """
+    Chunks for /predictions/stream: this hour's predictions (from the published
+    table, or computed chunk by chunk), then every table published afterwards.
+    Stops after `updates` published tables (None: never).
+    """
+    # Waiting starts before the first chunk, so a table published meanwhile is not missed
+    pending = asyncio.ensure_future(hourly.next_table())
+    try:
+        ts = hourly.current_hour()
+        table = hourly.current(ts)
+        if table is not None:
+            for chunk in _table_chunks(table, sensors, fmt):
+                yield chunk
+        else:
+            built = []
+            async for chunk in _computed_chunks(ts, sensors, fmt, built):
+                yield chunk
+            table = built[0]
+            if sensors is None and hourly.current(ts) is None:
+                hourly.publish(table)  # our own table: not streamed again as an update
+            yield stream.frame(fmt, [_hour_record(table, sensors)])
+
+        sent = 0
+        while updates is None or sent < updates:
+            done, _ = await asyncio.wait({pending}, timeout=STREAM_KEEP_ALIVE)
+            if not done:
+                yield stream.KEEP_ALIVE[fmt]
+                continue
+            published, pending = pending.result(), asyncio.ensure_future(hourly.next_table())
+            if published is None or published is table:
+                continue
+            for chunk in _table_chunks(published, sensors, fmt):
+                yield chunk
+            sent += 1
+    finally:
+        pending.cancel()
+
+
+# Route: /predictions/stream?format=ndjson|sse&sensors=all  (live predictions, pushed)
+@app.get("/predictions/stream")
+async def stream_predictions(sensors: list[str] = Query(["all"], examples=[["all"]]),
+                             format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+                             updates: int | None = Query(None, ge=0)):
+    """
+    Streams current-hour predictions as NDJSON lines or Server-Sent Events:
+    one "prediction" record per sensor as soon as it is available, then an
+    "hour" record (computed_at, model_version, sensors without lags). The
+    connection stays open and every hourly refresh (or model swap) is pushed
+    the same way; `updates` closes it after that many refreshes. A keep-alive
+    is written every STREAM_KEEP_ALIVE seconds while idle.
+    """
+    wanted = None if sensors == ["all"] else set(sensors)
+    return StreamingResponse(prediction_stream(wanted, format, updates), media_type=stream.MEDIA_TYPES[format],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Route: /stats  (cache, coalescing and batching counters)
+@app.get("/stats")
+async def stats():
+    client = current_client()
+    return {
+        "lag_cache": LAG_CACHE.stats(),
+        "upstream_coalescing": {
+            "lag": client.lag_flight.stats(),
+            "hour": client.hour_flight.stats(),
+        } if client is not None else None,
+        "upstream_breaker": client.breaker.stats() if client is not None else None,
+        "predict_coalescing": PREDICT_FLIGHT.stats(),
+        "predict_batching": PREDICT_BATCHER.stats(),
+        "model_version": inference.ACTIVE.version if inference.ACTIVE is not None else None,
+    }
+
+
+# Route: /metrics  (Prometheus text format)
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Stage latency histograms and upstream request counts, plus cache,
+    coalescing, buffer staleness and model load gauges read at scrape time.
+    """
+    client = current_client()
+    cache = LAG_CACHE.stats()
+    current_hour = hour_index(datetime.now(AEST))
+    staleness = {sensor: current_hour - hour for sensor, hour in inference.BUFFERS.last_hours().items()}
+    coalescing = {"predict": PREDICT_FLIGHT.stats()}
+    if client is not None:
+        coalescing.update(upstream_lag=client.lag_flight.stats(), upstream_hour=client.hour_flight.stats())
+    table = hourly.TABLE
+
+    body = metrics.render(
+        metrics.gauge("peds_lag_cache_hit_ratio", "Share of lag lookups answered by the cache.", cache["hit_ratio"]),
+        metrics.gauge("peds_lag_cache_size", "Entries in the lag cache.", cache["size"]),
+        metrics.counter("peds_lag_cache_lookups_total", "Lag cache lookups by result.",
+                      {"hit": cache["hits"], "miss": cache["misses"]}, label="result"),
+        metrics.gauge("peds_coalescing_shared_ratio", "Share of calls that joined in-flight work.",
+                      {name: s["shared_ratio"] for name, s in coalescing.items()}, label="flight"),
+        metrics.gauge("peds_predict_mean_batch_size", "Mean MicroBatcher batch size.",
+                      PREDICT_BATCHER.stats()["mean_batch_size"]),
+        metrics.gauge("peds_upstream_breaker_open", "1 while the upstream circuit breaker is open.",
+                      int(client.breaker.state == "open") if client is not None else None),
+        metrics.gauge("peds_buffer_staleness_hours", "Hours since the newest buffered count, per sensor.",
+                      staleness, label="sensor"),
+        metrics.gauge("peds_hourly_table_sensors", "Sensors in the published hourly table.",
+                      len(table.predictions) if table is not None else None),
+        metrics.gauge("peds_model_load_seconds", "Time taken to load the model artifacts.",
+                      inference.MODEL_LOAD_SECONDS),
+        metrics.gauge("peds_model_info", "1 for the model version being served.",
+                      {inference.ACTIVE.version: 1} if inference.ACTIVE is not None else None, label="version"),
+    )
+    return Response(body, media_type=metrics.CONTENT_TYPE)
+
+
+async def backfill_history(sensors: list[str], current_ts: datetime, history, n_hours: int,
+                           client: UpstreamClient | None = None) -> np.ndarray:
+    """
+    Fills the gaps of a (sensors x 168h) history window that a forecast of
+    `n_hours` will read as lags, using the external API. Lookups that fail
+    stay NaN. Returns the number of lag values still missing per sensor
+    (an int array aligned with `sensors`).
+    """
+    needed = np.zeros(history.shape[1], dtype=bool)
+    needed[:n_hours] = True                     # lag_168h of steps 0 .. n_hours-1
+    needed[144:144 + min(n_hours, 24)] = True   # lag_24h of the first 24 steps
+    rows, cols = np.nonzero(np.isnan(history) & needed)
+    if len(rows) == 0:
+        return np.zeros(len(sensors), dtype=int)
+
+    client = client or current_client()
+    if client is None:
+        async with UpstreamClient(cache=LAG_CACHE) as client:
+            return await backfill_history(sensors, current_ts, history, n_hours, client)
+
+    async def _one(row, col):
+        try:
+            return await client.get_lag(sensors[row], current_ts, 168 - int(col))
+        except HTTPException:
+            return np.nan
+
+    rows, cols = rows[:MAX_FORECAST_BACKFILL], cols[:MAX_FORECAST_BACKFILL]
+    history[rows, cols] = await asyncio.gather(*(_one(r, c) for r, c in zip(rows, cols)))
+    return np.count_nonzero(np.isnan(history) & needed, axis=1)
+
+
+# Route: /predict/batch?sensors=A&sensors=B  (or sensors=all)
+@app.get("/predict/batch")
+async def forecast_current_hour_batch(response: Response,
+                                     sensors: list[str] = Query(["all"], examples=[["all"]])):
+    """
+    Predicts the current-hour pedestrian count for several sensors at once.
+    Lags are resolved per sensor; every sensor whose lags were found is scored
+    in a single model call. Sensors that failed are reported under "errors",
+    and predictions from fallback lags are marked "degraded".
+    """
+    current_ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    model = inference.active()
+
+    if sensors == ["all"]:
+        sensors = sorted(inference.BUFFERS)
+    sensors = list(dict.fromkeys(sensors))  # drop repeats, keep order
+
+    # Resolve lag data for every sensor; failures are collected, not raised
+    fetched = await asyncio.gather(
+        *(resolve_lags(sensor, current_ts) for sensor in sensors),
+        return_exceptions=True,
+    )
+
+    ok_sensors, lags_24h, lags_168h, degraded = [], [], [], []
+    errors = []
+    for sensor, result in zip(sensors, fetched):
+        if isinstance(result, HTTPException):
+            errors.append({"sensor_name": sensor, "status_code": result.status_code, "detail": result.detail})
+        elif isinstance(result, Exception):
+            errors.append({"sensor_name": sensor, "status_code": 503,
+                           "detail": f"Error fetching live lag data: {str(result)}"})
+        else:
+            lags, fallback = result
+            ok_sensors.append(sensor)
+            lags_24h.append(lags["lag_24h"])
+            lags_168h.append(lags["lag_168h"])
+            degraded.append(fallback)
+
+    # Run prediction for all sensors with lag data in one call
+    try:
+        prediction_counts = predict_batch(ok_sensors, current_ts, lags_24h, lags_168h, model=model)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
+
+    response.headers[MODEL_VERSION_HEADER] = model.version
+    return {
+        "timestamp": current_ts.isoformat(),
+        "predictions": [
+            {"sensor_name": sensor, "predicted_count": int(round(count)), "degraded": fallback}
+            for sensor, count, fallback in zip(ok_sensors, prediction_counts, degraded)
+        ],
+        "errors": errors,
+    }
+
+
+# Route: /forecast?sensor=...&hours=24  (sensor may repeat, or be "all")
+@app.get("/forecast")
+async def forecast_horizon(response: Response,
+                           sensor: list[str] = Query(..., examples=[["Your_Sensor_Name"]]),
+                           hours: int = Query(24, ge=1, le=MAX_HORIZON)):
+    """
+    Forecasts the next `hours` hours (current hour first) for one or more sensors
+    with a recursive rollout: lags inside the horizon come from earlier
+    predictions, older lags from the buffers (or the external API for gaps).
+    Sensors with lags that could not be found are reported under "errors"
+    instead of being forecast from missing values.
+    """
+    current_ts = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+
+    model = inference.active()
+    sensors = sorted(inference.BUFFERS) if sensor == ["all"] else list(dict.fromkeys(sensor))
+    history = inference.BUFFERS.window(sensors, hour_index(current_ts) - 168, 168)
+    missing = await backfill_history(sensors, current_ts, history, hours)
+
+    complete = missing == 0
+    errors = [
+        {"sensor_name": name, "status_code": 503,
+         "detail": f"{int(count)} lag values needed for a {hours}h forecast are unavailable"}
+        for name, count in zip(sensors, missing) if count
+    ]
+    sensors = [name for name, ok in zip(sensors, complete) if ok]
+    try:
+        predictions = await asyncio.to_thread(predict_recursive, sensors, current_ts, hours, history[complete],
+                                              model=model)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
+
+    response.headers[MODEL_VERSION_HEADER] = model.version
+    return {
+        "timestamps": [(current_ts + timedelta(hours=k)).isoformat() for k in range(hours)],
+        "forecasts": [
+            {"sensor_name": name, "predicted_counts": np.rint(counts).astype(int).tolist()}
+            for name, counts in zip(sensors, predictions)
+        ],
+        "errors": errors,
+    }
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    # Fail closed: without a configured token the admin routes refuse every call
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (PEDS_ADMIN_TOKEN is not set)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# Route: /admin/models  (registry versions and the one this process serves)
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def list_models():
+    manifest = await asyncio.to_thread(registry.read_manifest)
+    return {"serving": inference.active().version, **manifest}
+
+
+async def _switch_model(version: str, persist) -> dict:
+    """
+    Swap this process to `version`, then record it in the manifest for the
+    other workers. The caller holds MODEL_SWAP_LOCK, so the watcher never
+    sees the swap without the manifest change.
+    """
+    previous = inference.active().version
+    try:
+        await _swap_model(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Loading model {version} failed: {e}")
+    await asyncio.to_thread(persist)
+    return {"serving": version, "previous": previous}
+
+
+# Route: POST /admin/models/{version}/activate
+@app.post("/admin/models/{version}/activate", dependencies=[Depends(require_admin)])
+async def activate_version(version: str):
+    async with MODEL_SWAP_LOCK:
+        return await _switch_model(version, lambda: registry.activate(version))
+
+
+# Route: POST /admin/models/rollback  (back to the previously current version)
+@app.post("/admin/models/rollback", dependencies=[Depends(require_admin)])
+async def rollback_version():
+    async with MODEL_SWAP_LOCK:  # reading the previous version and popping it are one step
+        version = await asyncio.to_thread(registry.previous_version)
+        if version is None:
+            raise HTTPException(status_code=409, detail="No earlier version to roll back to")
+        return await _switch_model(version, registry.rollback)
@@ -0,0 +1,237 @@
+"""
+backtest.py
+===========
+Rolling-origin backtest of the training recipe in src/train.py:
+
+    python -m src.backtest                          # last 12 monthly folds, one worker per core
+    python -m src.backtest --folds 24 --workers 4 --train-months 24
+
+Each fold trains on the rows before its cut (the last EARLY_STOP_DAYS of them
+held out for early stopping) and is scored on the following month, against the
+naive 168h baseline. Results go to <out-dir>/folds.parquet (one row per fold)
+and <out-dir>/per_sensor.parquet (fold x sensor MAE).
+
+The features are built and encoded once for the whole history, sorted by
+time, and written to a work directory as .npy files. Every fold is then a pair
+of contiguous row ranges, which workers read as slices of the memory-mapped
+arrays: no copy of the matrix per fold or per process. The encoder is fitted
+once on the whole history; it only learns category vocabularies (and, for the
+one-hot encodings, scaling), neither of which changes which tree splits are
+possible, so no target information leaks across folds.
+"""
+
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src import train
+
+OUT_DIR = Path("data/processed/backtest")
+N_FOLDS = 12
+FOLD_MONTHS = 1
+EARLY_STOP_DAYS = 14
+FOLD_ROUNDS = 1000
+
+
+def fold_cuts(last_date: pd.Timestamp, n_folds: int = N_FOLDS, months: int = FOLD_MONTHS) -> list[pd.Timestamp]:
+    """Start dates of the test periods: month starts, the last one in `last_date`'s month."""
+    last_start = pd.Timestamp(last_date).to_period("M").to_timestamp()
+    return [last_start - pd.DateOffset(months=months * k) for k in range(n_folds - 1, -1, -1)]
+
+
+def prepare(ped: pd.DataFrame, work_dir: Path, encoding: str = train.DEFAULT_ENCODING) -> dict:
+    """
+    Build, encode and save the whole history once (rows sorted by time).
+    Returns the metadata the folds need: day of every row, sensor names and
+    the encoder's feature types.
+    """
+    from scipy import sparse
+
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    ped = train.make_features(ped).sort_values(["Sensing_Date", "HourDay"], kind="stable")
+    pre = train.fit_encoder(ped, encoding)
+    X = train.transform(pre, ped)
+    if sparse.issparse(X):
+        X = X.tocsr()
+        for part in ("data", "indices", "indptr"):
+            np.save(work_dir / f"X_{part}.npy", getattr(X, part))
+        np.save(work_dir / "X_shape.npy", np.array(X.shape))
+    else:
+        np.save(work_dir / "X.npy", np.ascontiguousarray(X))
+    del X
+
+    sensors = pd.Categorical(ped["Sensor_Name"])
+    np.save(work_dir / "y.npy", ped["Total_of_Directions"].to_numpy(dtype=np.float32))
+    np.save(work_dir / "naive.npy", ped["lag_168h"].to_numpy(dtype=np.float32))
+    np.save(work_dir / "sensor.npy", sensors.codes.astype(np.int32))
+    return {
+        "days": ped["Sensing_Date"].to_numpy().astype("datetime64[D]"),
+        "sensors": list(sensors.categories),
+        "feature_types": getattr(pre, "feature_types", None),
+    }
+
+
+def load_arrays(work_dir: Path) -> dict:
+    """The arrays written by prepare(), memory-mapped (X as a CSR matrix when sparse)."""
+    from scipy import sparse
+
+    work_dir = Path(work_dir)
+    load = lambda name: np.load(work_dir / f"{name}.npy", mmap_mode="r")
+    if (work_dir / "X.npy").exists():
+        X = load("X")
+    else:
+        X = sparse.csr_matrix((load("X_data"), load("X_indices"), load("X_indptr")),
+                              shape=tuple(np.load(work_dir / "X_shape.npy")), copy=False)
+    return {"X": X, "y": load("y"), "naive": load("naive"), "sensor": load("sensor")}
+
+
+def row_slice(X, start: int, stop: int):
+    """Rows [start, stop) of a dense or CSR matrix without copying the values."""
+    from scipy import sparse
+
+    if not sparse.issparse(X):
+        return X[start:stop]
+    lo, hi = X.indptr[start], X.indptr[stop]
+    part = sparse.csr_matrix((stop - start, X.shape[1]), dtype=X.dtype)
+    # assigned, not passed to the constructor: its format check copies views of larger arrays
+    part.data, part.indices = X.data[lo:hi], X.indices[lo:hi]
+    part.indptr = (np.asarray(X.indptr[start:stop + 1]) - lo).astype(X.indices.dtype)  # one int per row
+    return part
+
+
+def fold_bounds(days: np.ndarray, cut: pd.Timestamp, months: int = FOLD_MONTHS,
+                train_months: int | None = None, early_stop_days: int = EARLY_STOP_DAYS) -> tuple[int, ...]:
+    """Row positions (train start, early-stop start, test start, test end) of the fold at `cut`."""
+    day = lambda ts: np.datetime64(pd.Timestamp(ts).date(), "D")
+    start = 0 if train_months is None else np.searchsorted(days, day(cut - pd.DateOffset(months=train_months)))
+    return (
+        int(start),
+        int(np.searchsorted(days, day(cut - pd.Timedelta(days=early_stop_days)))),
+        int(np.searchsorted(days, day(cut))),
+        int(np.searchsorted(days, day(cut + pd.DateOffset(months=months)))),
+    )
+
+
+def run_fold(work_dir: Path, fold: int, cut: pd.Timestamp, bounds: tuple[int, ...], rounds: int,
+             nthread: int, feature_types: list[str] | None, sensors: list[str]) -> tuple[dict, pd.DataFrame]:
+    """Train and score one fold; returns (fold summary, per-sensor MAE rows)."""
+    t0 = time.perf_counter()
+    a = load_arrays(work_dir)
+    train_start, es_start, test_start, test_end = bounds
+    arrays = {
+        "X_train": row_slice(a["X"], train_start, es_start), "y_train": a["y"][train_start:es_start],
+        "X_val": row_slice(a["X"], es_start, test_start), "y_val": a["y"][es_start:test_start],
+    }
+    booster = train.boost(arrays, rounds, nthread, feature_types=feature_types)
+    model = train.as_regressor(booster)
+    model.set_params(n_jobs=nthread)
+
+    y = np.asarray(a["y"][test_start:test_end], dtype=np.float64)
+    errors = np.abs(model.predict(row_slice(a["X"], test_start, test_end)) - y)
+    naive = np.asarray(a["naive"][test_start:test_end], dtype=np.float64)
+    naive_errors = np.abs(naive - y)
+    codes = np.asarray(a["sensor"][test_start:test_end])
+
+    n = np.bincount(codes, minlength=len(sensors))
+    seen = np.nonzero(n)[0]
+    per_sensor = pd.DataFrame({
+        "fold": fold,
+        "cut": cut,
+        "sensor": np.asarray(sensors, dtype=object)[seen],
+        "n": n[seen],
+        "mae": np.bincount(codes, errors, len(sensors))[seen] / n[seen],
+        "mae_naive_168h": np.bincount(codes, naive_errors, len(sensors))[seen] / n[seen],
+    })
+    summary = {
+        "fold": fold,
+        "cut": cut,
+        "n_train": es_start - train_start,
+        "n_early_stop": test_start - es_start,
+        "n_test": test_end - test_start,
+        "best_iteration": model.best_iteration,
+        "mae": float(errors.mean()),
+        "mae_naive_168h": float(naive_errors.mean()),
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    return summary, per_sensor
+
+
+def backtest(ped: pd.DataFrame, n_folds: int = N_FOLDS, months: int = FOLD_MONTHS,
+             train_months: int | None = None, workers: int | None = None, rounds: int = FOLD_ROUNDS,
+             encoding: str = train.DEFAULT_ENCODING, out_dir: Path = OUT_DIR) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run the folds across `workers` processes (one per core by default), each
+    boosting with cores // workers threads, and write the two result tables.
+    """
+    out_dir = Path(out_dir)
+    work_dir = out_dir / "_work"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    meta = prepare(ped, work_dir, encoding)
+    del ped
+
+    cuts = fold_cuts(pd.Timestamp(meta["days"][-1]), n_folds, months)
+    folds = []
+    for fold, cut in enumerate(cuts):
+        bounds = fold_bounds(meta["days"], cut, months, train_months)
+        if bounds[0] < bounds[1] < bounds[2] < bounds[3]:
+            folds.append((fold, cut, bounds))
+        else:
+            print(f"Skipping fold {fold} at {cut.date()}: not enough rows before or after the cut")
+    if not folds:
+        raise SystemExit("No fold has training, early-stopping and test rows")
+
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(folds)))
+    nthread = max(1, cores // workers)
+    print(f"{len(folds)} folds on {workers} worker(s) x {nthread} thread(s)")
+    args = [(work_dir, fold, cut, bounds, rounds, nthread, meta["feature_types"], meta["sensors"])
+            for fold, cut, bounds in folds]
+    try:
+        if workers == 1:
+            results = [run_fold(*a) for a in args]
+        else:
+            # spawn: a forked child would inherit the parent's OpenMP state
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+                results = list(pool.map(run_fold, *zip(*args)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = pd.DataFrame([s for s, _ in results])
+    per_sensor = pd.concat([p for _, p in results], ignore_index=True)
+    summary.to_parquet(out_dir / "folds.parquet", index=False)
+    per_sensor.to_parquet(out_dir / "per_sensor.parquet", index=False)
+    return summary, per_sensor
+
+
+def main(argv=None):
+    from src.load import clean_data
+
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the training recipe")
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--fold-months", type=int, default=FOLD_MONTHS, help="test period per fold")
+    parser.add_argument("--train-months", type=int, help="sliding training window (default: all history)")
+    parser.add_argument("--workers", type=int, help="processes (default: one per core, at most one per fold)")
+    parser.add_argument("--rounds", type=int, default=FOLD_ROUNDS, help="max boosting rounds per fold")
+    parser.add_argument("--encoding", choices=train.ENCODINGS, default=train.DEFAULT_ENCODING)
+    parser.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    ped, _ = clean_data()
+    summary, _ = backtest(ped, args.folds, args.fold_months, args.train_months, args.workers,
+                          args.rounds, args.encoding, args.out_dir)
+    print(summary[["fold", "cut", "n_test", "best_iteration", "mae", "mae_naive_168h", "seconds"]]
+          .to_string(index=False))
+    print(f"Done in {time.perf_counter() - t0:.1f}s; tables in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
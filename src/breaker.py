@@ -0,0 +1,89 @@
+"""
+breaker.py
+==========
+Circuit breaker for the upstream API:
+
+* CircuitBreaker.allow()          -> bool  (False while open: fail fast instead of waiting on timeouts)
+* CircuitBreaker.record(success)           (outcome of an allowed call)
+* CircuitBreaker.state / .stats()
+
+closed -> open when at least `failure_rate` of the last `window` calls failed
+(after `min_calls` calls); open -> half_open after `open_seconds`, letting
+`probes` calls through; one probe success closes it, one failure reopens it.
+"""
+
+import time
+from collections import deque
+
+FAILURE_RATE = 0.5
+WINDOW = 20
+MIN_CALLS = 5
+OPEN_SECONDS = 30.0
+PROBES = 1
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate: float = FAILURE_RATE, window: int = WINDOW,
+                 min_calls: int = MIN_CALLS, open_seconds: float = OPEN_SECONDS,
+                 probes: int = PROBES, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self._clock = clock
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True = failure
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = 0
+        self.opened = 0    # times the breaker tripped
+        self.rejected = 0  # calls refused while open
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state, self._probing = HALF_OPEN, 0
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probing < self.probes:
+            self._probing += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, success: bool | None):
+        """Outcome of a call allow() let through; None (e.g. cancelled) only frees a probe slot."""
+        if self._state == HALF_OPEN:
+            self._probing = max(self._probing - 1, 0)
+            if success:
+                self._state = CLOSED
+                self._outcomes.clear()
+            elif success is not None:
+                self._trip()
+            return
+        if success is None or self._state == OPEN:
+            return
+        self._outcomes.append(not success)
+        if (len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+            self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "recent_failure_rate": sum(self._outcomes) / calls if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,375 @@
+"""
+buffers.py
+==========
+Fixed-size, hour-indexed ring of recent counts for every sensor.
+
+* LagRing                  -> sensors x hours float32 ring (save()/load() checkpoints)
+* SharedLagRing(path)      -> the same ring in a memory-mapped file shared by processes
+* ring.window(sensors, start_hour, n_hours) -> np.ndarray (NaN where missing)
+* ring.last_hours()        -> dict  (newest hour with a count, per sensor)
+* ring.load_snapshot(path) / write_snapshot(df, path) / read_snapshot(path)
+                           -> columnar snapshot of the latest hours, memory-mapped on load
+* hour_index(ts)           -> int   (hours since the Unix epoch)
+* frame_hours(df)          -> np.ndarray of hour indexes for a counts frame
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.features import AEST
+
+RING_HOURS = 336  # two weeks: lag_168h stays covered while newer hours arrive
+SHARED_MAX_SENSORS = 1024  # rows reserved in a SharedLagRing file
+
+# Snapshot directory: counts-<generation>.npy (int32 sensors x hours, MISSING_COUNT where
+# there is no count) and meta.json (sensor names in row order, hour of the first column,
+# and the counts file they describe)
+SNAPSHOT_HOURS = 168
+SNAPSHOT_COUNTS = "counts-{generation}.npy"
+SNAPSHOT_META = "meta.json"
+MISSING_COUNT = -1
+
+
+def hour_index(ts) -> int:
+    """Absolute hour of `ts` (naive timestamps are taken as AEST)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=AEST)
+    return int(ts.timestamp()) // 3600
+
+
+def hour_to_ts(hour: int) -> datetime:
+    return datetime.fromtimestamp(hour * 3600, tz=AEST)
+
+
+def frame_hours(df: pd.DataFrame, date_col: str = "Sensing_Date",
+                hour_col: str = "HourDay") -> np.ndarray:
+    """
+    Hour indexes for each row of a counts frame. Uses `date_col + hour_col`
+    when the hour column exists, otherwise `date_col` is taken as the hour.
+    """
+    dts = pd.to_datetime(df[date_col])
+    if hour_col in df.columns:
+        dts = dts + pd.to_timedelta(df[hour_col], unit="h")
+    if dts.dt.tz is None:
+        dts = dts.dt.tz_localize(AEST)
+    utc = dts.dt.tz_convert("UTC").dt.tz_localize(None)
+    return utc.to_numpy().astype("datetime64[h]").astype(np.int64)
+
+
+class LagRing:
+    """
+    Ring of the last `capacity` hours of counts per sensor.
+
+    Column `hour % capacity` holds hour `hour` when `slot_hours[hour % capacity]
+    == hour`; all sensors share one time axis. Missing hours are NaN, so gaps
+    are never mistaken for data.
+    """
+
+    def __init__(self, capacity: int = RING_HOURS):
+        self.capacity = capacity
+        self.index: dict[str, int] = {}
+        self.values = np.full((0, capacity), np.nan, dtype=np.float32)
+        self.slot_hours = np.full(capacity, -1, dtype=np.int64)
+        self.latest = -1  # newest hour held in the ring
+
+    def __contains__(self, sensor):
+        return sensor in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def clear(self):
+        self.index = {}
+        self.values = np.full((0, self.capacity), np.nan, dtype=np.float32)
+        self.slot_hours[:] = -1
+        self.latest = -1
+
+    def _rows(self, sensors) -> np.ndarray:
+        names, inverse = np.unique(np.asarray(sensors, dtype=object), return_inverse=True)
+        new = [s for s in names if s not in self.index]
+        if new:
+            # Readers in worker threads (hourly tables) use the index, then values: grow the rows
+            # first, then publish a new dict so that an iteration over the old one is unaffected
+            grow = np.full((len(new), self.capacity), np.nan, dtype=np.float32)
+            self.values = np.vstack([self.values, grow])
+            n = len(self.index)
+            self.index = {**self.index, **{s: n + i for i, s in enumerate(new)}}
+        return np.array([self.index[s] for s in names], dtype=np.int64)[inverse]
+
+    def _advance(self, newest: int):
+        """Move the window forward so that it ends at hour `newest`."""
+        if newest <= self.latest:
+            return
+        start = max(self.latest + 1, newest - self.capacity + 1)
+        hours = np.arange(start, newest + 1)
+        slots = hours % self.capacity
+        self.slot_hours[slots] = hours
+        self.values[:, slots] = np.nan
+        self.latest = newest
+
+    def write(self, sensors, hours, counts):
+        """Store counts for (sensor, hour) pairs; hours older than the window are dropped."""
+        hours = np.asarray(hours, dtype=np.int64)
+        if hours.size == 0:
+            return
+        rows = self._rows(sensors)
+        self._advance(int(hours.max()))
+        keep = hours > self.latest - self.capacity
+        slots = hours[keep] % self.capacity
+        self.values[rows[keep], slots] = np.asarray(counts, dtype=np.float32)[keep]
+
+    def get(self, sensor: str, hour: int) -> float | None:
+        """Count for `sensor` at absolute `hour`, or None when the ring has no data."""
+        row = self.index.get(sensor)
+        if row is None or not (self.latest - self.capacity < hour <= self.latest):
+            return None
+        slot = hour % self.capacity
+        value = self.values[row, slot]
+        if self.slot_hours[slot] != hour or np.isnan(value):
+            return None
+        return float(value)
+
+    def last_hours(self) -> dict[str, int]:
+        """Newest hour holding a count, per sensor (sensors with no counts are left out)."""
+        values, slot_hours = self.values, self.slot_hours
+        in_window = (slot_hours > self.latest - self.capacity) & (slot_hours <= self.latest)
+        newest = np.where(np.isnan(values) | ~in_window, -1, slot_hours).max(axis=1, initial=-1)
+        return {s: int(h) for s, h in zip(self.index, newest) if h >= 0}
+
+    def window(self, sensors, start_hour: int, n_hours: int) -> np.ndarray:
+        """
+        Counts for hours [start_hour, start_hour + n_hours) as a (len(sensors), n_hours)
+        float array; unknown sensors, gaps and hours outside the ring are NaN.
+        """
+        out = np.full((len(sensors), n_hours), np.nan)
+        hours = np.arange(start_hour, start_hour + n_hours)
+        slots = hours % self.capacity
+        valid = ((hours > self.latest - self.capacity) & (hours <= self.latest)
+                 & (self.slot_hours[slots] == hours))
+        rows = np.array([self.index.get(s, -1) for s in sensors], dtype=np.int64)
+        known = rows >= 0
+        if known.any() and valid.any():
+            out[np.ix_(known, valid)] = self.values[np.ix_(rows[known], slots[valid])]
+        return out
+
+    def write_block(self, sensors, start_hour: int, counts):
+        """
+        Store a (len(sensors), n_hours) block of counts for hours start_hour
+        onwards (NaN: no count); hours older than the window are dropped.
+        """
+        counts = np.asarray(counts, dtype=np.float32)
+        if len(sensors) == 0 or counts.shape[1] == 0:
+            return
+        rows = self._rows(sensors)
+        self._advance(start_hour + counts.shape[1] - 1)
+        first = max(start_hour, self.latest - self.capacity + 1)
+        hours = np.arange(first, start_hour + counts.shape[1])
+        self.values[np.ix_(rows, hours % self.capacity)] = counts[:, first - start_hour:]
+
+    def load_snapshot(self, path: Path):
+        """Replace the ring contents with a snapshot written by write_snapshot()."""
+        sensors, base_hour, counts = read_snapshot(path)
+        block = counts.astype(np.float32)  # the one read of the mapped file
+        block[counts == MISSING_COUNT] = np.nan
+        self.clear()
+        self.write_block(sensors, base_hour, block)
+
+    def save(self, path: Path):
+        """Checkpoint the ring to an .npz file (written atomically)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                values=self.values,
+                slot_hours=self.slot_hours,
+                latest=np.int64(self.latest),
+                sensors=np.array(list(self.index), dtype=str),
+            )
+        os.replace(tmp, path)
+
+    def load(self, path: Path):
+        """Replace the ring contents with a checkpoint written by save()."""
+        with np.load(path) as ckpt:
+            values = ckpt["values"]
+            if values.shape[1] != self.capacity:
+                raise ValueError(f"Checkpoint holds {values.shape[1]} hours, ring holds {self.capacity}")
+            self.index = {str(s): i for i, s in enumerate(ckpt["sensors"])}
+            self.values = values.astype(np.float32)
+            self.slot_hours = ckpt["slot_hours"].astype(np.int64)
+            self.latest = int(ckpt["latest"])
+
+
+class SharedLagRing(LagRing):
+    """
+    LagRing kept in one memory-mapped file (use /dev/shm), so every server
+    process reads the same counts without a copy of its own.
+
+    File layout: int64 header (version, capacity, max_sensors, n_sensors,
+    latest), int64 slot_hours[capacity], sensor names as fixed-width UTF-8,
+    then float32 values[max_sensors, capacity].
+
+    Exactly one process writes (the elected ingester); readers pick up new
+    sensors from the header's n_sensors. A reader can see an hour while it is
+    being stored, which shows as a gap (NaN), never as another hour's count.
+    """
+
+    VERSION = 1
+    NAME_BYTES = 128
+    _N_SENSORS, _LATEST = 3, 4
+
+    def __init__(self, path: Path, capacity: int = RING_HOURS,
+                 max_sensors: int = SHARED_MAX_SENSORS, create: bool = False):
+        self.path = Path(path)
+        if create:
+            # build under a temporary name so attaching processes never see a partial file
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.truncate(self._layout(capacity, max_sensors)[-1])
+            self._map(tmp, capacity, max_sensors)
+            self._header[:] = (self.VERSION, capacity, max_sensors, 0, -1)
+            self.slot_hours[:] = -1
+            self._values[:] = np.nan
+            os.replace(tmp, self.path)
+        else:
+            version, capacity, max_sensors = np.fromfile(self.path, dtype=np.int64, count=3)
+            if version != self.VERSION:
+                raise ValueError(f"{self.path}: unsupported shared ring version {version}")
+            self._map(self.path, int(capacity), int(max_sensors))
+        self._index: dict[str, int] = {}
+
+    @classmethod
+    def _layout(cls, capacity: int, max_sensors: int) -> tuple[int, int, int, int]:
+        """Byte offsets of slot_hours, names and values, and the file size."""
+        slots = 5 * 8
+        names = slots + 8 * capacity
+        values = -(-(names + cls.NAME_BYTES * max_sensors) // 64) * 64  # 64-byte aligned
+        return slots, names, values, values + 4 * capacity * max_sensors
+
+    def _map(self, path: Path, capacity: int, max_sensors: int):
+        slots, names, values, _ = self._layout(capacity, max_sensors)
+        self.capacity, self.max_sensors = capacity, max_sensors
+        self._header = np.memmap(path, dtype=np.int64, mode="r+", shape=(5,))
+        self.slot_hours = np.memmap(path, dtype=np.int64, mode="r+", offset=slots, shape=(capacity,))
+        self._names = np.memmap(path, dtype=f"S{self.NAME_BYTES}", mode="r+", offset=names, shape=(max_sensors,))
+        self._values = np.memmap(path, dtype=np.float32, mode="r+", offset=values, shape=(max_sensors, capacity))
+
+    @property
+    def index(self) -> dict[str, int]:
+        n = int(self._header[self._N_SENSORS])
+        if n > len(self._index):  # sensors added by the writer since the last look; a new dict, as in LagRing
+            added = {self._names[i].decode(): i for i in range(len(self._index), n)}
+            self._index = {**self._index, **added}
+        return self._index
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:int(self._header[self._N_SENSORS])]
+
+    @property
+    def latest(self) -> int:
+        return int(self._header[self._LATEST])
+
+    @latest.setter
+    def latest(self, hour: int):
+        self._header[self._LATEST] = hour
+
+    def clear(self):
+        self._header[self._N_SENSORS] = 0
+        self._index = {}
+        self._values[:] = np.nan
+        self.slot_hours[:] = -1
+        self.latest = -1
+
+    def _rows(self, sensors) -> np.ndarray:
+        names, inverse = np.unique(np.asarray(sensors, dtype=object), return_inverse=True)
+        index = self.index
+        new = [s for s in names if s not in index]
+        if new:
+            n = len(index)
+            if n + len(new) > self.max_sensors:
+                raise ValueError(f"Shared ring holds at most {self.max_sensors} sensors")
+            encoded = [s.encode() for s in new]
+            if max(map(len, encoded)) > self.NAME_BYTES:
+                raise ValueError(f"Sensor name longer than {self.NAME_BYTES} bytes")
+            self._names[n:n + len(new)] = encoded
+            self._header[self._N_SENSORS] = n + len(new)  # publish after the names are in place
+            index = self.index
+        return np.array([index[s] for s in names], dtype=np.int64)[inverse]
+
+    def load(self, path: Path):
+        """Replace the ring contents with a checkpoint written by save()."""
+        with np.load(path) as ckpt:
+            values = ckpt["values"]
+            if values.shape[1] != self.capacity:
+                raise ValueError(f"Checkpoint holds {values.shape[1]} hours, ring holds {self.capacity}")
+            self.clear()
+            self._rows([str(s) for s in ckpt["sensors"]])
+            order = np.array([self.index[str(s)] for s in ckpt["sensors"]], dtype=np.int64)
+            self._values[order] = values
+            self.slot_hours[:] = ckpt["slot_hours"]
+            self.latest = int(ckpt["latest"])
+
+
+def write_snapshot(df: pd.DataFrame, path: Path, hours: int = SNAPSHOT_HOURS) -> tuple[int, int]:
+    """
+    Write the last `hours` hours of a counts frame (Sensor_Name, Sensing_Date
+    [+ HourDay], Total_of_Directions) as a snapshot directory; all sensors
+    share the time axis ending at the newest hour in the frame. The counts go
+    to a new file and meta.json, which names it, is replaced atomically last,
+    so readers see the old or the new snapshot and never a mix. Returns
+    (sensors, hours) of the counts array.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(path / SNAPSHOT_META) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+    frame_hour = frame_hours(df)
+    base_hour = int(frame_hour.max()) - hours + 1 if len(df) else 0
+    keep = (frame_hour >= base_hour) & df["Total_of_Directions"].notna().to_numpy()
+    codes, sensors = pd.factorize(np.asarray(df["Sensor_Name"], dtype=object)[keep], sort=True)
+    counts = np.full((len(sensors), hours), MISSING_COUNT, dtype=np.int32)
+    counts[codes, frame_hour[keep] - base_hour] = df["Total_of_Directions"].to_numpy()[keep]
+
+    generation = previous.get("generation", 0) + 1
+    counts_file = SNAPSHOT_COUNTS.format(generation=generation)
+    with open(path / counts_file, "wb") as f:
+        np.save(f, counts)
+    meta = {"sensors": [str(s) for s in sensors], "base_hour": base_hour,
+            "base_timestamp": hour_to_ts(base_hour).isoformat(), "hours": hours,
+            "generation": generation, "counts": counts_file}
+    tmp = path / (SNAPSHOT_META + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path / SNAPSHOT_META)
+
+    # Keep the previous counts for readers that read the old meta.json just before the swap
+    keep = {counts_file, previous.get("counts")}
+    for stale in path.glob(SNAPSHOT_COUNTS.format(generation="*")):
+        if stale.name not in keep:
+            stale.unlink(missing_ok=True)
+    return counts.shape
+
+
+def read_snapshot(path: Path) -> tuple[list[str], int, np.ndarray]:
+    """(sensor names, hour of column 0, counts) with the counts memory-mapped read-only."""
+    path = Path(path)
+    with open(path / SNAPSHOT_META) as f:
+        meta = json.load(f)
+    counts = np.load(path / meta["counts"], mmap_mode="r")
+    if counts.shape != (len(meta["sensors"]), meta["hours"]):
+        raise ValueError(f"{path}: counts {counts.shape} do not match {len(meta['sensors'])} sensors "
+                         f"x {meta['hours']} hours")
+    return meta["sensors"], int(meta["base_hour"]), counts
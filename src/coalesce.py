@@ -0,0 +1,123 @@
+"""
+coalesce.py
+===========
+Sharing work between concurrent requests:
+
+* SingleFlight      -> concurrent calls with the same key share one in-flight task
+* MicroBatcher(fn)  -> items submitted within a few ms are handled by one fn(items) call
+
+Both keep counters, reported by .stats().
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Sequence
+
+BATCH_WINDOW = 0.002  # seconds a batch stays open after its first item
+MAX_BATCH = 512
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key: the first caller starts the work,
+    callers arriving while it is in flight await the same task and get the
+    same result or exception. Nothing is cached once the task is done.
+
+    The task is shielded, so a caller that is cancelled (e.g. its client went
+    away) does not cancel the work the others are waiting for.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.started = 0  # calls that did the work
+        self.shared = 0   # calls that joined an in-flight task
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        task = self._inflight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an unawaited failure is not logged as lost
+
+    def stats(self) -> dict:
+        calls = self.started + self.shared
+        return {
+            "calls": calls,
+            "started": self.started,
+            "shared": self.shared,
+            "shared_ratio": self.shared / calls if calls else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within `window` seconds of the first one (or
+    until `max_batch` are waiting) and handles them with a single
+    `fn(items) -> results` call, results aligned with items. `fn` runs on the
+    event loop, so it should be a short CPU call such as one model.predict.
+    If it raises, every item of the batch gets the exception.
+    """
+
+    def __init__(self, fn: Callable[[list], Sequence], window: float = BATCH_WINDOW,
+                 max_batch: int = MAX_BATCH):
+        self.fn = fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest = max(self.largest, len(batch))
+
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the submitter may have been cancelled
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest,
+        }
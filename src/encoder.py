@@ -0,0 +1,280 @@
+"""
+encoder.py
+==========
+NumPy re-implementation of the fitted preprocessing step, so the server
+does not have to unpickle scikit-learn's ColumnTransformer:
+
+* FeatureEncoder.from_column_transformer(pre)  -> FeatureEncoder
+* FeatureEncoder.load(path) / .save(path)       (compact JSON spec)
+* encoder.transform(df)                         -> np.ndarray (same as pre.transform)
+* encoder.transform_csr(df)                     -> scipy CSR (sparse training input)
+* encoder.encode(columns, n_rows, out=None)     -> np.ndarray (hot path, no pandas)
+
+CategoricalEncoder has the same interface for models trained with XGBoost's
+native categorical support (one integer-coded column per categorical feature).
+as_encoder(pre) / load_encoder(path) return whichever fits.
+"""
+
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SPEC_VERSION = 1
+
+
+def _plain(value):
+    """numpy scalar -> JSON-serialisable Python scalar"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class FeatureEncoder:
+    """
+    StandardScaler on the numeric features followed by a one-hot encoding of
+    the categorical features (unknown categories encode as all zeros), in the
+    column order of the training ColumnTransformer.
+
+    `sparse=True` marks a model trained on transform_csr() output. XGBoost
+    treats entries absent from a CSR matrix as missing rather than 0, so for
+    such a model encode() writes NaN where the one-hot matrix has a zero.
+    """
+
+    kind = "onehot"
+
+    def __init__(self, num_features: list[str], means, scales,
+                 cat_features: list[str], categories: list[list], sparse: bool = False):
+        self.sparse = bool(sparse)
+        self.num_features = list(num_features)
+        self.means = np.asarray(means, dtype=float)
+        self.scales = np.asarray(scales, dtype=float)
+        self.cat_features = list(cat_features)
+        self.categories = [list(c) for c in categories]
+
+        # value -> output column, per categorical feature
+        self.n_num = len(self.num_features)
+        offset = self.n_num
+        self.cat_columns = []
+        for cats in self.categories:
+            self.cat_columns.append({c: offset + i for i, c in enumerate(cats)})
+            offset += len(cats)
+        self.n_features_out = offset
+        self._scratch = threading.local()  # per-thread preallocated single row
+
+    def __getstate__(self):
+        # picklable (joblib bundle, worker processes); scratch rows are per process
+        state = self.__dict__.copy()
+        del state["_scratch"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._scratch = threading.local()
+
+    @classmethod
+    def from_column_transformer(cls, pre, sparse: bool = False) -> "FeatureEncoder":
+        num_features, means, scales = [], [], []
+        cat_features, categories = [], []
+        for name, step, cols in pre.transformers_:
+            if step == "drop" or name == "remainder":
+                continue
+            kind = type(step).__name__
+            if kind == "StandardScaler":
+                if cat_features:
+                    raise ValueError("Numeric features must come before categorical ones")
+                num_features += list(cols)
+                means += list(step.mean_ if step.with_mean else np.zeros(len(cols)))
+                scales += list(step.scale_ if step.with_std else np.ones(len(cols)))
+            elif kind == "OneHotEncoder":
+                if step.drop is not None:
+                    raise ValueError("OneHotEncoder(drop=...) is not supported")
+                cat_features += list(cols)
+                categories += [[_plain(v) for v in cats] for cats in step.categories_]
+            else:
+                raise ValueError(f"Unsupported transformer {name!r}: {kind}")
+        return cls(num_features, means, scales, cat_features, categories, sparse=sparse)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": SPEC_VERSION,
+            "kind": self.kind,
+            "sparse": self.sparse,
+            "numeric": {
+                "features": self.num_features,
+                "mean": self.means.tolist(),
+                "scale": self.scales.tolist(),
+            },
+            "categorical": {
+                "features": self.cat_features,
+                "categories": self.categories,
+            },
+            "n_features_out": self.n_features_out,
+        }
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "FeatureEncoder":
+        if spec.get("version") != SPEC_VERSION:
+            raise ValueError(f"Unsupported encoding spec version: {spec.get('version')}")
+        num, cat = spec["numeric"], spec["categorical"]
+        return cls(num["features"], num["mean"], num["scale"], cat["features"], cat["categories"],
+                   sparse=spec.get("sparse", False))
+
+    def save(self, path: Path):
+        Path(path).write_text(json.dumps(self.to_dict()))
+
+    @classmethod
+    def load(cls, path: Path) -> "FeatureEncoder":
+        return cls.from_dict(json.loads(Path(path).read_text()))
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Dense float64 matrix, column-for-column equal to the ColumnTransformer
+        output; with `sparse`, one-hot zeros are NaN (missing), as in encode().
+        """
+        out = np.full((len(df), self.n_features_out), np.nan if self.sparse else 0.0)
+        out[:, :self.n_num] = (df[self.num_features].to_numpy(dtype=float) - self.means) / self.scales
+
+        rows = np.arange(len(df))
+        for col, lookup in zip(self.cat_features, self.cat_columns):
+            # dict lookup keeps sklearn's equality semantics (e.g. 1 == True)
+            idx = np.fromiter((lookup.get(v, -1) for v in df[col].tolist()), dtype=np.int64, count=len(df))
+            hit = idx >= 0
+            out[rows[hit], idx[hit]] = 1.0
+        return out
+
+    def transform_csr(self, df: pd.DataFrame, dtype=np.float32):
+        """
+        The transform() matrix as scipy CSR, built directly rather than from
+        the dense matrix. Numeric values are always stored (an exact 0.0 stays
+        a value, not a missing entry); unknown categories store nothing.
+        """
+        from scipy import sparse
+
+        n = len(df)
+        values = [(df[self.num_features].to_numpy(dtype=float) - self.means) / self.scales]
+        columns = [np.broadcast_to(np.arange(self.n_num), (n, self.n_num))]
+        for col, lookup in zip(self.cat_features, self.cat_columns):
+            idx = np.fromiter((lookup.get(v, -1) for v in df[col].tolist()), dtype=np.int64, count=n)
+            values.append(np.where(idx >= 0, 1.0, np.nan)[:, None])
+            columns.append(idx[:, None])
+        values, columns = np.hstack(values), np.hstack(columns)
+
+        keep = columns >= 0  # row-major, so entries stay grouped by row
+        indptr = np.concatenate(([0], np.cumsum(keep.sum(axis=1))))
+        return sparse.csr_matrix((values[keep].astype(dtype), columns[keep], indptr),
+                                 shape=(n, self.n_features_out))
+
+    def encode(self, columns: dict, n_rows: int, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Encode raw feature values straight into a float64 matrix of shape
+        (n_rows, n_features_out), without building a DataFrame.
+
+        `columns` maps every input feature to either a scalar (the same for all
+        rows, e.g. calendar features of one timestamp) or a sequence of length
+        `n_rows`. `out` is reused when given; otherwise single rows go into a
+        per-thread preallocated buffer, so keep the result only until the next call.
+        """
+        if out is None:
+            if n_rows == 1:
+                out = getattr(self._scratch, "row", None)
+                if out is None:
+                    out = self._scratch.row = np.empty((1, self.n_features_out))
+            else:
+                out = np.empty((n_rows, self.n_features_out))
+        out[:, self.n_num:] = np.nan if self.sparse else 0.0
+
+        for j, name in enumerate(self.num_features):
+            out[:, j] = (np.asarray(columns[name], dtype=float) - self.means[j]) / self.scales[j]
+
+        for name, lookup in zip(self.cat_features, self.cat_columns):
+            value = columns[name]
+            if np.ndim(value) == 0:
+                col = lookup.get(value, -1)
+                if col >= 0:
+                    out[:, col] = 1.0
+            else:
+                idx = np.fromiter((lookup.get(v, -1) for v in value), dtype=np.int64, count=n_rows)
+                hit = np.flatnonzero(idx >= 0)
+                out[hit, idx[hit]] = 1.0
+        return out
+
+
+class CategoricalEncoder:
+    """
+    Inputs for a model trained with XGBoost's native categorical support:
+    numeric features as they are (trees need no scaling), then one column per
+    categorical feature holding the category's integer code. Unknown
+    categories are NaN, i.e. missing. `feature_types` is passed to XGBoost.
+    """
+
+    kind = "categorical"
+
+    def __init__(self, num_features: list[str], cat_features: list[str], categories: list[list]):
+        self.num_features = list(num_features)
+        self.cat_features = list(cat_features)
+        self.categories = [list(c) for c in categories]
+        self.codes = [{c: float(i) for i, c in enumerate(cats)} for cats in self.categories]
+        self.n_num = len(self.num_features)
+        self.n_features_out = self.n_num + len(self.cat_features)
+        self.feature_types = ["q"] * self.n_num + ["c"] * len(self.cat_features)
+
+    @classmethod
+    def fit(cls, df: pd.DataFrame, num_features: list[str], cat_features: list[str]) -> "CategoricalEncoder":
+        categories = [[_plain(v) for v in pd.unique(df[col].dropna().to_numpy())] for col in cat_features]
+        return cls(num_features, cat_features, [sorted(c, key=str) for c in categories])
+
+    def to_dict(self) -> dict:
+        return {
+            "version": SPEC_VERSION,
+            "kind": self.kind,
+            "numeric": {"features": self.num_features},
+            "categorical": {"features": self.cat_features, "categories": self.categories},
+            "n_features_out": self.n_features_out,
+        }
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "CategoricalEncoder":
+        if spec.get("version") != SPEC_VERSION:
+            raise ValueError(f"Unsupported encoding spec version: {spec.get('version')}")
+        return cls(spec["numeric"]["features"], spec["categorical"]["features"], spec["categorical"]["categories"])
+
+    def save(self, path: Path):
+        Path(path).write_text(json.dumps(self.to_dict()))
+
+    def transform(self, df: pd.DataFrame, dtype=np.float32) -> np.ndarray:
+        out = np.empty((len(df), self.n_features_out), dtype=dtype)
+        out[:, :self.n_num] = df[self.num_features].to_numpy(dtype=float)
+        for j, (col, lookup) in enumerate(zip(self.cat_features, self.codes), start=self.n_num):
+            out[:, j] = np.fromiter((lookup.get(v, np.nan) for v in df[col].tolist()), dtype=float, count=len(df))
+        return out
+
+    def encode(self, columns: dict, n_rows: int, out: np.ndarray | None = None) -> np.ndarray:
+        """Same contract as FeatureEncoder.encode (scalars broadcast, `out` reused)."""
+        if out is None:
+            out = np.empty((n_rows, self.n_features_out))
+        for j, name in enumerate(self.num_features):
+            out[:, j] = columns[name]
+        for j, (name, lookup) in enumerate(zip(self.cat_features, self.codes), start=self.n_num):
+            value = columns[name]
+            if np.ndim(value) == 0:
+                out[:, j] = lookup.get(value, np.nan)
+            else:
+                out[:, j] = np.fromiter((lookup.get(v, np.nan) for v in value), dtype=float, count=n_rows)
+        return out
+
+
+ENCODER_KINDS = {cls.kind: cls for cls in (FeatureEncoder, CategoricalEncoder)}
+
+
+def as_encoder(pre):
+    """An encoder as-is, or the FeatureEncoder equivalent of a fitted ColumnTransformer."""
+    if isinstance(pre, tuple(ENCODER_KINDS.values())):
+        return pre
+    return FeatureEncoder.from_column_transformer(pre)
+
+
+def load_encoder(path: Path):
+    """FeatureEncoder or CategoricalEncoder, depending on the spec's "kind"."""
+    spec = json.loads(Path(path).read_text())
+    return ENCODER_KINDS[spec.get("kind", FeatureEncoder.kind)].from_dict(spec)
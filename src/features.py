@@ -1,9 +1,11 @@
-from datetime import timezone, timedelta
+import os
+from datetime import date, timezone, timedelta
+from pathlib import Path
 import pandas as pd
 import numpy as np
 import holidays
 
-vic_holidays = holidays.country_holidays(country="Australia", subdiv="Victoria", years=range(2021, 2099), observed=True)
+HOLIDAY_YEARS = range(2021, 2099)
 LOCKDOWNS = [
     ("2020-03-31", "2020-05-31"),
     ("2020-07-01", "2020-07-08"),
@@ -17,6 +19,106 @@ AEST = timezone(timedelta(hours=10))
 # convert once to Timestamp bound pairs
 LOCK_WINDOWS = [(pd.Timestamp(s, tz=AEST), pd.Timestamp(e,tz=AEST)) for s, e in LOCKDOWNS]
 
+# Day-indexed calendar table: one uint8 per day, built once and cached on disk
+CALENDAR_START = np.datetime64("2020-01-01", "D")
+CALENDAR_END = np.datetime64("2100-01-01", "D")
+CALENDAR_CACHE = Path(os.environ.get("PEDS_CALENDAR_CACHE", "data/interim/calendar.npz"))
+HOLIDAY_BIT, LOCKDOWN_BIT, WEEKDAY_SHIFT = 1, 2, 2  # weekday (Monday=0) in bits 2-4
+DAY_NAMES = np.array(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"], dtype=object)
+_EPOCH = date(1970, 1, 1)
+_CALENDAR = None
+
+
+def _vic_holidays():
+    global vic_holidays
+    vic_holidays = holidays.country_holidays(country="Australia", subdiv="Victoria",
+                                             years=HOLIDAY_YEARS, observed=True)
+    return vic_holidays
+
+
+def __getattr__(name):
+    # `vic_holidays` is built on first use rather than at import; only the calendar builder needs it
+    if name == "vic_holidays":
+        return _vic_holidays()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _calendar_key() -> str:
+    return f"{holidays.__version__}|{HOLIDAY_YEARS}|{LOCKDOWNS}|{CALENDAR_START}|{CALENDAR_END}"
+
+
+def _build_calendar() -> np.ndarray:
+    days = np.arange(CALENDAR_START, CALENDAR_END)
+    flags = (((days.astype(np.int64) + 3) % 7) << WEEKDAY_SHIFT).astype(np.uint8)  # 1970-01-01 was a Thursday
+
+    holiday_days = np.array(sorted(_vic_holidays()), dtype="datetime64[D]")
+    holiday_days = holiday_days[(holiday_days >= CALENDAR_START) & (holiday_days < CALENDAR_END)]
+    flags[(holiday_days - CALENDAR_START).astype(np.int64)] |= HOLIDAY_BIT
+
+    # Same test as the row-wise lockdown flag, evaluated at each day's local midnight
+    midnights = pd.DatetimeIndex(days).tz_localize("Australia/Melbourne")
+    for start, end in LOCK_WINDOWS:
+        flags[(midnights >= start) & (midnights <= end)] |= LOCKDOWN_BIT
+    return flags
+
+
+def calendar_table() -> np.ndarray:
+    """
+    Calendar flags for every day in [CALENDAR_START, CALENDAR_END): bit 0 =
+    Vic public holiday, bit 1 = lockdown, bits 2-4 = weekday (Monday=0).
+    Loaded from CALENDAR_CACHE when it matches the current holidays package
+    and lockdown list, otherwise rebuilt (and the cache rewritten).
+    """
+    global _CALENDAR
+    if _CALENDAR is not None:
+        return _CALENDAR
+    key = _calendar_key()
+    try:
+        with np.load(CALENDAR_CACHE) as cached:
+            if str(cached["key"]) == key:
+                _CALENDAR = cached["flags"]
+    except (OSError, KeyError, ValueError):
+        pass
+    if _CALENDAR is None:
+        _CALENDAR = _build_calendar()
+        try:
+            CALENDAR_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = CALENDAR_CACHE.with_name(CALENDAR_CACHE.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, flags=_CALENDAR, key=np.array(key))
+            os.replace(tmp, CALENDAR_CACHE)
+        except OSError:
+            pass  # read-only filesystem: keep the in-memory table
+    return _CALENDAR
+
+
+def day_numbers(dates) -> np.ndarray:
+    """Days since 1970-01-01 of the local (wall-clock) date of each timestamp."""
+    dts = pd.to_datetime(pd.Series(dates))
+    if dts.dt.tz is not None:
+        dts = dts.dt.tz_localize(None)
+    return dts.to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def day_number(ts) -> int:
+    """Days since 1970-01-01 of the local date of a single timestamp."""
+    return (ts.date() - _EPOCH).days
+
+
+def calendar_features(days):
+    """
+    (is_holiday, is_lockdown, weekday) for day numbers, by integer indexing
+    into the calendar table. Days outside the table are neither holidays nor
+    lockdowns (the holiday list and all lockdowns lie inside it).
+    """
+    days = np.asarray(days, dtype=np.int64)
+    table = calendar_table()
+    idx = days - CALENDAR_START.astype(np.int64)
+    inside = (idx >= 0) & (idx < len(table))
+    flags = np.where(inside, table[np.clip(idx, 0, len(table) - 1)], 0)
+    weekday = np.where(inside, (flags >> WEEKDAY_SHIFT) & 7, (days + 3) % 7)
+    return (flags & HOLIDAY_BIT).astype(bool), (flags & LOCKDOWN_BIT).astype(bool), weekday
+
 
 def add_is_holiday(df: pd.DataFrame,
                    date_col: str = "Sensing_Date") -> pd.DataFrame:
@@ -33,7 +135,7 @@ def add_is_holiday(df: pd.DataFrame,
     Same DataFrame with a new int8 column `is_holiday`.
     """
     out = df.copy()
-    out["is_holiday"] = out[date_col].dt.date.isin(vic_holidays)
+    out["is_holiday"] = calendar_features(day_numbers(out[date_col]))[0]
 
     return out
 
@@ -46,7 +148,8 @@ def add_lags(df: pd.DataFrame,
 
     Parameters
     ----------
-    df : DataFrame sorted by Sensor_Name & time
+    df : DataFrame sorted by Sensor_Name & time, with no missing hours
+         (lags are row shifts; see build_features for hour-indexed lags)
     lags : tuple of integers (hours)
     target_col : the column to lag
 
@@ -67,14 +170,8 @@ def add_lockdown_flag(df: pd.DataFrame,
     Add binary `is_lockdown` based on metropolitan‑Melbourne stay‑at‑home orders.
     """
     df = df.copy()
-    dts = pd.to_datetime(df[date_col]).dt.tz_localize("Australia/Melbourne")
-
-    # vectorized test: OR‑reduce across all windows
-    mask = pd.Series(False, index=df.index)
-    for start, end in LOCK_WINDOWS:
-        mask |= (dts >= start) & (dts <= end)
-
-    df["is_lockdown"] = mask.astype("int8")
+    # windows are evaluated per calendar day (at local midnight) in the calendar table
+    df["is_lockdown"] = calendar_features(day_numbers(df[date_col]))[1].astype("int8")
     return df
 
 
@@ -103,5 +200,65 @@ def add_lockdown_flag(df: pd.DataFrame,
 
 def add_day_of_week(df):
     df = df.copy()
-    df['day_of_week'] = df['Sensing_Date'].dt.day_name()  # "Monday"..."Sunday"
-    return df
\ No newline at end of file
+    df['day_of_week'] = DAY_NAMES[calendar_features(day_numbers(df['Sensing_Date']))[2]]  # "Monday"..."Sunday"
+    return df
+
+def hour_numbers(df: pd.DataFrame, date_col: str = "Sensing_Date",
+                 hour_col: str = "HourDay") -> np.ndarray:
+    """Hours since 1970-01-01 00:00 (local wall clock) of each row's date + HourDay."""
+    return day_numbers(df[date_col]) * 24 + df[hour_col].to_numpy(dtype=np.int64)
+
+
+def lag_features(sensors, hours, values, lags: tuple[int, ...] = (24, 168)) -> dict[str, np.ndarray]:
+    """
+    Lagged `values` keyed by integer hour rather than row position.
+
+    Each sensor's rows are scattered once onto a dense hourly grid spanning its
+    first to last hour; lag h of a row is then the grid cell h hours earlier.
+    Hours missing from the data (gaps, or before the sensor's first hour) give
+    NaN. Rows may be in any order. Returns {"lag_{h}h": float32 array}.
+    """
+    codes, _ = pd.factorize(pd.Series(sensors))
+    hours = np.asarray(hours, dtype=np.int64)
+    n_codes = codes.max() + 1 if len(codes) else 0
+
+    first = np.full(n_codes, np.iinfo(np.int64).max)
+    last = np.full(n_codes, np.iinfo(np.int64).min)
+    np.minimum.at(first, codes, hours)
+    np.maximum.at(last, codes, hours)
+    offsets = np.concatenate(([0], np.cumsum(last - first + 1)))
+
+    grid = np.full(offsets[-1], np.nan, dtype=np.float32)
+    rel = hours - first[codes]          # hours since the sensor's first hour
+    pos = offsets[codes] + rel          # row -> grid cell
+    grid[pos] = values
+
+    out = {}
+    for lag in lags:
+        col = np.full(len(hours), np.nan, dtype=np.float32)
+        ok = rel >= lag
+        col[ok] = grid[pos[ok] - lag]
+        out[f"lag_{lag}h"] = col
+    return out
+
+
+def build_features(df: pd.DataFrame, lags: tuple[int, ...] = (24, 168),
+                   target_col: str = "Total_of_Directions",
+                   date_col: str = "Sensing_Date") -> pd.DataFrame:
+    """
+    Add is_holiday, is_lockdown, day_of_week and lag columns to `df` in place
+    (no copies of the frame), with the same values and dtypes as the add_*
+    functions above. Lags come from lag_features, so gaps in a sensor's hourly
+    series give NaN instead of the value from another hour.
+
+    Returns `df` so it can be used with .pipe.
+    """
+    is_holiday, is_lockdown, weekday = calendar_features(day_numbers(df[date_col]))
+    df["is_holiday"] = is_holiday
+    df["is_lockdown"] = is_lockdown.astype("int8")
+    df["day_of_week"] = DAY_NAMES[weekday]
+
+    hours = hour_numbers(df, date_col)
+    for name, col in lag_features(df["Sensor_Name"], hours, df[target_col].to_numpy(), lags).items():
+        df[name] = col
+    return df
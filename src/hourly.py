@@ -0,0 +1,132 @@
+"""
+hourly.py
+=========
+Current-hour predictions for every sensor, computed once per hour:
+
+* build_table(ts)       -> HourTable  (one predict_batch over the sensors in the buffers)
+* table_lags(ts)         -> (ready sensors, lags_24h, lags_168h, missing sensors)
+* publish(table) / current(ts)        (atomic swap / lookup of the served table)
+* await next_table()    -> HourTable | None   (the next table published)
+* run_hourly()          -> never returns (rebuilds shortly after each AEST hour boundary)
+
+A table is never modified after it is built; readers take the module-level
+reference once and see either the old table or the new one.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+import numpy as np
+
+from src import inference
+from src.buffers import hour_index
+from src.features import AEST
+from src.metrics import timed
+
+log = logging.getLogger(__name__)
+
+HOURLY_DELAY = 30.0     # seconds after the hour boundary, so the previous hour's poll has landed
+RETRY_INTERVAL = 300.0  # rebuild this often while sensors are missing from the table
+
+
+class HourTable(NamedTuple):
+    hour: datetime                   # AEST hour the predictions are for
+    predictions: Mapping[str, float]  # read-only sensor -> predicted count
+    missing: tuple[str, ...]         # sensors in the buffers without both lags
+    computed_at: datetime
+    model_version: str | None = None
+
+
+TABLE: HourTable | None = None
+
+
+def current_hour(now: datetime | None = None) -> datetime:
+    return (now or datetime.now(AEST)).astimezone(AEST).replace(minute=0, second=0, microsecond=0)
+
+
+def table_lags(ts: datetime, ring=None) -> tuple[list[str], np.ndarray, np.ndarray, tuple[str, ...]]:
+    """Sensors in the ring with both lags for hour `ts`, their lags, and the sensors without."""
+    ring = inference.BUFFERS if ring is None else ring
+    sensors = sorted(ring)
+    history = ring.window(sensors, hour_index(ts) - 168, 168)
+    lags_24h, lags_168h = history[:, 144], history[:, 0]
+    have = ~(np.isnan(lags_24h) | np.isnan(lags_168h))
+    ready = [s for s, ok in zip(sensors, have) if ok]
+    return ready, lags_24h[have], lags_168h[have], tuple(s for s, ok in zip(sensors, have) if not ok)
+
+
+def make_table(ts: datetime, predictions: dict, missing: tuple[str, ...], model_version: str | None) -> HourTable:
+    return HourTable(hour=ts, predictions=MappingProxyType(predictions), missing=missing,
+                     computed_at=datetime.now(AEST), model_version=model_version)
+
+
+@timed("hourly_table")
+def build_table(ts: datetime, ring=None, model: inference.LoadedModel | None = None) -> HourTable:
+    """Predictions for hour `ts` for every sensor whose 24h and 168h lags are in the ring."""
+    model = model or inference.active()
+    ready, lags_24h, lags_168h, missing = table_lags(ts, ring)
+    preds = inference.predict_batch(ready, ts, lags_24h, lags_168h, model=model)
+    return make_table(ts, dict(zip(ready, preds)), missing, model.version)
+
+
+# Futures of next_table() callers, resolved by the next publish()
+_WAITERS: set[asyncio.Future] = set()
+
+
+def publish(table: HourTable):
+    global TABLE
+    TABLE = table
+    for waiter in list(_WAITERS):
+        # thread-safe: the waiter's loop resolves it (a no-op if it was cancelled meanwhile)
+        try:
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter, table)
+        except RuntimeError:  # its loop is closed
+            _WAITERS.discard(waiter)
+
+
+def _resolve(waiter: asyncio.Future, table: HourTable | None):
+    if not waiter.done():
+        waiter.set_result(table)
+
+
+async def next_table() -> HourTable | None:
+    """Wait for the next publish() and return what it published."""
+    waiter = asyncio.get_running_loop().create_future()
+    _WAITERS.add(waiter)
+    try:
+        return await waiter
+    finally:
+        _WAITERS.discard(waiter)
+
+
+def current(ts: datetime) -> HourTable | None:
+    """The published table if it is for hour `ts`."""
+    table = TABLE
+    return table if table is not None and table.hour == ts else None
+
+
+def seconds_until_next(now: datetime, delay: float = HOURLY_DELAY) -> float:
+    return (current_hour(now) + timedelta(hours=1) - now).total_seconds() + delay
+
+
+async def run_hourly(delay: float = HOURLY_DELAY, retry: float = RETRY_INTERVAL):
+    """Background task: build and publish the table now, then after every hour boundary."""
+    while True:
+        ts = current_hour()
+        try:
+            table = await asyncio.to_thread(build_table, ts)
+            publish(table)
+            log.info("Hourly table for %s: %d sensors, %d missing lags",
+                     ts.isoformat(), len(table.predictions), len(table.missing))
+        except Exception:
+            log.exception("Building the hourly table failed")
+            table = None
+
+        now = datetime.now(AEST)
+        wait = seconds_until_next(now, delay)
+        if table is None or table.missing:
+            wait = min(wait, retry)  # lags may still arrive this hour
+        await asyncio.sleep(wait)
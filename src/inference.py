@@ -1,62 +1,216 @@
 """
 inference.py
 ============
-Loads the trained bundle ONCE and provides:
+Loads the trained model ONCE (explicitly at startup, or lazily on first use) and provides:
 
-* init_buffers(df_hist)     -> dict   (call at cold‑start)
-* predict_one(sensor, ts)   -> int    (1‑hour forecast)
-* predict_recursive(sensor, ts_start, n_hours) -> list[(ts, int)]
+* load_model()              -> None   (native booster + JSON spec if exported, else joblib bundle)
+* read_model(dir, version)  -> LoadedModel   /   install(loaded) -> previous LoadedModel
+* active()                  -> LoadedModel   (the served model; read once per request)
+* warm_up(model=None)       -> float  (seconds; one throw-away prediction)
+* init_buffers(df_hist)     -> LagRing (call at cold‑start)
+* buffer_lags(sensor, ts)   -> dict   (lags the in-memory ring can serve)
+* predict_current_hour_with_live_lags(sensor, ts, lag_24h, lag_168h) -> float
+* predict_batch(sensors, ts, lags_24h, lags_168h) -> list[float]
+* predict_items([(sensor, ts, lag_24h, lag_168h, model), ...]) -> list[float] (one call per timestamp)
+* predict_recursive(sensors, ts_start, n_hours, history) -> np.ndarray (sensors x hours)
+
+The prediction functions take an optional `model` (a LoadedModel); by default
+they use the one active when they are called. With PEDS_PREDICTOR=compiled,
+batches of up to COMPILED_MAX_ROWS rows are scored by the booster compiled to
+flat arrays (src/trees.py), which skips XGBoost's per-call DMatrix overhead.
 """
 
-from collections import deque
-from datetime import timedelta
+import logging
+import os
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
-import joblib, numpy as np, pandas as pd
-from src.features import vic_holidays, LOCK_WINDOWS, AEST  # reuse existing objects
+from typing import Any, NamedTuple
+import numpy as np, pandas as pd
+from src.features import AEST, DAY_NAMES, calendar_features, day_number  # reuse existing objects
+from src.buffers import LagRing, frame_hours, hour_index
+from src.encoder import as_encoder, load_encoder
+from src.metrics import timed
+from src.trees import compile_model
 
 ARTIFACT_DIR = Path("src/artifacts")
+BUNDLE_FILE = "ped_model.joblib"
+NATIVE_MODEL_FILE = "ped_model.ubj"      # written by src.train.export_native
+ENCODING_SPEC_FILE = "ped_encoding.json"
+
+UNVERSIONED = "local"  # version name of a model loaded straight from ARTIFACT_DIR
+
+# "xgboost": every batch goes to XGBRegressor.predict. "compiled": batches up to
+# COMPILED_MAX_ROWS rows use the compiled trees; past that the booster is faster
+PREDICTOR = os.environ.get("PEDS_PREDICTOR", "xgboost")
+COMPILED_MAX_ROWS = 32
+
+log = logging.getLogger(__name__)
+
+
+class LoadedModel(NamedTuple):
+    """One model version: everything a prediction reads, swapped in as one reference."""
+    version: str
+    pre: Any
+    model: Any    # xgb.XGBRegressor
+    encoder: Any  # FeatureEncoder / CategoricalEncoder equivalent of pre, used on the hot path
+    load_seconds: float | None = None
+    compiled: Any = None  # trees.CompiledTrees of model, for small batches (PEDS_PREDICTOR=compiled)
+
 
-# Load bundle
-BUNDLE = joblib.load(ARTIFACT_DIR / "ped_model.joblib")
-PRE, MODEL = BUNDLE["pre"], BUNDLE["model"]
+# Model state, filled by install() / load_model()
+ACTIVE: LoadedModel | None = None
+# The active model's parts, kept for callers that read them directly
+BUNDLE = None
+PRE, MODEL = None, None
+ENCODER = None
+MODEL_LOAD_SECONDS = None
 
-# Buffers: one deque per sensor (populated at app start)
-BUFFERS = {}  # populated by init_buffers() below
 
+def read_artifacts(artifact_dir: Path = ARTIFACT_DIR) -> dict:
+    """{"pre": ..., "model": XGBRegressor} from a directory of saved artifacts."""
+    artifact_dir = Path(artifact_dir)
+    native, spec = artifact_dir / NATIVE_MODEL_FILE, artifact_dir / ENCODING_SPEC_FILE
+    if native.exists() and spec.exists():
+        import xgboost as xgb
+        model = xgb.XGBRegressor()
+        model.load_model(native)
+        return {"pre": load_encoder(spec), "model": model}
+    import joblib
+    return joblib.load(artifact_dir / BUNDLE_FILE)
 
-def init_buffers(df_hist: pd.DataFrame):
+
+def read_model(artifact_dir: Path = ARTIFACT_DIR, version: str = UNVERSIONED,
+               predictor: str | None = None) -> LoadedModel:
+    """
+    Load a directory of artifacts without serving it. Prefers the native
+    XGBoost booster and the JSON encoding spec (no sklearn unpickling); falls
+    back to the joblib bundle. `predictor` defaults to PREDICTOR.
     """
-    df_hist: DataFrame with >=168 real hours per sensor.
+    t0 = time.perf_counter()
+    bundle = read_artifacts(artifact_dir)
+    pre, model = bundle["pre"], bundle["model"]
+    compiled = None
+    if (predictor or PREDICTOR) == "compiled":
+        try:
+            compiled = compile_model(model)
+        except NotImplementedError as e:
+            log.warning("Model %s cannot be compiled (%s); scoring with XGBoost", version, e)
+    return LoadedModel(version, pre, model, as_encoder(pre), time.perf_counter() - t0, compiled)
+
+
+def install(loaded: LoadedModel) -> LoadedModel | None:
+    """
+    Serve `loaded` from now on and return the model it replaces. The swap is a
+    single reference assignment: a prediction that already read active() keeps
+    the previous model to the end.
+    """
+    global ACTIVE, BUNDLE, PRE, MODEL, ENCODER, MODEL_LOAD_SECONDS
+    previous, ACTIVE = ACTIVE, loaded
+    BUNDLE = {"pre": loaded.pre, "model": loaded.model}
+    PRE, MODEL, ENCODER = loaded.pre, loaded.model, loaded.encoder
+    MODEL_LOAD_SECONDS = loaded.load_seconds
+    return previous
+
+
+def load_model(artifact_dir: Path = ARTIFACT_DIR, version: str = UNVERSIONED):
+    """Load the model in `artifact_dir` and serve it."""
+    install(read_model(artifact_dir, version))
+
+
+def active() -> LoadedModel:
+    """The served model (the local artifacts are loaded on first use)."""
+    if ACTIVE is None:
+        load_model()
+    return ACTIVE
+
+
+def warm_up(model: LoadedModel | None = None) -> float:
+    """Run one throw-away prediction so the first request does not pay for lazy init."""
+    t0 = time.perf_counter()
+    predict_batch(["__warm_up__"], datetime.now(AEST), [0.0], [0.0], model=model)
+    return time.perf_counter() - t0
+
+
+# Internal helper: score encoded rows with the compiled trees when the batch is small
+def _predict(m: LoadedModel, rows) -> np.ndarray:
+    with timed("model_predict"):
+        if m.compiled is not None and rows.shape[0] <= COMPILED_MAX_ROWS:
+            return m.compiled.predict(rows)
+        return m.model.predict(rows)
+
+
+# Buffers: hour-indexed ring of recent counts per sensor (populated at app start)
+BUFFERS = LagRing()  # populated by init_buffers() below
+
+
+def init_buffers(df_hist: pd.DataFrame) -> LagRing:
+    """
+    df_hist: DataFrame with Sensor_Name, Sensing_Date (+ HourDay) and
+    Total_of_Directions; ideally >=168 real hours per sensor.
     """
-    global BUFFERS
     BUFFERS.clear()
-    for sensor, grp in (
-            df_hist.sort_values("Sensing_Date")
-                    .groupby("Sensor_Name")
-    ):
-        counts = grp["Total_of_Directions"].tail(168).values
-        BUFFERS[sensor] = {
-            "lag": deque(counts, maxlen=168),
-            # "roll": deque(counts[-3:], maxlen=3),
-        }
+    BUFFERS.write(
+        df_hist["Sensor_Name"].to_numpy(),
+        frame_hours(df_hist),
+        df_hist["Total_of_Directions"].to_numpy(),
+    )
+    return BUFFERS
 
 
-# Internal helper to build a single feature row
-def _build_row(sensor: str, ts, live_lag_24h: float, live_lag_168h: float):
+def buffer_lags(sensor: str, ts, lags: tuple[int, ...] = (24, 168)) -> dict:
+    """
+    Lag values for `sensor` at `ts` that the ring holds, as {"lag_24h": ...}.
+    Lags falling in a gap (or outside the ring) are left out.
+    """
+    hour = hour_index(ts)
+    found = {}
+    for lag in lags:
+        value = BUFFERS.get(sensor, hour - lag)
+        if value is not None:
+            found[f"lag_{lag}h"] = value
+    return found
+
+
+# Internal helper: raw feature values for several sensors at one timestamp
+def _feature_columns(sensors, ts, live_lags_24h, live_lags_168h) -> dict:
     if ts.tzinfo is None:
         ts = ts.replace(tzinfo=AEST)
 
-    return pd.DataFrame({
-        "Sensor_Name": [sensor],
-        "HourDay": [ts.hour],
-        # "lag_1h": [buf["lag"][-1]],
-        "lag_24h": [live_lag_24h],
-        "lag_168h": [live_lag_168h],
-        # "roll3h": [np.mean(buf["roll"])],
-        "is_holiday": [int(ts.date() in vic_holidays)],
-        "is_lockdown": [int(any(s <= ts <= e for s, e in LOCK_WINDOWS))],
-        "day_of_week": [ts.strftime("%A")],
-    })
+    # Calendar features depend only on ts, so they are scalars shared by the whole batch
+    is_holiday, is_lockdown, weekday = calendar_features(day_number(ts))
+    return {
+        "Sensor_Name": sensors,
+        "HourDay": ts.hour,
+        # "lag_1h": buf["lag"][-1],
+        "lag_24h": live_lags_24h,
+        "lag_168h": live_lags_168h,
+        # "roll3h": np.mean(buf["roll"]),
+        "is_holiday": int(is_holiday),
+        "is_lockdown": int(is_lockdown),
+        "day_of_week": DAY_NAMES[weekday],
+    }
+
+
+# Internal helper to encode feature rows without pandas (equal to PRE.transform(_build_rows(...)))
+@timed("encode")
+def _encode(sensors: list[str], ts, live_lags_24h, live_lags_168h, out=None, encoder=None) -> np.ndarray:
+    if encoder is None:
+        encoder = ENCODER if ENCODER is not None else active().encoder
+    return encoder.encode(_feature_columns(sensors, ts, live_lags_24h, live_lags_168h), len(sensors), out=out)
+
+
+# Internal helper to build the feature rows for several sensors at one timestamp
+def _build_rows(sensors: list[str], ts, live_lags_24h, live_lags_168h):
+    n = len(sensors)
+    columns = _feature_columns(list(sensors), ts, np.asarray(live_lags_24h, dtype=float),
+                               np.asarray(live_lags_168h, dtype=float))
+    return pd.DataFrame({name: value if np.ndim(value) else [value] * n for name, value in columns.items()})
+
+
+# Internal helper to build a single feature row
+def _build_row(sensor: str, ts, live_lag_24h: float, live_lag_168h: float):
+    return _build_rows([sensor], ts, [live_lag_24h], [live_lag_168h])
 
 
 # Single-hour prediction using live lag data
@@ -65,20 +219,76 @@ def predict_current_hour_with_live_lags(sensor: str, ts, live_lag_24h: float, li
     Predicts pedestrian count for the given sensor and timestamp (ts)
     using live (externally fetched) 24-hour and 168-hour lag values.
     """
-    row = _build_row(sensor, ts, live_lag_24h, live_lag_168h)
-    y_hat = MODEL.predict(PRE.transform(row))[0]
+    m = active()
+    row = _encode([sensor], ts, [live_lag_24h], [live_lag_168h], encoder=m.encoder)
+    y_hat = _predict(m, row)[0]
     y_hat = max(y_hat, 0)  # Ensure non-negative prediction
     return float(y_hat)
 
 
+# Current-hour prediction for many sensors in one model call
+def predict_batch(sensors: list[str], ts, live_lags_24h, live_lags_168h,
+                  model: LoadedModel | None = None) -> list[float]:
+    """
+    Predicts pedestrian counts for several sensors at the same timestamp (ts).
+    The lag sequences are aligned with `sensors`; one feature matrix is built
+    and scored with a single MODEL.predict call.
+    """
+    if not sensors:
+        return []
+    m = model or active()
+    rows = _encode(sensors, ts, live_lags_24h, live_lags_168h, encoder=m.encoder)
+    y_hat = np.maximum(_predict(m, rows), 0)  # Ensure non-negative predictions
+    return [float(y) for y in y_hat]
+
+
+# Mixed requests (MicroBatcher): one predict_batch per distinct timestamp and model
+def predict_items(items: list[tuple]) -> list[float]:
+    """
+    Predictions for (sensor, ts, lag_24h, lag_168h[, model]) items, aligned
+    with `items`. Items without a model (or with None) use the active one.
+    """
+    groups: dict = {}
+    for i, item in enumerate(items):
+        model = item[4] if len(item) > 4 else None
+        groups.setdefault((item[1], id(model)), (model, []))[1].append(i)
+    out = [0.0] * len(items)
+    for (ts, _), (model, idx) in groups.items():
+        preds = predict_batch([items[i][0] for i in idx], ts,
+                              [items[i][2] for i in idx], [items[i][3] for i in idx], model=model)
+        for i, pred in zip(idx, preds):
+            out[i] = pred
+    return out
+
 
 # Recursive multi‑hour forecast
-# def predict_recursive(sensor, ts_start, n_hours, buffers):
-#     buf = buffers[sensor]
-#     predictions = []
-#     ts = ts_start
-#     for _ in range(n_hours):
-#         y_hat, buf = predict_one(sensor, ts, buf)
-#         predictions.append((ts, y_hat))
-#         ts += timedelta(hours=1)
-#     return predictions
+MAX_HORIZON = 168  # lag_168h of every step is still a real observation
+
+
+def predict_recursive(sensors: list[str], ts_start, n_hours: int, history: np.ndarray,
+                      model: LoadedModel | None = None) -> np.ndarray:
+    """
+    Forecasts hours ts_start .. ts_start + n_hours - 1 for every sensor at once.
+
+    `history` holds observed counts for the 168 hours before ts_start, shape
+    (len(sensors), 168), NaN where unknown. Lags that fall inside the horizon
+    are taken from earlier predictions. Each hour is one encoded batch and one
+    MODEL.predict call for all sensors. Returns a (len(sensors), n_hours) array.
+    """
+    if not 1 <= n_hours <= MAX_HORIZON:
+        raise ValueError(f"n_hours must be between 1 and {MAX_HORIZON}")
+    m = model or active()
+    if ts_start.tzinfo is None:
+        ts_start = ts_start.replace(tzinfo=AEST)
+
+    n = len(sensors)
+    if np.shape(history) != (n, 168):
+        raise ValueError(f"history must have shape ({n}, 168), got {np.shape(history)}")
+    # Observed history followed by predictions: series[:, 168 + k] is hour ts_start + k
+    series = np.concatenate([np.asarray(history, dtype=float), np.empty((n, n_hours))], axis=1)
+    rows = np.empty((n, m.encoder.n_features_out))
+    for k in range(n_hours):
+        ts = ts_start + timedelta(hours=k)
+        _encode(sensors, ts, series[:, 168 + k - 24], series[:, k], out=rows, encoder=m.encoder)
+        series[:, 168 + k] = np.maximum(_predict(m, rows), 0)  # Ensure non-negative predictions
+    return series[:, 168:]
@@ -0,0 +1,123 @@
+"""
+ingest.py
+=========
+Keeps the in-memory lag ring current while the API is running:
+
+* ingest_new_hours(client, ring)  -> int   (one bulk, paged poll)
+* run_ingestion(client, ring)     -> never returns (poll + checkpoint loop)
+* run_elected_ingestion(client, ring, lock_path)
+                                  -> never returns (run_ingestion in one process of many)
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from fastapi import HTTPException
+
+from src.buffers import LagRing, frame_hours, hour_index, hour_to_ts
+from src.features import AEST
+from src.upstream import MAX_RECORDS, UpstreamClient
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = Path(os.environ.get("PEDS_BUFFER_CHECKPOINT", "data/interim/buffers_checkpoint.npz"))
+POLL_INTERVAL = 300.0       # seconds between polls for newly published hours
+CHECKPOINT_EVERY = 900.0    # seconds between checkpoints (only written when data changed)
+OVERLAP_HOURS = 3           # re-read the newest hours: sensors publish at slightly different times
+
+RECORD_FIELDS = "sensor_name,sensing_date,hourday,pedestriancount"
+
+
+def _where_from(hour: int) -> str:
+    """ODSQL filter for every record at or after absolute `hour` (AEST dates)."""
+    ts = hour_to_ts(hour)
+    day = ts.strftime("%Y-%m-%d")
+    return f"sensing_date > date'{day}' OR (sensing_date = date'{day}' AND hourday >= {ts.hour})"
+
+
+async def ingest_new_hours(client: UpstreamClient, ring: LagRing, now: datetime | None = None) -> int:
+    """
+    Poll the records endpoint for hours newer than the ring holds (all sensors
+    per query, paged) and write them into the ring in place. Returns the number
+    of records written.
+    """
+    now_hour = hour_index(now or datetime.now(AEST))
+    oldest = now_hour - ring.capacity + 1
+    start = oldest if ring.latest < 0 else max(ring.latest - OVERLAP_HOURS, oldest)
+
+    written = 0
+    while True:
+        records = await client.get_all_records({
+            "select": RECORD_FIELDS,
+            "where": _where_from(start),
+            "order_by": "sensing_date, hourday",
+        })
+        if not records:
+            break
+
+        df = pd.DataFrame.from_records(records)
+        df = df.dropna(subset=["sensor_name", "sensing_date", "hourday", "pedestriancount"])
+        hours = frame_hours(df, date_col="sensing_date", hour_col="hourday")
+        ring.write(df["sensor_name"].to_numpy(), hours, df["pedestriancount"].to_numpy())
+        written += len(df)
+
+        # Results stop at MAX_RECORDS: continue from the last (possibly partial) hour
+        if len(records) < MAX_RECORDS or len(hours) == 0 or hours.max() <= start:
+            break
+        start = int(hours.max())
+    return written
+
+
+async def run_ingestion(client: UpstreamClient, ring: LagRing,
+                        interval: float = POLL_INTERVAL,
+                        checkpoint_path: Path = CHECKPOINT_PATH,
+                        checkpoint_every: float = CHECKPOINT_EVERY):
+    """Background task: poll for new hours forever, checkpointing the ring periodically."""
+    last_checkpoint = time.monotonic()
+    dirty = False
+    try:
+        while True:
+            try:
+                written = await ingest_new_hours(client, ring)
+                dirty = dirty or written > 0
+                log.info("Ingested %d records; buffers now end at %s", written, hour_to_ts(ring.latest))
+            except HTTPException as e:
+                log.warning("Ingestion poll failed: %s %s", e.status_code, e.detail)
+            except Exception:
+                log.exception("Ingestion poll failed")
+
+            if dirty and time.monotonic() - last_checkpoint >= checkpoint_every:
+                await asyncio.to_thread(ring.save, checkpoint_path)
+                last_checkpoint = time.monotonic()
+                dirty = False
+            await asyncio.sleep(interval)
+    finally:
+        if dirty:
+            ring.save(checkpoint_path)  # shutdown: keep what was ingested since the last checkpoint
+
+
+async def run_elected_ingestion(client: UpstreamClient, ring: LagRing, lock_path: Path,
+                                interval: float = POLL_INTERVAL, **kwargs):
+    """
+    Multi-worker serving: every worker runs this, and only the one holding an
+    exclusive flock on `lock_path` runs run_ingestion into the shared ring.
+    The others retry every `interval`, so if the ingesting worker exits its
+    lock is released and another worker takes over.
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                await asyncio.sleep(interval)
+                continue
+            log.info("Worker %d is the ingester", os.getpid())
+            await run_ingestion(client, ring, interval=interval, **kwargs)
@@ -1,41 +1,170 @@
+import json
+import shutil
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from src.buffers import write_snapshot
+
 ROOT = Path(__file__).resolve().parents[1]
 DATA_RAW = ROOT / "data" / "raw"
+PED_CSV = DATA_RAW / "pedestrian-counting-system-monthly-counts-per-hour.csv"
+SENSORS_CSV = DATA_RAW / "pedestrian-counting-system-sensor-locations.csv"
+
+# Columnar cache of the counts CSV: parquet dataset partitioned by year (hive style)
+PED_CACHE = ROOT / "data" / "interim" / "ped_counts"
+CHUNK_ROWS = 1_000_000
+CUTOFF = pd.Timestamp("2020-01-01")
+
+# Recent counts for the API's buffers at first start (written by make_recent_snapshot)
+RECENT_SNAPSHOT = ROOT / "data" / "interim" / "pedestrian_recent"
+
+# Explicit schema for the counts CSV; columns missing from a given export are skipped
+PED_SCHEMA = {
+    "Location_ID": "int32",
+    "Sensing_Date": "str",   # parsed to datetime64 per chunk
+    "HourDay": "int16",
+    "Direction_1": "int32",
+    "Direction_2": "int32",
+    "Total_of_Directions": "int32",
+    "Sensor_Name": "str",    # dictionary-encoded in parquet, categorical when loaded
+}
 
 
 def load_data():
     # Load the raw pedestrian data and sensors data
-    ped = pd.read_csv(DATA_RAW / "pedestrian-counting-system-monthly-counts-per-hour.csv")
-    sensors = pd.read_csv(DATA_RAW / "pedestrian-counting-system-sensor-locations.csv")
+    ped = pd.read_csv(PED_CSV)
+    sensors = pd.read_csv(SENSORS_CSV)
 
     return ped, sensors
 
 
-def clean_data():
-    # Filter the data to remove old entries
-    ped, sensors = load_data()
-    cutoff = pd.Timestamp('2020-01-01')
-    ped["Sensing_Date"] = pd.to_datetime(ped["Sensing_Date"], errors='coerce')
-    ped = (ped.drop_duplicates(["Sensor_Name", "Sensing_Date", "HourDay"]))
-    ped_recent = ped.loc[ped["Sensing_Date"] >= cutoff].copy()
+def _source_stamp(csv_path: Path) -> dict:
+    stat = Path(csv_path).stat()
+    return {"path": str(csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_counts_cache(csv_path: Path = PED_CSV, cache_dir: Path = PED_CACHE,
+                       chunk_rows: int = CHUNK_ROWS) -> Path:
+    """
+    Stream the counts CSV in chunks with an explicit schema into a parquet
+    dataset partitioned by year. Rows with unparseable dates are dropped and
+    (Sensor_Name, Sensing_Date, HourDay) duplicates are removed incrementally,
+    keeping the first occurrence as drop_duplicates() does.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    csv_path, cache_dir = Path(csv_path), Path(cache_dir)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in PED_SCHEMA if c in header]
+    dtypes = {c: PED_SCHEMA[c] for c in usecols if c != "Sensing_Date"}
+
+    tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    sensors = pd.Index([], dtype=object)  # sensor code -> name, in order of first appearance
+    seen = np.empty(0, dtype=np.int64)  # sorted keys already written
+    rows = 0
+    for i, chunk in enumerate(pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, chunksize=chunk_rows)):
+        chunk["Sensing_Date"] = pd.to_datetime(chunk["Sensing_Date"], errors="coerce")
+        chunk = chunk[chunk["Sensing_Date"].notna()]
+
+        # int64 key: sensor code | day | hour
+        names = chunk["Sensor_Name"].to_numpy(dtype=object)
+        codes = sensors.get_indexer(names).astype(np.int64)
+        new = codes < 0
+        if new.any():  # append only the names this chunk introduces
+            sensors = sensors.append(pd.Index(pd.unique(names[new]), dtype=object))
+            codes[new] = sensors.get_indexer(names[new])
+        days = chunk["Sensing_Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        keys = (codes << 32) | ((days + 200_000) * 24 + chunk["HourDay"].to_numpy(dtype=np.int64))
+
+        _, first = np.unique(keys, return_index=True)
+        keep = np.zeros(len(keys), dtype=bool)
+        keep[first] = True
+        if len(seen):
+            pos = np.minimum(np.searchsorted(seen, keys), len(seen) - 1)
+            keep &= seen[pos] != keys
+        chunk = chunk[keep]
+        added = np.sort(keys[keep])  # unique, and none of them in `seen`: merge without re-sorting `seen`
+        seen = np.insert(seen, np.searchsorted(seen, added), added)
 
-    return ped_recent, sensors
+        years = chunk["Sensing_Date"].dt.year.to_numpy()
+        for year in np.unique(years):
+            part = tmp_dir / f"year={year}"
+            part.mkdir(exist_ok=True)
+            table = pa.Table.from_pandas(chunk[years == year], preserve_index=False)
+            pq.write_table(table, part / f"part-{i:05d}.parquet")
+        rows += len(chunk)
 
+    (tmp_dir / "_source.json").write_text(json.dumps({**_source_stamp(csv_path), "rows": rows}))
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    tmp_dir.rename(cache_dir)
+    return cache_dir
 
-def make_recent_snapshot():
-    ped, _ = clean_data()
 
-    ped = ped[ped["Sensing_Date"] >= "2024-01-01"]
-    ped_recent = (
-        ped.sort_values(["Sensor_Name", "Sensing_Date"])
-        .groupby("Sensor_Name")
-        .tail(168)
-    )
+def _cache_is_current(csv_path: Path, cache_dir: Path) -> bool:
+    stamp_file = Path(cache_dir) / "_source.json"
+    if not stamp_file.exists():
+        return False
+    if not Path(csv_path).exists():
+        return True  # raw CSV gone: the cache is all we have
+    stamp = json.loads(stamp_file.read_text())
+    return all(stamp.get(k) == v for k, v in _source_stamp(csv_path).items())
+
+
+def load_counts(columns: list[str] | None = None, start=None, end=None,
+                csv_path: Path = PED_CSV, cache_dir: Path = PED_CACHE) -> pd.DataFrame:
+    """
+    Typed pedestrian counts from the parquet cache (built from the CSV when
+    missing or stale). Only `columns` are read, and the date range
+    [start, end) is pushed down to partition and row-group filters.
+    Sensor_Name comes back categorical.
+    """
+    import pyarrow.dataset as ds
+
+    if not _cache_is_current(csv_path, cache_dir):
+        build_counts_cache(csv_path, cache_dir)
+
+    # "_source.json" is skipped: pyarrow ignores files starting with "_"
+    dataset = ds.dataset(cache_dir, format="parquet", partitioning="hive")
+
+    # The year conditions prune whole partitions, the date conditions row groups and rows
+    conds = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conds += [ds.field("year") >= start.year, ds.field("Sensing_Date") >= start.to_datetime64()]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conds += [ds.field("year") <= end.year, ds.field("Sensing_Date") < end.to_datetime64()]
+    expr = None
+    for cond in conds:
+        expr = cond if expr is None else expr & cond
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != "year"]
+    table = dataset.to_table(columns=list(columns), filter=expr)
+    df = table.to_pandas()
+    if "Sensor_Name" in df.columns:
+        df["Sensor_Name"] = df["Sensor_Name"].astype("category")
+    return df
+
+
+def clean_data():
+    # Filter the data to remove old entries (typed, deduplicated counts from the parquet cache)
+    ped = load_counts(start=CUTOFF)
+    sensors = pd.read_csv(SENSORS_CSV)
+
+    return ped, sensors
 
-    out_path = Path(ROOT / "data/interim/pedestrian_recent.parquet")
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    ped_recent.to_parquet(out_path, index=False)
-    print(f"Snapshot saved: {out_path}  ({len(ped_recent):,} rows)")
 
+def make_recent_snapshot(out_path: Path = RECENT_SNAPSHOT):
+    """
+    Last SNAPSHOT_HOURS hours of counts for every sensor as a columnar
+    snapshot (see src.buffers.write_snapshot), memory-mapped by the API at startup.
+    """
+    ped = load_counts(["Sensor_Name", "Sensing_Date", "HourDay", "Total_of_Directions"], start="2024-01-01")
+    n_sensors, n_hours = write_snapshot(ped, out_path)
+    print(f"Snapshot saved: {out_path}  ({n_sensors:,} sensors x {n_hours} hours)")
@@ -0,0 +1,216 @@
+"""
+metrics.py
+==========
+In-process metrics in the Prometheus text format (served by /metrics):
+
+* timed(stage)              -> context manager / decorator feeding peds_stage_seconds{stage=...}
+* UPSTREAM_REQUESTS.inc(status)     (upstream requests by HTTP status, or "error")
+* gauge(name, help, samples) -> str (one gauge family, for values read at scrape time)
+* counter(name, help, samples) -> str (the same for running totals kept elsewhere; name ends in _total)
+* render(*families)         -> str  (the module's histograms and counters + extra families)
+
+Set PEDS_METRICS=0 to disable timing: timed() then hands back a shared no-op
+context manager, and decorating with it returns the function unchanged.
+"""
+
+from bisect import bisect_left
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("PEDS_METRICS", "1") != "0"
+
+# Seconds; /predict stages range from microseconds (table lookup) to seconds (upstream timeouts)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(pairs) -> str:
+    pairs = [(k, v) for k, v in pairs if v is not None]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _header(name: str, help: str, kind: str) -> list[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)  # last: above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, buckets: tuple):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    """
+    Histogram with one label; observations above the last bucket count only
+    in +Inf. Stages also run in worker threads, so updates and the render
+    snapshot take a lock (buckets, sum and count stay consistent).
+    """
+
+    def __init__(self, name: str, help: str, label: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.label = name, help, label
+        self.buckets = tuple(buckets)
+        self._children: dict[str, _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            child = self._children.get(label_value)
+            if child is None:
+                child = self._children[label_value] = _HistogramChild(len(self.buckets))
+            child.observe(value, self.buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            snapshot = [(value, list(child.counts), child.sum, child.count)
+                        for value, child in sorted(self._children.items())]
+        lines = _header(self.name, self.help, "histogram")
+        for value, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels([(self.label, value), ('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels([(self.label, value), ('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels([(self.label, value)])} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels([(self.label, value)])} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter with one label."""
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name, self.help, self.label = name, help, label
+        self._values: dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def get(self, label_value: str) -> float:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> str:
+        lines = _header(self.name, self.help, "counter")
+        for value, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels([(self.label, value)])} {_number(total)}")
+        return "\n".join(lines)
+
+
+def _family(name: str, help: str, kind: str, samples, label: str | None) -> str:
+    lines = _header(name, help, kind)
+    if not isinstance(samples, dict):
+        samples = {None: samples}
+    for value, number in samples.items():
+        if number is not None:
+            lines.append(f"{name}{_labels([(label, value)])} {_number(number)}")
+    return "\n".join(lines)
+
+
+def gauge(name: str, help: str, samples, label: str | None = None) -> str:
+    """
+    One gauge family. `samples` is a number (unlabelled gauge) or a mapping of
+    label value -> number; None values are left out.
+    """
+    return _family(name, help, "gauge", samples, label)
+
+
+def counter(name: str, help: str, samples, label: str | None = None) -> str:
+    """One counter family from totals read at scrape time; `samples` as for gauge()."""
+    if not name.endswith("_total"):
+        raise ValueError(f"counter name {name!r} must end in _total")
+    return _family(name, help, "counter", samples, label)
+
+
+STAGE_SECONDS = Histogram("peds_stage_seconds", "Time spent per serving stage.", "stage")
+UPSTREAM_REQUESTS = Counter("peds_upstream_requests_total",
+                            "Requests to the opendatasoft API by HTTP status (error: no response).", "status")
+
+
+class _Timed:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(self.stage, time.perf_counter() - self.t0)
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_coroutine(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    STAGE_SECONDS.observe(stage, time.perf_counter() - t0)
+            return timed_coroutine
+
+        @functools.wraps(fn)
+        def timed_function(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(stage, time.perf_counter() - t0)
+        return timed_function
+
+
+class _NoTiming:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, fn):
+        return fn
+
+
+_NO_TIMING = _NoTiming()
+
+
+def timed(stage: str):
+    """
+    Time a block (`with timed("encode"):`) or every call of a function
+    (`@timed("upstream_fetch")`, sync or async) into peds_stage_seconds.
+    """
+    return _Timed(stage) if ENABLED else _NO_TIMING
+
+
+def render(*families: str) -> str:
+    """Exposition text: stage histograms, upstream counters, then `families`."""
+    return "\n".join([STAGE_SECONDS.render(), UPSTREAM_REQUESTS.render(), *families]) + "\n"
@@ -0,0 +1,169 @@
+"""
+registry.py
+===========
+Local model registry: one directory per model version plus a manifest.
+
+    <root>/manifest.json    {"current": "v3", "history": ["v1", "v2"], "versions": [{...}, ...]}
+    <root>/v1/ ped_model.ubj, ped_encoding.json, ped_model.joblib   (as written by src.train)
+
+* publish(artifact_dir)     -> str   (copy a training run in as the next version; current by default)
+* activate(version) / rollback() -> str   (change "current"; rollback returns to the previous one)
+* current_version()         -> str | None
+* load(version)             -> inference.LoadedModel
+
+    python -m src.registry publish src/artifacts --note "retrained through March"
+    python -m src.registry list
+    python -m src.registry activate v2
+    python -m src.registry rollback
+
+Servers poll the manifest and hot-swap to its current version (see src/api.py).
+The manifest is replaced atomically, and a version directory is complete
+before it is listed.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src import inference
+from src.inference import BUNDLE_FILE, ENCODING_SPEC_FILE, NATIVE_MODEL_FILE
+
+REGISTRY_DIR = Path(os.environ.get("PEDS_REGISTRY", "src/artifacts/registry"))
+MANIFEST_FILE = "manifest.json"
+ARTIFACT_FILES = (NATIVE_MODEL_FILE, ENCODING_SPEC_FILE, BUNDLE_FILE)
+
+
+def _root(root: Path | None) -> Path:
+    return Path(root if root is not None else REGISTRY_DIR)
+
+
+def read_manifest(root: Path | None = None) -> dict:
+    path = _root(root) / MANIFEST_FILE
+    if not path.exists():
+        return {"current": None, "history": [], "versions": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: dict, root: Path | None):
+    path = _root(root) / MANIFEST_FILE
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def version_dir(version: str, root: Path | None = None) -> Path:
+    return _root(root) / version
+
+
+def current_version(root: Path | None = None) -> str | None:
+    return read_manifest(root)["current"]
+
+
+def _trained_through(artifact_dir: Path) -> str | None:
+    native = artifact_dir / NATIVE_MODEL_FILE
+    if not native.exists():
+        return None
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(native)
+    return booster.attr("trained_through")
+
+
+def publish(artifact_dir: Path = inference.ARTIFACT_DIR, root: Path | None = None,
+            make_current: bool = True, note: str | None = None) -> str:
+    """Copy the artifacts of a training run into the registry as the next version."""
+    artifact_dir, root = Path(artifact_dir), _root(root)
+    files = [artifact_dir / name for name in ARTIFACT_FILES if (artifact_dir / name).exists()]
+    if not files:
+        raise FileNotFoundError(f"No model artifacts in {artifact_dir}")
+
+    manifest = read_manifest(root)
+    version = f"v{len(manifest['versions']) + 1}"
+    target = version_dir(version, root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for path in files:
+        shutil.copy2(path, tmp / path.name)
+    tmp.rename(target)
+
+    manifest["versions"].append({
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "source": str(artifact_dir),
+        "trained_through": _trained_through(target),
+        "note": note,
+    })
+    _write_manifest(manifest, root)
+    if make_current:
+        activate(version, root)
+    return version
+
+
+def activate(version: str, root: Path | None = None) -> str:
+    """Make `version` the current one (the one it replaces can be rolled back to)."""
+    manifest = read_manifest(root)
+    if version not in {v["version"] for v in manifest["versions"]}:
+        raise KeyError(f"Unknown model version {version!r}")
+    if manifest["current"] not in (None, version):
+        manifest["history"].append(manifest["current"])
+    manifest["current"] = version
+    _write_manifest(manifest, root)
+    return version
+
+
+def previous_version(root: Path | None = None) -> str | None:
+    """The version rollback() would return to."""
+    history = read_manifest(root)["history"]
+    return history[-1] if history else None
+
+
+def rollback(root: Path | None = None) -> str:
+    """Make the previously current version current again."""
+    manifest = read_manifest(root)
+    if not manifest["history"]:
+        raise LookupError("No earlier version to roll back to")
+    manifest["current"] = manifest["history"].pop()
+    _write_manifest(manifest, root)
+    return manifest["current"]
+
+
+def load(version: str, root: Path | None = None) -> inference.LoadedModel:
+    """Read a registered version (not served until inference.install)."""
+    path = version_dir(version, root)
+    if not path.is_dir():
+        raise KeyError(f"Unknown model version {version!r}")
+    return inference.read_model(path, version)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local model registry")
+    parser.add_argument("--root", type=Path, help=f"registry directory (default: {REGISTRY_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pub = commands.add_parser("publish", help="register a training run's artifacts")
+    pub.add_argument("artifact_dir", type=Path, nargs="?", default=inference.ARTIFACT_DIR)
+    pub.add_argument("--note")
+    pub.add_argument("--no-activate", action="store_true", help="register without making it current")
+    commands.add_parser("list", help="show the manifest")
+    act = commands.add_parser("activate", help="make a version current")
+    act.add_argument("version")
+    commands.add_parser("rollback", help="return to the previously current version")
+    args = parser.parse_args(argv)
+
+    if args.command == "publish":
+        print(publish(args.artifact_dir, args.root, not args.no_activate, args.note))
+    elif args.command == "list":
+        print(json.dumps(read_manifest(args.root), indent=2))
+    elif args.command == "activate":
+        print(activate(args.version, args.root))
+    else:
+        print(rollback(args.root))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+stream.py
+=========
+Framing of (event, record) pairs for streaming responses, one write per chunk:
+
+* dumps(obj)                -> bytes  (orjson when installed, else the json module)
+* frame(fmt, items)         -> bytes  ("ndjson": {"event": ..., **record} per line;
+                                       "sse": Server-Sent Events "event:/data:" blocks)
+* KEEP_ALIVE[fmt]           -> bytes  (written while nothing happens, so proxies keep the connection)
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: several times faster than json on these small records
+    orjson = None
+
+FORMATS = ("ndjson", "sse")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+KEEP_ALIVE = {"ndjson": b"\n", "sse": b": keep-alive\n\n"}
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def frame(fmt: str, items) -> bytes:
+    """One chunk holding every (event, record) in `items`."""
+    if fmt == "sse":
+        return b"".join(b"event: %s\ndata: %s\n\n" % (event.encode(), dumps(record)) for event, record in items)
+    return b"".join(dumps({"event": event, **record}) + b"\n" for event, record in items)
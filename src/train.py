@@ -1,106 +1,332 @@
+"""
+train.py
+========
+Training entry point, in explicit stages:
+
+    load -> features -> encode (cached) -> boost -> save
+
+    python -m src.train                                  # full fit
+    python -m src.train --encoding categorical           # sensor names as XGBoost categories
+    python -m src.train --continue-from src/artifacts    # boost more rounds on months ingested since
+
+The encoded feature matrices are cached on disk under a hash of the input
+rows and the feature configuration, so re-running on unchanged data skips
+straight to boosting. --continue-from keeps the previous encoder and trees
+and adds rounds on rows after the model's `trained_through` date.
+
+Encodings (--encoding):
+* dense        one-hot ColumnTransformer output as a dense matrix
+* sparse       the same one-hot columns as CSR, built without the dense matrix (default)
+* categorical  no one-hot: integer category codes and XGBoost's native categorical splits
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
 from pathlib import Path
+
 import joblib
-from src.load import clean_data
-from src.features import add_is_holiday, add_lags, add_lockdown_flag, add_day_of_week
+import numpy as np
 import pandas as pd
-from collections import deque
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.metrics import mean_absolute_error
 import xgboost as xgb
 
+from src.load import clean_data, load_counts
+from src.features import build_features
+from src.encoder import CategoricalEncoder, FeatureEncoder, as_encoder
+from src.inference import BUNDLE_FILE, NATIVE_MODEL_FILE, ENCODING_SPEC_FILE, read_artifacts
+
 ARTIFACT_DIR = Path("src/artifacts")
-ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+FEATURE_CACHE_DIR = Path(os.environ.get("PEDS_FEATURE_CACHE", "data/interim/features"))
+FEATURE_VERSION = 2  # bump when build_features / the encoding change meaning
 
 CUT_DATE_VAL = pd.Timestamp(year=2024, month=12, day=1)
 LAGS = (24, 168)
 
 FEATURES_NUM = ["HourDay", "lag_24h", "lag_168h"]
 FEATURES_CAT = ["Sensor_Name", "is_holiday", "is_lockdown", "day_of_week"]
+ENCODINGS = ("dense", "sparse", "categorical")
+DEFAULT_ENCODING = "sparse"
+
+XGB_PARAMS = {
+    "learning_rate": 0.05,
+    "max_depth": 8,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "objective": "reg:squarederror",
+    "tree_method": "hist",
+    "seed": 24,
+    "eval_metric": "mae",
+}
+N_ROUNDS = 3000
+EARLY_STOPPING_ROUNDS = 50
+CONTINUE_ROUNDS = 300
+CONTINUE_VAL_DAYS = 14
+
+
+def export_native(pre, model, out_dir=ARTIFACT_DIR):
+    """
+    Save the booster in XGBoost's native binary format (UBJSON) and the fitted
+    preprocessing as a JSON encoding spec, so the server can start without
+    unpickling the sklearn ColumnTransformer.
+    """
+    out_dir = Path(out_dir)
+    model.save_model(out_dir / NATIVE_MODEL_FILE)  # keeps best_iteration for predict()
+    as_encoder(pre).save(out_dir / ENCODING_SPEC_FILE)
 
-ped, sensors = clean_data()
 
-ped = (
-    ped.pipe(add_is_holiday)
-    .pipe(add_lockdown_flag)
-    .pipe(add_day_of_week)
-    .pipe(add_lags, lags=LAGS)
-    # .pipe(add_roll3h)
-    # Drop rows that still have NaNs in lag columns
-    .dropna(subset=["lag_24h", "lag_168h"])
-)
+# ---------------------------------------------------------------- stages ---
+def make_features(ped: pd.DataFrame) -> pd.DataFrame:
+    """Calendar + lag features (in place), minus rows whose lags are unknown."""
+    return build_features(ped, lags=LAGS).dropna(subset=["lag_24h", "lag_168h"])
 
-X = ped[FEATURES_NUM + FEATURES_CAT]
-y = ped["Total_of_Directions"]
 
+def split(ped: pd.DataFrame, cut_date: pd.Timestamp) -> tuple[pd.DataFrame, pd.DataFrame]:
+    train_mask = (ped["Sensing_Date"] < cut_date).to_numpy()
+    return ped[train_mask], ped[~train_mask]
 
-train_mask = ped["Sensing_Date"] < CUT_DATE_VAL
 
-X_train, X_val = X[train_mask], X[~train_mask]
-y_train, y_val = y[train_mask], y[~train_mask]
+def feature_key(ped: pd.DataFrame, cut_date: pd.Timestamp, encoding: str, pre=None) -> str:
+    """
+    Content hash of the raw training rows plus everything that shapes the
+    encoded matrices: feature config, validation cut and, when continuing,
+    the encoder that is reused.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    cols = ["Sensor_Name", "Sensing_Date", "HourDay", "Total_of_Directions"]
+    h.update(pd.util.hash_pandas_object(ped[cols], index=False).to_numpy().tobytes())
+    config = {"version": FEATURE_VERSION, "lags": LAGS, "num": FEATURES_NUM, "cat": FEATURES_CAT,
+              "cut": str(cut_date), "encoding": encoding}
+    if pre is not None:
+        config["encoder"] = as_encoder(pre).to_dict()
+    h.update(json.dumps(config, sort_keys=True).encode())
+    return h.hexdigest()
 
-print("Mean hourly count :", y_train.mean())
-print("Std hourly count :", y_train.std())
 
-# naive_pred = X_val['lag_1h'].values
-# naive_mae = mean_absolute_error(y_val, naive_pred)
-# print("Naive MAE (lag_1h):", naive_mae)
+def fit_encoder(train: pd.DataFrame, encoding: str):
+    """Fitted preprocessing for `encoding`; only dense keeps the sklearn ColumnTransformer."""
+    if encoding == "categorical":
+        return CategoricalEncoder.fit(train, FEATURES_NUM, FEATURES_CAT)
+    pre = ColumnTransformer(
+        transformers=[
+            ("num", StandardScaler(), FEATURES_NUM),
+            ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=encoding == "sparse"), FEATURES_CAT)
+        ]
+    )
+    pre.fit(train[FEATURES_NUM + FEATURES_CAT])  # statistics only; nothing is transformed here
+    return FeatureEncoder.from_column_transformer(pre, sparse=True) if encoding == "sparse" else pre
 
-naive_week = X_val['lag_168h'].values
-print("Naive 168h MAE:", mean_absolute_error(y_val, naive_week))
 
-demo = ped[ped['Sensor_Name'] == ped['Sensor_Name'].iloc[0]].head(6)
-print("Demo data (first 6 rows, one sensor):")
-print(demo[['HourDay', 'Total_of_Directions', 'lag_24h', 'lag_168h']])
+def encoding_of(pre) -> str:
+    if isinstance(pre, CategoricalEncoder):
+        return "categorical"
+    return "sparse" if getattr(pre, "sparse", False) else "dense"
 
-t0 = pd.Timestamp("2024-11-25 00:00")
-buffers = {}  # {sensor_name: {'lag': deque, 'roll': deque}}
-for sensor in ped['Sensor_Name'].unique():
-    hist = ped.loc[
-        (ped['Sensor_Name'] == sensor) &
-        (ped['Sensing_Date'] <= t0)  # inclusive of t0
-        ].sort_values('Sensing_Date').tail(168)  # last 168 rows
 
-    counts = hist['Total_of_Directions'].values
+def transform(pre, df: pd.DataFrame):
+    """
+    Model input for `df`: CSR for sparse, float32 arrays otherwise (XGBoost
+    works in float32 internally, so this halves memory without changing the model).
+    """
+    X = df[FEATURES_NUM + FEATURES_CAT]
+    if encoding_of(pre) == "sparse":
+        return pre.transform_csr(X)
+    return pre.transform(X).astype(np.float32, copy=False)
 
-    buffers[sensor] = {
-        'lag': deque(counts, maxlen=168),
-        # 'roll': deque(counts[-3:], maxlen=3)
+
+def encode(train: pd.DataFrame, val: pd.DataFrame, pre=None, encoding: str = DEFAULT_ENCODING):
+    """Fit the encoder on `train` (or reuse `pre`) and encode both splits."""
+    if pre is None:
+        pre = fit_encoder(train, encoding)
+    arrays = {
+        "X_train": transform(pre, train),
+        "y_train": train["Total_of_Directions"].to_numpy(dtype=np.float32),
+        "X_val": transform(pre, val),
+        "y_val": val["Total_of_Directions"].to_numpy(dtype=np.float32),
     }
+    return pre, arrays
+
+
+CACHE_ARRAYS = ("X_train", "y_train", "X_val", "y_val")
+
+
+def load_cached(key: str, cache_dir: Path = FEATURE_CACHE_DIR):
+    """(pre, arrays) cached under `key` (dense arrays memory-mapped), or None on a miss."""
+    from scipy import sparse
+
+    entry = Path(cache_dir) / key
+    if not (entry / "pre.joblib").exists():
+        return None
+    print(f"Feature cache hit: {entry}")
+    arrays = {}
+    for name in CACHE_ARRAYS:
+        path = entry / f"{name}.npz"
+        arrays[name] = sparse.load_npz(path) if path.exists() else np.load(entry / f"{name}.npy", mmap_mode="r")
+    return joblib.load(entry / "pre.joblib"), arrays
+
+
+def encode_cached(train: pd.DataFrame, val: pd.DataFrame, key: str, pre=None,
+                  encoding: str = DEFAULT_ENCODING, cache_dir: Path = FEATURE_CACHE_DIR):
+    """encode(), memoised on disk under `key`."""
+    from scipy import sparse
+
+    cached = load_cached(key, cache_dir)
+    if cached is not None:
+        return cached
+
+    entry = Path(cache_dir) / key
+    pre, arrays = encode(train, val, pre, encoding)
+    tmp = entry.with_name(entry.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for name in CACHE_ARRAYS:
+        if sparse.issparse(arrays[name]):
+            sparse.save_npz(tmp / f"{name}.npz", arrays[name], compressed=False)
+        else:
+            np.save(tmp / f"{name}.npy", arrays[name])
+    joblib.dump(pre, tmp / "pre.joblib")  # written last: marks the entry complete
+    tmp.rename(entry)
+    return pre, arrays
+
+
+def boost(arrays: dict, rounds: int, nthread: int, init_model: xgb.Booster | None = None,
+          feature_types: list[str] | None = None) -> xgb.Booster:
+    """
+    Build the training QuantileDMatrix once (the validation one shares its
+    bin boundaries) and boost up to `rounds` more rounds with early stopping.
+    `feature_types` ("q"/"c" per column) turns on native categorical splits.
+    """
+    dmatrix = {"nthread": nthread, "feature_types": feature_types, "enable_categorical": feature_types is not None}
+    dtrain = xgb.QuantileDMatrix(arrays["X_train"], arrays["y_train"], **dmatrix)
+    dval = xgb.QuantileDMatrix(arrays["X_val"], arrays["y_val"], ref=dtrain, **dmatrix)
+    return xgb.train(
+        {**XGB_PARAMS, "nthread": nthread},
+        dtrain,
+        num_boost_round=rounds,
+        evals=[(dval, "val")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        xgb_model=init_model,
+        verbose_eval=False,
+    )
+
+
+def as_regressor(booster: xgb.Booster) -> xgb.XGBRegressor:
+    """Wrap a Booster as the XGBRegressor the server loads (keeps best_iteration)."""
+    model = xgb.XGBRegressor()
+    model.load_model(bytearray(booster.save_raw("ubj")))
+    return model
+
+
+def save(pre, model: xgb.XGBRegressor, out_dir: Path = ARTIFACT_DIR):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    joblib.dump({"pre": pre, "model": model}, out_dir / BUNDLE_FILE)
+    export_native(pre, model, out_dir)
+
+
+# ------------------------------------------------------------------ runs ---
+def train(ped: pd.DataFrame, rounds: int = N_ROUNDS, nthread: int | None = None,
+          cut_date: pd.Timestamp = CUT_DATE_VAL, encoding: str = DEFAULT_ENCODING,
+          out_dir: Path = ARTIFACT_DIR, cache_dir: Path = FEATURE_CACHE_DIR):
+    """
+    Full fit: new encoder and a model boosted from scratch. On a feature cache
+    hit the features and encode stages are skipped.
+    """
+    nthread = nthread or os.cpu_count()
+    key = feature_key(ped, cut_date, encoding)
+    trained_through = ped.loc[(ped["Sensing_Date"] < cut_date).to_numpy(), "Sensing_Date"].max()
+    cached = load_cached(key, cache_dir)
+    if cached is None:
+        ped = make_features(ped)
+        train_df, val_df = split(ped, cut_date)
+        print("Mean hourly count :", train_df["Total_of_Directions"].mean())
+        print("Std hourly count :", train_df["Total_of_Directions"].std())
+        print("Naive 168h MAE:", mean_absolute_error(val_df["Total_of_Directions"], val_df["lag_168h"]))
+        cached = encode_cached(train_df, val_df, key, encoding=encoding, cache_dir=cache_dir)
+
+    pre, arrays = cached
+    booster = boost(arrays, rounds, nthread, feature_types=getattr(pre, "feature_types", None))
+    return finish(pre, booster, arrays, trained_through, out_dir)
+
+
+def continue_training(ped: pd.DataFrame, previous: dict, rounds: int = CONTINUE_ROUNDS,
+                      nthread: int | None = None, val_days: int = CONTINUE_VAL_DAYS,
+                      out_dir: Path = ARTIFACT_DIR, cache_dir: Path = FEATURE_CACHE_DIR):
+    """
+    Boost up to `rounds` more rounds on rows after the previous model's
+    trained_through date, reusing its encoder. `ped` must start at least a
+    week before that date so the lags of the new rows can be computed. The
+    last `val_days` days of new data are held out for early stopping.
+    """
+    nthread = nthread or os.cpu_count()
+    pre, booster = previous["pre"], previous["model"].get_booster()
+    trained_through = trained_through_of(previous["model"])
+    booster = booster[: previous["model"].best_iteration + 1]  # continue from the best round
+
+    ped = make_features(ped)
+    ped = ped[(ped["Sensing_Date"] > trained_through).to_numpy()]
+    if ped.empty:
+        raise SystemExit(f"No data after trained_through={trained_through.date()}")
+    cut_date = ped["Sensing_Date"].max() - pd.Timedelta(days=val_days - 1)
+    train_df, val_df = split(ped, cut_date)
+    if train_df.empty:
+        raise SystemExit(f"Fewer than {val_days} days of new data after {trained_through.date()}")
+    print(f"Continuing from {booster.num_boosted_rounds()} rounds on {len(train_df):,} new rows "
+          f"({trained_through.date()} .. {cut_date.date()}), validating on {len(val_df):,}")
+
+    encoding = encoding_of(pre)
+    pre, arrays = encode_cached(train_df, val_df, feature_key(ped, cut_date, encoding, pre), pre=pre,
+                                encoding=encoding, cache_dir=cache_dir)
+    booster = boost(arrays, rounds, nthread, init_model=booster, feature_types=getattr(pre, "feature_types", None))
+    return finish(pre, booster, arrays, train_df["Sensing_Date"].max(), out_dir)
+
+
+def trained_through_of(model: xgb.XGBRegressor) -> pd.Timestamp:
+    value = model.get_booster().attr("trained_through")
+    if value is None:
+        raise SystemExit("Model has no trained_through date (trained before it was recorded); "
+                         "run a full fit first")
+    return pd.Timestamp(value)
+
+
+def finish(pre, booster: xgb.Booster, arrays: dict, trained_through: pd.Timestamp, out_dir: Path):
+    """Record the last training date (validation rows were only used for early stopping) and save."""
+    booster.set_attr(trained_through=trained_through.date().isoformat())
+    model = as_regressor(booster)
+    print("Best iteration:", model.best_iteration)
+    print("Validation MAE:", mean_absolute_error(arrays["y_val"], model.predict(arrays["X_val"])))
+    save(pre, model, out_dir)
+    return pre, model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the pedestrian count model")
+    parser.add_argument("--continue-from", type=Path, metavar="ARTIFACT_DIR",
+                        help="boost more rounds on data after this model's trained_through date")
+    parser.add_argument("--rounds", type=int, help=f"max boosting rounds (default {N_ROUNDS}, "
+                                                   f"{CONTINUE_ROUNDS} when continuing)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                        help="feature encoding for a full fit (a continued fit keeps the previous one)")
+    parser.add_argument("--nthread", type=int, default=os.cpu_count())
+    parser.add_argument("--out-dir", type=Path, default=ARTIFACT_DIR)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.continue_from:
+        previous = read_artifacts(args.continue_from)
+        since = trained_through_of(previous["model"])
+        ped = load_counts(start=since - pd.Timedelta(days=max(LAGS) // 24 + 1))
+        continue_training(ped, previous, rounds=args.rounds or CONTINUE_ROUNDS,
+                          nthread=args.nthread, out_dir=args.out_dir)
+    else:
+        ped, _ = clean_data()
+        train(ped, rounds=args.rounds or N_ROUNDS, nthread=args.nthread, encoding=args.encoding,
+              out_dir=args.out_dir)
+    print(f"Done in {time.perf_counter() - t0:.1f}s")
 
 
-pre = ColumnTransformer(
-    transformers=[
-        ("num", StandardScaler(), FEATURES_NUM),
-        ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), FEATURES_CAT)
-    ]
-)
-
-X_train_enc = pre.fit_transform(X_train)   # fits on train
-X_val_enc = pre.transform(X_val)         # transform only
-
-model = xgb.XGBRegressor(
-    n_estimators=3000,
-    learning_rate=0.05,
-    max_depth=8,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    objective="reg:squarederror",
-    tree_method="hist",
-    random_state=24,
-    eval_metric="mae",
-    early_stopping_rounds=50
-)
-
-model.fit(
-    X_train_enc, y_train,
-    eval_set=[(X_val_enc, y_val)],
-    verbose=False,
-)
-print("Best iteration:", model.best_iteration)
-
-mae = mean_absolute_error(y_val, model.predict(X_val_enc))
-print("Validation MAE:", mae)
-
-# Save the model
-joblib.dump({"pre": pre, "model": model}, ARTIFACT_DIR / "ped_model.joblib")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+trees.py
+========
+The trained booster compiled to flat node arrays, scored with numpy:
+
+* compile_booster(booster, iteration_range=None) -> CompiledTrees
+* compile_model(model)      -> CompiledTrees   (XGBRegressor; its best_iteration, like model.predict)
+* CompiledTrees.predict(X)  -> np.ndarray (float32, same values as model.predict)
+
+XGBRegressor.predict has a fixed cost per call (input validation, a DMatrix,
+thread dispatch) of about a millisecond, well above the traversal itself for
+a few rows. Here all trees are walked together, one vectorised step per tree
+level, so a call on a handful of rows costs tens of microseconds.
+
+Splits follow XGBoost exactly: inputs are compared as float32 (go left when
+x < threshold), NaN follows the node's default direction, and categorical
+splits send the categories in the node's set right. A node's right child
+is the one after its left child (XGBoost allocates them in pairs), and a
+leaf is its own left child that no input sends right, so every row walks the
+same number of steps. Only single-output gbtree models with an identity or
+log link are supported; compile_booster raises NotImplementedError for
+anything else and callers keep the booster.
+"""
+
+import json
+
+import numpy as np
+
+# Objectives whose prediction is the margin itself, or exp(margin)
+IDENTITY_OBJECTIVES = frozenset({"reg:squarederror", "reg:squaredlogerror", "reg:absoluteerror",
+                                 "reg:pseudohubererror"})
+LOG_OBJECTIVES = frozenset({"count:poisson", "reg:gamma", "reg:tweedie"})
+
+_SPLIT_CATEGORICAL = 1
+
+
+class CompiledTrees:
+    """
+    Trees as flat arrays over all nodes: `feature`, `threshold`, `left`
+    (right is left + 1), `default_right`, `value` (leaf value, 0 inside) and
+    `roots`. Categorical splits index `categories`, one run of booleans
+    per categorical node starting at `cat_offset`.
+    """
+
+    def __init__(self, feature, threshold, left, default_right, value, roots, depth,
+                 base_margin, log_link, n_features, cat_offset=None, cat_size=None, categories=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.default_right = default_right
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_margin = base_margin
+        self.log_link = log_link
+        self.n_features = n_features
+        self.cat_offset = cat_offset
+        self.cat_size = cat_size
+        self.categories = categories
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _as_float32(self, X) -> np.ndarray:
+        from scipy import sparse
+
+        if sparse.issparse(X):
+            # XGBoost treats entries absent from a sparse matrix as missing, not zero
+            X = X.tocsr()
+            dense = np.full(X.shape, np.nan, dtype=np.float32)
+            dense[np.repeat(np.arange(X.shape[0]), np.diff(X.indptr)), X.indices] = X.data
+            X = dense
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got shape {X.shape}")
+        return X
+
+    def leaves(self, X) -> np.ndarray:
+        """Leaf node reached in every tree, shape (rows, trees)."""
+        X = self._as_float32(X)
+        n, width = X.shape
+        flat = X.ravel()
+        row_start = (np.arange(n, dtype=np.intp) * width)[:, None]
+        node = np.tile(self.roots, (n, 1))
+        # np.take into reused buffers; every index is valid by construction, so mode="clip"
+        # skips the bounds check that fancy indexing (and mode="raise") pays per element
+        index, x, threshold = np.empty_like(node), np.empty(node.shape, np.float32), np.empty(node.shape, np.float32)
+        has_missing = np.isnan(flat).any()
+        for _ in range(self.depth):
+            np.take(self.feature, node, out=index, mode="clip")
+            index += row_start
+            np.take(flat, index, out=x, mode="clip")
+            np.take(self.threshold, node, out=threshold, mode="clip")
+            right = x >= threshold  # False for NaN inputs and at leaves (NaN threshold)
+            if self.categories is not None:
+                self._categorical(node, x, right)
+            if has_missing:
+                missing = np.isnan(x)
+                right[missing] = self.default_right[node[missing]]
+            np.take(self.left, node, out=index, mode="clip")
+            np.add(index, right, out=node)
+        return node
+
+    def _categorical(self, node, x, right):
+        size = self.cat_size[node]
+        cat = size > 0
+        if not cat.any():
+            return
+        xc, sc = x[cat], size[cat]
+        valid = (xc >= 0) & (xc < sc)  # other codes (and NaN) go left, as in XGBoost
+        in_set = np.zeros(len(xc), dtype=bool)
+        in_set[valid] = self.categories[self.cat_offset[node[cat]][valid] + xc[valid].astype(np.intp)]
+        right[cat] = in_set
+
+    def predict_margin(self, X) -> np.ndarray:
+        return (self.base_margin + self.value[self.leaves(X)].sum(axis=1, dtype=np.float64)).astype(np.float32)
+
+    def predict(self, X) -> np.ndarray:
+        """Same as XGBRegressor.predict(X) (float32), without a DMatrix."""
+        margin = self.predict_margin(X)
+        return np.exp(margin) if self.log_link else margin
+
+
+def _base_score(learner: dict) -> float:
+    # "[3.29E2]" since XGBoost 3 (a vector, one per target), "3.29E2" before
+    return float(learner["learner_model_param"]["base_score"].strip("[]"))
+
+
+def compile_booster(booster, iteration_range: tuple[int, int] | None = None) -> CompiledTrees:
+    """
+    Compile the trees of `booster` in `iteration_range` (all by default).
+    Raises NotImplementedError for models this module cannot score exactly.
+    """
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in IDENTITY_OBJECTIVES | LOG_OBJECTIVES:
+        raise NotImplementedError(f"objective {objective!r} is not supported")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise NotImplementedError(f"booster {gbm['name']!r} is not supported")
+    if int(learner["learner_model_param"].get("num_target", "1")) > 1 \
+            or int(learner["learner_model_param"].get("num_class", "0")) > 1:
+        raise NotImplementedError("multi-output models are not supported")
+
+    trees = gbm["model"]["trees"]
+    indptr = gbm["model"].get("iteration_indptr") or list(range(len(trees) + 1))
+    begin, end = iteration_range or (0, len(indptr) - 1)
+    trees = trees[indptr[begin]:indptr[min(end, len(indptr) - 1)]]
+    if not trees:
+        raise NotImplementedError("no trees in the iteration range")
+
+    feature, threshold, left, default_right, value, roots = [], [], [], [], [], []
+    cat_offset, cat_size, categories = [], [], []
+    depth, offset, n_categories = 0, 0, 0
+    for tree in trees:
+        if int(tree["tree_param"].get("size_leaf_vector", "1")) > 1:
+            raise NotImplementedError("vector leaves are not supported")
+        left_child = np.asarray(tree["left_children"], dtype=np.int64)
+        leaf = left_child == -1
+        if (np.asarray(tree["right_children"])[~leaf] != left_child[~leaf] + 1).any():
+            raise NotImplementedError("tree with non-adjacent child nodes")
+        n_nodes = len(left_child)
+        nodes = np.arange(n_nodes)
+        split = np.asarray(tree["split_conditions"], dtype=np.float32)
+
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, tree["split_indices"]))
+        threshold.append(np.where(leaf, np.float32(np.nan), split))
+        left.append(np.where(leaf, nodes, left_child) + offset)
+        default_right.append(~np.asarray(tree["default_left"], dtype=bool) & ~leaf)
+        value.append(np.where(leaf, split, np.float32(0)))  # a leaf's value is in split_conditions
+
+        sizes = np.zeros(n_nodes, dtype=np.int64)
+        starts = np.zeros(n_nodes, dtype=np.int64)
+        split_type = np.asarray(tree["split_type"])
+        for node, segment, size in zip(tree["categories_nodes"], tree["categories_segments"],
+                                       tree["categories_sizes"]):
+            if split_type[node] != _SPLIT_CATEGORICAL:
+                continue
+            codes = np.asarray(tree["categories"][segment:segment + size], dtype=np.int64)
+            width = int(codes.max()) + 1 if size else 1
+            in_set = np.zeros(width, dtype=bool)
+            in_set[codes] = True
+            sizes[node], starts[node] = width, n_categories
+            categories.append(in_set)
+            n_categories += width
+        cat_size.append(sizes)
+        cat_offset.append(starts)
+
+        parents = np.asarray(tree["parents"], dtype=np.int64)
+        node_depth = np.zeros(n_nodes, dtype=np.int64)
+        for node in range(1, n_nodes):  # parents come before their children
+            node_depth[node] = node_depth[parents[node]] + 1
+        depth = max(depth, int(node_depth.max()))
+        offset += n_nodes
+
+    base = _base_score(learner)
+    log_link = objective in LOG_OBJECTIVES
+    return CompiledTrees(
+        feature=np.concatenate(feature).astype(np.intp),
+        threshold=np.concatenate(threshold).astype(np.float32),
+        left=np.concatenate(left).astype(np.intp),
+        default_right=np.concatenate(default_right),
+        value=np.concatenate(value).astype(np.float32),
+        roots=np.asarray(roots, dtype=np.intp),
+        depth=depth,
+        base_margin=float(np.float32(np.log(base) if log_link else base)),
+        log_link=log_link,
+        n_features=int(learner["learner_model_param"]["num_feature"]),
+        cat_offset=np.concatenate(cat_offset).astype(np.intp) if categories else None,
+        cat_size=np.concatenate(cat_size).astype(np.float32) if categories else None,
+        categories=np.concatenate(categories) if categories else None,
+    )
+
+
+def compile_model(model) -> CompiledTrees:
+    """Compile an XGBRegressor as its predict() scores: up to best_iteration when set."""
+    booster = model.get_booster()
+    best = booster.attr("best_iteration")
+    return compile_booster(booster, None if best is None else (0, int(best) + 1))
@@ -0,0 +1,355 @@
+"""
+upstream.py
+===========
+Pooled async access to the City of Melbourne opendatasoft API:
+
+* UpstreamClient            -> keep-alive httpx client + concurrency cap + circuit breaker
+                               (lag lookups answered from one query per hour for all sensors)
+* LagCache                  -> LRU cache of lag lookups keyed by (sensor, target hour)
+* open_client() / close_client() / current_client()   (app lifespan)
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import HTTPException
+
+from src.breaker import CircuitBreaker
+from src.coalesce import SingleFlight
+from src.metrics import UPSTREAM_REQUESTS
+
+# Ensure this is your current v2.1 records endpoint
+CITY_API_URL = (
+    "https://melbournetestbed.opendatasoft.com/"
+    "api/explore/v2.1/catalog/"
+    "datasets/pedestrian-counting-system-monthly-counts-per-hour/records"
+)
+
+# Fail fast when the host is unreachable, but give slow queries time to answer
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 10.0
+
+# All requests go to one host, so the pool limits are effectively per-host limits
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30.0
+
+# Upper bound on upstream requests in flight from this process
+MAX_CONCURRENCY = 16
+
+# v2.1 records endpoint paging limits
+PAGE_SIZE = 100
+MAX_RECORDS = 10_000  # offset + limit may not go past this
+
+# Fields requested by the per-hour bulk query
+HOUR_FIELDS = "sensor_name,pedestriancount"
+
+# ~100 sensors x 2 lags x 168 hours fits with room to spare
+LAG_CACHE_SIZE = 65_536
+# "No data" answers are retried after this many seconds (the hour may get published)
+NEGATIVE_TTL = 300.0
+
+# Upstream answers that count as failures for the circuit breaker (plus no answer at all)
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+_MISSING = object()
+
+
+class LagCache:
+    """
+    Bounded LRU cache of upstream lag lookups keyed by (sensor, target hour).
+
+    A published hourly count never changes, so found values stay until LRU
+    eviction. "No data" results are cached as None for `negative_ttl` seconds,
+    and so is every sensor missing from an hour stored with put_hour().
+    `hits` and `misses` count lookups.
+    """
+
+    def __init__(self, maxsize: int = LAG_CACHE_SIZE, negative_ttl: float = NEGATIVE_TTL,
+                 clock=time.monotonic):
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()  # key -> (value | None, expires_at | None)
+        self._hours: OrderedDict = OrderedDict()  # complete hour -> (sensors in it, expires_at of "no data")
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, sensor: str, target: datetime):
+        """Cached count, None for a cached "no data", or _MISSING."""
+        key = (sensor, target)
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]  # expired negative entry
+        hour = self._hours.get(target)
+        if hour is not None:
+            present, expires_at = hour
+            if expires_at <= self._clock():
+                del self._hours[target]
+            elif sensor not in present:
+                self.hits += 1
+                return None  # the hour was fetched for every sensor, and this one was not in it
+            # else: the sensor had a count, evicted since; a miss like any other
+        self.misses += 1
+        return _MISSING
+
+    def peek(self, sensor: str, target: datetime) -> float | None:
+        """Cached count for (sensor, target) or None; not counted and no LRU update."""
+        entry = self._data.get((sensor, target))
+        return entry[0] if entry is not None else None
+
+    def put(self, sensor: str, target: datetime, value: float | None):
+        expires_at = None if value is not None else self._clock() + self.negative_ttl
+        self._data[(sensor, target)] = (value, expires_at)
+        self._data.move_to_end((sensor, target))
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def put_hour(self, target: datetime, counts: dict[str, float]):
+        """Every sensor's count for hour `target`; sensors not in `counts` have no data."""
+        for sensor, value in counts.items():
+            self.put(sensor, target, value)
+        self._hours[target] = (frozenset(counts), self._clock() + self.negative_ttl)
+        self._hours.move_to_end(target)
+        while len(self._hours) > self.maxsize:
+            self._hours.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+# Shared by every client in this process
+LAG_CACHE = LagCache()
+
+
+def _no_data(sensor: str, target: datetime, hours_back: int) -> HTTPException:
+    return HTTPException(
+        status_code=404,  # Not Found, as no data matches the query
+        detail=f"No data returned from external API for {hours_back}h lag. Sensor: {sensor}, Target time: {target.isoformat()}"
+    )
+
+
+class UpstreamClient:
+    """
+    Shared httpx.AsyncClient with connection pooling and a semaphore that caps
+    the number of concurrent upstream requests. Lag lookups go through `cache`
+    when one is given. Use as an async context manager or call `aclose()`.
+
+    With `bulk` (the default) a lag lookup fetches the target hour for every
+    sensor with one paged query; concurrent lookups of the same hour, for any
+    sensor, share it and every sensor's value lands in the cache. Without
+    `bulk` each (sensor, hour) is a single-row query.
+
+    Requests go through `breaker`: while it is open they fail at once with a
+    503 instead of waiting on upstream timeouts.
+    """
+
+    def __init__(self, url: str = CITY_API_URL,
+                 max_concurrency: int = MAX_CONCURRENCY,
+                 transport: httpx.AsyncBaseTransport | None = None,
+                 cache: LagCache | None = None,
+                 bulk: bool = True,
+                 breaker: CircuitBreaker | None = None):
+        self.url = url
+        self.cache = cache
+        self.bulk = bulk
+        self.breaker = breaker or CircuitBreaker()
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            transport=transport,
+        )
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self.lag_flight = SingleFlight()   # (sensor, hour) -> single-row query
+        self.hour_flight = SingleFlight()  # hour -> bulk query for all sensors
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def get_records(self, params: dict) -> tuple[list, httpx.Response]:
+        """
+        GET the records endpoint and return (results, response).
+        Upstream failures are raised as HTTPException, as is an open breaker (503).
+        """
+        if not self.breaker.allow():
+            raise HTTPException(
+                status_code=503,  # Service Unavailable
+                detail="External API unavailable: circuit breaker open after repeated failures"
+            )
+        success = None  # stays None if the call is cancelled
+        try:
+            async with self._limit:
+                resp = await self.http.get(self.url, params=params)
+            UPSTREAM_REQUESTS.inc(str(resp.status_code))
+            success = resp.status_code not in RETRYABLE_STATUS
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:  # Catch HTTPStatusError for more specific details
+            error_detail = f"External API error: Status {e.response.status_code} - {e.response.text}"
+            # Attempt to parse JSON error from response if possible
+            try:
+                error_content = e.response.json()
+                error_detail = f"External API error: {error_content}"
+            except ValueError:  # response is not JSON
+                pass  # use the text version
+            raise HTTPException(status_code=e.response.status_code, detail=error_detail)
+        except httpx.RequestError as e:  # connect/read timeouts, DNS, refused connections
+            UPSTREAM_REQUESTS.inc("error")
+            success = False
+            raise HTTPException(
+                status_code=503,  # Service Unavailable
+                detail=f"Failed to connect to external API: {e!r}"
+            )
+        finally:
+            self.breaker.record(success)
+
+        try:
+            return resp.json().get("results", []), resp  # v2.1 uses "results"
+        except (ValueError, AttributeError) as e:
+            raise HTTPException(
+                status_code=502,  # Bad Gateway
+                detail=f"Unexpected response format from external API: {e}. Response: {resp.text[:200]}"
+            )
+
+    async def get_all_records(self, params: dict, page_size: int = PAGE_SIZE) -> list:
+        """
+        All records matching `params` (a `where`/`refine` query), up to MAX_RECORDS.
+        The first page reports `total_count`; the remaining pages are fetched
+        concurrently under the client's concurrency cap.
+        """
+        first, resp = await self.get_records({**params, "limit": page_size, "offset": 0})
+        try:
+            total = min(int(resp.json().get("total_count", len(first))), MAX_RECORDS)
+        except (ValueError, TypeError):
+            total = len(first)
+
+        pages = await asyncio.gather(*(
+            self.get_records({**params, "limit": min(page_size, total - offset), "offset": offset})
+            for offset in range(page_size, total, page_size)
+        ))
+        records = list(first)
+        for results, _ in pages:
+            records.extend(results)
+        return records
+
+    async def get_lag(self, sensor: str, current_ts: datetime, hours_back: int) -> float:
+        """Hourly count for `sensor` at `current_ts - hours_back`."""
+        target = current_ts - timedelta(hours=hours_back)
+
+        if self.cache is not None:
+            cached = self.cache.get(sensor, target)
+            if cached is not _MISSING:
+                if cached is None:
+                    raise _no_data(sensor, target, hours_back)
+                return cached
+
+        if not self.bulk:
+            return await self.lag_flight.do((sensor, target), lambda: self._fetch_lag(sensor, target, hours_back))
+
+        value = (await self.get_hour(target)).get(sensor)
+        if value is None:
+            raise _no_data(sensor, target, hours_back)  # cached with the hour by _fetch_hour
+        return value
+
+    async def get_hour(self, target: datetime) -> dict[str, float]:
+        """
+        Every sensor's count for hour `target` ({sensor: count}), from one
+        refine query paged with limit/offset. Concurrent calls for the same
+        hour share the query.
+        """
+        return await self.hour_flight.do(target, lambda: self._fetch_hour(target))
+
+    async def _fetch_hour(self, target: datetime) -> dict[str, float]:
+        records = await self.get_all_records({
+            "select": HOUR_FIELDS,
+            "refine.sensing_date": target.strftime("%Y-%m-%d"),
+            "refine.hourday": str(target.hour),
+        })
+        counts = {}
+        for record in records:
+            try:
+                if record["pedestriancount"] is not None:
+                    counts[record["sensor_name"]] = float(record["pedestriancount"])
+            except (ValueError, KeyError, TypeError) as e:
+                raise HTTPException(
+                    status_code=502,  # Bad Gateway
+                    detail=f"Unexpected response format from external API: {e}. Record: {str(record)[:200]}"
+                )
+        if self.cache is not None:
+            self.cache.put_hour(target, counts)
+        return counts
+
+    async def _fetch_lag(self, sensor: str, target: datetime, hours_back: int) -> float:
+        api_params = {
+            "refine.sensing_date": target.strftime("%Y-%m-%d"),
+            "refine.hourday": str(target.hour),
+            "refine.sensor_name": sensor,
+            "limit": 1,
+        }
+        results, resp = await self.get_records(api_params)
+
+        if not results:
+            # It's possible the API returns 200 OK with empty results if no data matches
+            if self.cache is not None:
+                self.cache.put(sensor, target, None)
+            raise _no_data(sensor, target, hours_back)
+        try:
+            value = float(results[0]["pedestriancount"])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise HTTPException(
+                status_code=502,  # Bad Gateway
+                detail=f"Unexpected response format from external API: {e}. Response: {resp.text[:200]}"  # Log part of response
+            )
+        if self.cache is not None:
+            self.cache.put(sensor, target, value)
+        return value
+
+
+# Process-wide client, opened and closed by the FastAPI lifespan
+_CLIENT: UpstreamClient | None = None
+
+
+def open_client(**kwargs) -> UpstreamClient:
+    global _CLIENT
+    if _CLIENT is None:
+        kwargs.setdefault("cache", LAG_CACHE)
+        _CLIENT = UpstreamClient(**kwargs)
+    return _CLIENT
+
+
+async def close_client():
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def current_client() -> UpstreamClient | None:
+    return _CLIENT
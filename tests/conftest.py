@@ -0,0 +1,16 @@
+import pytest
+
+
+class FakeClock:
+    """Monotonic clock for code that takes a `clock` callable; set `now` to move time."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
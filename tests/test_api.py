@@ -1,58 +1,97 @@
 # tests/test_api.py
+import asyncio
+
+import httpx
 import pytest
-import requests
 from fastapi import HTTPException
 from datetime import datetime
 from src.api import fetch_live_lags_from_external_api, CITY_API_URL
+from src.upstream import UpstreamClient
+
+
+def make_client(handler, **kwargs):
+    return UpstreamClient(transport=httpx.MockTransport(handler), **kwargs)
 
 
 @pytest.mark.asyncio
-async def test_fetch_live_lags_success(monkeypatch):
+async def test_fetch_live_lags_success():
     # Fake a 200 OK response with the expected JSON payload
-    class FakeResponse:
-        status_code = 200
-        text = "OK"
-        def raise_for_status(self):
-            pass
-        def json(self):
-            return {"lag_24h": 12.5, "lag_168h": 100.0}
-
-    def fake_get(url, params, timeout):
-        # Optionally assert that the URL and params are what you expect
-        assert url == CITY_API_URL
-        assert params["sensing_date"] == "2024-01-01"
-        assert params["hourday"] == 0
-        assert params["sensor_name"] == "sensorX"
-        return FakeResponse()
-
-    monkeypatch.setattr(requests, "get", fake_get)
+    def handler(request):
+        assert str(request.url).startswith(CITY_API_URL)
+        params = request.url.params
+        assert "refine.sensor_name" not in params  # one query per hour, for all sensors
+        assert params["refine.hourday"] == "0"
+        count = 12.5 if params["refine.sensing_date"] == "2023-12-31" else 100.0
+        return httpx.Response(200, json={"total_count": 2, "results": [
+            {"sensor_name": "sensorX", "pedestriancount": count},
+            {"sensor_name": "sensorW", "pedestriancount": 1},
+        ]})
+
     ts = datetime(2024, 1, 1)  # no tzinfo needed for formatting YYYY-MM-DD / hour
-    result = await fetch_live_lags_from_external_api("sensorX", ts)
+    async with make_client(handler) as client:
+        result = await fetch_live_lags_from_external_api("sensorX", ts, client)
     assert result == {"lag_24h": 12.5, "lag_168h": 100.0}
 
+
 @pytest.mark.asyncio
-async def test_fetch_live_lags_http_error(monkeypatch):
+async def test_fetch_live_lags_http_error():
     # Fake a downstream API returning a 4xx/5xx
-    class BadResponse:
-        status_code = 404
-        text = "Not Found"
-        def raise_for_status(self):
-            raise requests.HTTPError("404 Client Error")
-    monkeypatch.setattr(requests, "get", lambda url, params, timeout: BadResponse())
-
-    with pytest.raises(HTTPException) as exc:
-        await fetch_live_lags_from_external_api("sensorY", datetime(2024, 1, 2))
+    handler = lambda request: httpx.Response(404, text="Not Found")
+
+    async with make_client(handler) as client:
+        with pytest.raises(HTTPException) as exc:
+            await fetch_live_lags_from_external_api("sensorY", datetime(2024, 1, 2), client)
     assert exc.value.status_code == 404
     assert "External API error" in exc.value.detail
 
+
+@pytest.mark.asyncio
+async def test_fetch_live_lags_no_results():
+    handler = lambda request: httpx.Response(200, json={"results": []})
+
+    async with make_client(handler) as client:
+        with pytest.raises(HTTPException) as exc:
+            await fetch_live_lags_from_external_api("sensorY", datetime(2024, 1, 2), client)
+    assert exc.value.status_code == 404
+    assert "No data returned" in exc.value.detail
+
+
 @pytest.mark.asyncio
-async def test_fetch_live_lags_network_error(monkeypatch):
+async def test_fetch_live_lags_network_error():
     # Fake a network-level failure (timeout, DNS, etc.)
-    def fake_get(url, params, timeout):
-        raise requests.RequestException("Network down")
-    monkeypatch.setattr(requests, "get", fake_get)
+    def handler(request):
+        raise httpx.ConnectError("Network down", request=request)
 
-    with pytest.raises(HTTPException) as exc:
-        await fetch_live_lags_from_external_api("sensorZ", datetime(2024, 1, 3))
+    async with make_client(handler) as client:
+        with pytest.raises(HTTPException) as exc:
+            await fetch_live_lags_from_external_api("sensorZ", datetime(2024, 1, 3), client)
     assert exc.value.status_code == 503
-    assert "Failed to connect" in exc.value.detail
\ No newline at end of file
+    assert "Failed to connect" in exc.value.detail
+
+
+@pytest.mark.asyncio
+async def test_fetch_live_lags_concurrent_and_capped():
+    # Both lags are requested at the same time, but never more than the cap
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"results": [
+            {"sensor_name": f"sensor{i}", "pedestriancount": 1} for i in [*range(5), "X"]
+        ]})
+
+    async with make_client(handler, max_concurrency=3) as client:
+        await fetch_live_lags_from_external_api("sensorX", datetime(2024, 1, 3), client)
+        assert peak == 2
+
+        peak = 0
+        await asyncio.gather(*(
+            fetch_live_lags_from_external_api(f"sensor{i}", datetime(2024, 1, 3 + i), client)
+            for i in range(5)  # distinct hours: ten bulk queries
+        ))
+        assert peak == 3
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from src import backtest
+from tests.test_train import counts_frame
+
+
+def test_fold_cuts_and_bounds():
+    cuts = backtest.fold_cuts(pd.Timestamp("2024-12-09"), n_folds=3)
+    assert cuts == [pd.Timestamp("2024-10-01"), pd.Timestamp("2024-11-01"), pd.Timestamp("2024-12-01")]
+
+    days = pd.date_range("2024-09-01", "2024-12-09").to_numpy().astype("datetime64[D]").repeat(2)
+    start, es, test, end = backtest.fold_bounds(days, cuts[1], early_stop_days=14)
+    assert days[start] == np.datetime64("2024-09-01") and days[es] == np.datetime64("2024-10-18")
+    assert days[test] == np.datetime64("2024-11-01") and days[end - 1] == np.datetime64("2024-11-30")
+
+
+def test_row_slice_shares_memory():
+    X = sparse.random(50, 8, density=0.3, format="csr", random_state=0, dtype=np.float32)
+    part = backtest.row_slice(X, 10, 30)
+    assert (part != X[10:30]).nnz == 0
+    assert np.shares_memory(part.data, X.data)
+    dense = X.toarray()
+    assert np.shares_memory(backtest.row_slice(dense, 10, 30), dense)
+
+
+@pytest.mark.parametrize("encoding", ["sparse", "categorical"])
+def test_backtest_parallel_matches_serial(tmp_path, encoding):
+    ped = counts_frame()  # 2024-10-01 .. 2024-12-09
+    kwargs = {"n_folds": 2, "rounds": 15, "encoding": encoding}
+    serial, per_sensor = backtest.backtest(ped.copy(), workers=1, out_dir=tmp_path / "serial", **kwargs)
+    parallel, _ = backtest.backtest(ped.copy(), workers=2, out_dir=tmp_path / "parallel", **kwargs)
+
+    assert list(serial["cut"]) == [pd.Timestamp("2024-11-01"), pd.Timestamp("2024-12-01")]
+    assert serial["n_test"].tolist() == [30 * 24 * 3, 9 * 24 * 3]
+    assert serial["mae"].tolist() == pytest.approx(parallel["mae"].tolist())
+    assert sorted(per_sensor["sensor"].unique()) == ["A", "B", "C"]
+    # per-sensor tables add up to the fold totals
+    weighted = per_sensor.assign(err=per_sensor["mae"] * per_sensor["n"]).groupby("fold")["err"].sum()
+    assert (weighted / serial["n_test"]).tolist() == pytest.approx(serial["mae"].tolist())
+
+    written = pd.read_parquet(tmp_path / "serial" / "per_sensor.parquet")
+    assert len(written) == len(per_sensor) == 6
+    assert not (tmp_path / "serial" / "_work").exists()
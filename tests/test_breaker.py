@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import api, hourly, upstream
+from src.breaker import CircuitBreaker
+from src.inference import init_buffers
+
+
+def test_breaker_trips_probes_and_closes(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, open_seconds=30, clock=clock)
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == "closed"  # fewer than min_calls
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 30
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()  # one probe at a time
+    breaker.record(False)
+    assert breaker.state == "open"  # failed probe reopens
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record(None)  # cancelled probe: slot freed, state unchanged
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.stats() == {"state": "closed", "recent_failure_rate": 0.0, "opened": 2, "rejected": 2}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Two weeks of buffered counts for X, except the two hours /predict needs as lags."""
+    monkeypatch.setattr(hourly, "TABLE", None)
+    cache = upstream.LagCache()
+    monkeypatch.setattr(api, "LAG_CACHE", cache)
+    now = hourly.current_hour()
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=336, freq="h")
+    df = pd.DataFrame({"Sensor_Name": "X", "Sensing_Date": dates, "Total_of_Directions": 1000 + np.arange(336.0)})
+    init_buffers(df[~df["Sensing_Date"].isin([now - timedelta(hours=24), now - timedelta(hours=168)])])
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_predict_degrades_while_upstream_is_down(cache):
+    now = hourly.current_hour()
+    requests = 0
+
+    def handler(request):
+        nonlocal requests
+        requests += 1
+        raise httpx.ConnectError("upstream down", request=request)
+
+    upstream.open_client(transport=httpx.MockTransport(handler), cache=cache,
+                         breaker=CircuitBreaker(min_calls=2, window=4))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            responses = [await client.get("/predict", params={"sensor": "X"}) for _ in range(5)]
+            missing = await client.get("/predict", params={"sensor": "never-buffered"})
+            stats = (await client.get("/stats")).json()
+    finally:
+        await upstream.close_client()
+
+    assert all(r.status_code == 200 and r.json()["degraded"] for r in responses)
+    assert requests == 2  # the breaker opened after the first /predict's two failed lookups
+    assert missing.status_code == 503 and "circuit breaker open" in missing.json()["detail"]
+    assert stats["upstream_breaker"]["state"] == "open"
+
+    # fallback lags are the same hour one day (lag_24h) or one week (lag_168h) earlier
+    assert api.fallback_lags("X", now) == {"lag_24h": 1288.0, "lag_168h": 1000.0}
+
+
+@pytest.mark.asyncio
+async def test_predict_degrades_while_upstream_rate_limits(cache):
+    upstream.open_client(transport=httpx.MockTransport(lambda request: httpx.Response(429, text="slow down")),
+                         cache=cache)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+            resp = await client.get("/predict", params={"sensor": "X"})
+    finally:
+        await upstream.close_client()
+    assert resp.status_code == 200 and resp.json()["degraded"]
@@ -0,0 +1,122 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.buffers import (MISSING_COUNT, LagRing, SharedLagRing, frame_hours, read_snapshot,
+                         write_snapshot)
+
+
+def test_shared_ring_matches_lag_ring(tmp_path):
+    shared = SharedLagRing(tmp_path / "ring.bin", capacity=48, max_sensors=4, create=True)
+    plain = LagRing(capacity=48)
+    for ring in (shared, plain):
+        ring.write(["B", "A", "B"], [100, 100, 130], [1.0, 2.0, 3.0])
+        ring.write(["C"], [150], [4.0])  # advances the window past hour 100
+
+    assert sorted(shared) == sorted(plain) == ["A", "B", "C"]
+    assert shared.latest == plain.latest == 150
+    np.testing.assert_array_equal(shared.window(["A", "B", "C", "Z"], 100, 51),
+                                  plain.window(["A", "B", "C", "Z"], 100, 51))
+    assert shared.get("B", 130) == 3.0 and shared.get("B", 100) is None
+
+    with pytest.raises(ValueError):
+        shared.write(["D", "E"], [151, 151], [0.0, 0.0])  # more than max_sensors
+
+
+def _write_in_child(path):
+    ring = SharedLagRing(path)
+    ring.write(["X", "Y"], [10, 10], [7.0, 8.0])
+
+
+def test_shared_ring_visible_across_processes(tmp_path):
+    path = tmp_path / "ring.bin"
+    reader = SharedLagRing(path, capacity=24, create=True)
+    reader.write(["A"], [9], [1.0])
+
+    child = multiprocessing.get_context("fork").Process(target=_write_in_child, args=(path,))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+
+    assert len(reader) == 3 and reader.latest == 10
+    assert reader.get("X", 10) == 7.0 and reader.get("A", 9) == 1.0
+
+    # checkpoints are interchangeable with LagRing's
+    reader.save(tmp_path / "ckpt.npz")
+    attached = SharedLagRing(tmp_path / "other.bin", capacity=24, create=True)
+    attached.load(tmp_path / "ckpt.npz")
+    plain = LagRing(capacity=24)
+    plain.load(tmp_path / "ckpt.npz")
+    np.testing.assert_array_equal(attached.window(["A", "X", "Y"], 0, 11), plain.window(["A", "X", "Y"], 0, 11))
+
+
+def test_snapshot_round_trip(tmp_path):
+    dates = pd.date_range("2025-04-01", periods=200, freq="h")
+    df = pd.DataFrame({
+        "Sensor_Name": np.repeat(["B", "A"], 200),
+        "Sensing_Date": np.tile(dates, 2),
+        "Total_of_Directions": np.arange(400),
+    }).drop(index=[5, 250])  # a gap in each sensor
+    df = pd.concat([df, pd.DataFrame({"Sensor_Name": ["old"], "Sensing_Date": [dates[0]],
+                                      "Total_of_Directions": [1]})])  # outside the last 168 hours
+
+    assert write_snapshot(df, tmp_path / "snap") == (2, 168)
+    sensors, base_hour, counts = read_snapshot(tmp_path / "snap")
+    newest = int(frame_hours(df).max())
+    assert sensors == ["A", "B"] and base_hour == newest - 167
+    assert isinstance(counts, np.memmap) and counts.dtype == np.int32
+    assert counts[0, 50 - 32] == MISSING_COUNT  # A at dates[50] (row 250); column 0 is dates[32]
+
+    expected = LagRing(capacity=336)
+    expected.write(df["Sensor_Name"].to_numpy(), frame_hours(df), df["Total_of_Directions"].to_numpy())
+    for ring in (LagRing(capacity=336), SharedLagRing(tmp_path / "ring.bin", capacity=336, create=True)):
+        ring.write(["stale"], [1], [1.0])  # replaced by the load
+        ring.load_snapshot(tmp_path / "snap")
+        assert sorted(ring) == ["A", "B"] and ring.latest == newest
+        np.testing.assert_array_equal(ring.window(["A", "B"], base_hour, 168),
+                                      expected.window(["A", "B"], base_hour, 168))
+
+
+def test_snapshot_rewrite_swaps_counts_and_meta_together(tmp_path):
+    dates = pd.date_range("2025-04-01", periods=10, freq="h")
+
+    def frame(names):
+        return pd.DataFrame({"Sensor_Name": np.repeat(names, 10), "Sensing_Date": np.tile(dates, len(names)),
+                             "Total_of_Directions": np.arange(10 * len(names))})
+
+    write_snapshot(frame(["A"]), tmp_path, hours=10)
+    _, _, old = read_snapshot(tmp_path)
+    write_snapshot(frame(["A", "B"]), tmp_path, hours=10)
+    write_snapshot(frame(["A", "B", "C"]), tmp_path, hours=10)
+
+    sensors, _, counts = read_snapshot(tmp_path)
+    assert sensors == ["A", "B", "C"] and counts.shape == (3, 10)
+    assert old.shape == (1, 10) and old[0, 9] == 9  # a reader's mapping survives later writes
+    assert sorted(p.name for p in tmp_path.glob("counts-*.npy")) == ["counts-2.npy", "counts-3.npy"]
+
+
+def test_readers_in_other_threads_see_a_consistent_ring():
+    ring = LagRing(capacity=24)
+    errors, done = [], threading.Event()
+
+    def read():
+        while not done.is_set():
+            try:
+                sensors = sorted(ring)
+                ring.window(sensors, ring.latest - 23, 24)
+            except Exception as e:  # IndexError / "dictionary changed size during iteration"
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for t in readers:
+        t.start()
+    for i in range(3000):
+        ring.write([f"S{i:04d}"], [100], [float(i)])
+    done.set()
+    for t in readers:
+        t.join()
+    assert not errors and len(ring) == 3000
@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from src import api
+from src.coalesce import MicroBatcher, SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_result_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "bad":
+            raise HTTPException(status_code=404, detail="no data")
+        return value
+
+    results = await asyncio.gather(*(flight.do("k", lambda: work("v")) for _ in range(5)),
+                                   flight.do("other", lambda: work("w")))
+    assert results == ["v"] * 5 + ["w"]
+    assert calls == ["v", "w"]
+    assert flight.stats()["shared"] == 4 and flight.stats()["in_flight"] == 0
+
+    failures = await asyncio.gather(*(flight.do("b", lambda: work("bad")) for _ in range(3)),
+                                    return_exceptions=True)
+    assert all(isinstance(e, HTTPException) and e.status_code == 404 for e in failures)
+    assert calls.count("bad") == 1
+
+    # done tasks are not cached: the next call does the work again
+    assert await flight.do("k", lambda: work("v")) == "v"
+    assert calls.count("v") == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_a_cancelled_caller():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 1
+
+    first = asyncio.ensure_future(flight.do("k", work))
+    second = asyncio.ensure_future(flight.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 1
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_groups_concurrent_items():
+    seen = []
+
+    def double(items):
+        seen.append(list(items))
+        return [2 * i for i in items]
+
+    batcher = MicroBatcher(double, window=0.01, max_batch=4)
+    assert await asyncio.gather(*(batcher.submit(i) for i in range(6))) == [0, 2, 4, 6, 8, 10]
+    assert seen == [[0, 1, 2, 3], [4, 5]]  # full batch flushed at once, the rest after the window
+    assert batcher.stats() == {"batches": 2, "items": 6, "mean_batch_size": 3.0, "largest_batch": 4}
+
+    failing = MicroBatcher(lambda items: 1 / 0, window=0.001)
+    with pytest.raises(ZeroDivisionError):
+        await failing.submit(1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_predicts_are_coalesced_and_batched(mocker, monkeypatch):
+    monkeypatch.setattr(api, "PREDICT_FLIGHT", SingleFlight())
+    monkeypatch.setattr(api, "PREDICT_BATCHER", MicroBatcher(api.predict_items, window=0.02))
+    monkeypatch.setattr(api, "buffer_lags", lambda sensor, ts: {})
+
+    async def fake_fetch(sensor, current_ts, **kwargs):
+        await asyncio.sleep(0.01)
+        return {"lag_24h": 100.0, "lag_168h": 150.0}
+    fetch = mocker.patch("src.api.fetch_live_lags_from_external_api", side_effect=fake_fetch)
+    predict_batch = mocker.spy(api.inference, "predict_batch")
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+        sensors = ["A"] * 10 + ["B"] * 5 + ["C"]
+        responses = await asyncio.gather(*(client.get("/predict", params={"sensor": s}) for s in sensors))
+        stats = (await client.get("/stats")).json()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert fetch.call_count == 3  # one lag fetch per distinct sensor
+    assert predict_batch.call_count == 1 and sorted(predict_batch.call_args.args[0]) == ["A", "B", "C"]
+    assert stats["predict_coalescing"]["shared"] == 13
+    assert stats["predict_batching"]["largest_batch"] == 3
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta, timezone
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from src import inference
+from src.encoder import CategoricalEncoder, FeatureEncoder, as_encoder, load_encoder
+
+AEST = timezone(timedelta(hours=10))
+FEATURES_NUM = ["HourDay", "lag_24h", "lag_168h"]
+FEATURES_CAT = ["Sensor_Name", "is_holiday", "is_lockdown", "day_of_week"]
+
+
+@pytest.fixture
+def fitted_pre():
+    # Same layout as src/train.py; is_holiday is bool there, as add_is_holiday returns it
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({
+        "HourDay": rng.integers(0, 24, n),
+        "lag_24h": rng.integers(0, 2000, n).astype(float),
+        "lag_168h": rng.integers(0, 2000, n).astype(float),
+        "Sensor_Name": rng.choice(["A", "B", "C", "D"], n),
+        "is_holiday": rng.random(n) < 0.05,
+        "is_lockdown": (rng.random(n) < 0.1).astype("int8"),
+        "day_of_week": rng.choice(["Monday", "Tuesday", "Saturday", "Sunday"], n),
+    })
+    pre = ColumnTransformer([
+        ("num", StandardScaler(), FEATURES_NUM),
+        ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), FEATURES_CAT),
+    ])
+    pre.fit(df)
+    return pre
+
+
+@pytest.fixture
+def use_pre(fitted_pre, monkeypatch):
+    monkeypatch.setattr(inference, "PRE", fitted_pre)
+    monkeypatch.setattr(inference, "ENCODER", FeatureEncoder.from_column_transformer(fitted_pre))
+    return fitted_pre
+
+
+@pytest.mark.parametrize("ts", [
+    datetime(2025, 1, 1, 12, tzinfo=AEST),   # holiday
+    datetime(2021, 8, 10, 7, tzinfo=AEST),   # lockdown
+    datetime(2025, 4, 15, 23, tzinfo=AEST),  # weekday unseen in training
+    datetime(2025, 4, 19, 0),                # naive timestamp
+])
+def test_encode_matches_column_transformer(use_pre, ts):
+    sensors = ["A", "D", "unknown", "B", "A"]
+    lags_24h = [0.0, 12.5, 300.0, np.nan, 1999.0]
+    lags_168h = [5.0, 0.0, 250.0, 42.0, 7.0]
+
+    expected = use_pre.transform(inference._build_rows(sensors, ts, lags_24h, lags_168h))
+    batch = inference._encode(sensors, ts, lags_24h, lags_168h)
+    np.testing.assert_array_equal(batch, expected)
+
+    for i, sensor in enumerate(sensors):
+        row = inference._encode([sensor], ts, [lags_24h[i]], [lags_168h[i]])
+        np.testing.assert_array_equal(row, expected[i:i + 1])
+
+
+def test_transform_and_spec_round_trip(fitted_pre, tmp_path):
+    encoder = FeatureEncoder.from_column_transformer(fitted_pre)
+    encoder.save(tmp_path / "spec.json")
+    loaded = FeatureEncoder.load(tmp_path / "spec.json")
+
+    df = pd.DataFrame({
+        "HourDay": [0, 23], "lag_24h": [1.0, 2.0], "lag_168h": [3.0, 4.0],
+        "Sensor_Name": ["C", "Z"], "is_holiday": [1, 0], "is_lockdown": [0, 1],
+        "day_of_week": ["Sunday", "Friday"],
+    })
+    np.testing.assert_array_equal(loaded.transform(df), fitted_pre.transform(df))
+    assert loaded.n_features_out == fitted_pre.transform(df).shape[1]
+
+
+def test_encode_reuses_preallocated_buffer(fitted_pre):
+    encoder = FeatureEncoder.from_column_transformer(fitted_pre)
+    out = np.full((2, encoder.n_features_out), 9.0)
+    columns = {"HourDay": 3, "lag_24h": [1.0, 2.0], "lag_168h": [3.0, 4.0], "Sensor_Name": ["A", "B"],
+               "is_holiday": 0, "is_lockdown": 0, "day_of_week": "Monday"}
+    assert encoder.encode(columns, 2, out=out) is out
+    assert set(np.unique(out[:, encoder.n_num:])) == {0.0, 1.0}
+
+
+def test_transform_csr_matches_dense(fitted_pre):
+    encoder = FeatureEncoder.from_column_transformer(fitted_pre, sparse=True)
+    df = pd.DataFrame({
+        "HourDay": [0, 23, 5], "lag_24h": [1.0, 2.0, 0.0], "lag_168h": [3.0, 4.0, 5.0],
+        "Sensor_Name": ["C", "Z", "A"], "is_holiday": [1, 0, 0], "is_lockdown": [0, 1, 0],
+        "day_of_week": ["Sunday", "Friday", "Monday"],
+    })
+    csr = encoder.transform_csr(df, dtype=float)
+    np.testing.assert_array_equal(csr.toarray(), fitted_pre.transform(df))
+    # numeric values are always stored; one-hot zeros and unknown categories are not
+    assert csr.getnnz(axis=1).tolist() == [3 + 4, 3 + 2, 3 + 4]
+
+    # encode() marks the absent one-hot entries as missing for a sparse-trained model
+    columns = {name: df[name].tolist() for name in df.columns}
+    dense = encoder.encode(columns, 3)
+    np.testing.assert_array_equal(np.nan_to_num(dense), fitted_pre.transform(df))
+    np.testing.assert_array_equal(np.isnan(dense[:, encoder.n_num:]), csr.toarray()[:, encoder.n_num:] == 0)
+    # and so does transform()
+    np.testing.assert_array_equal(encoder.transform(df), dense)
+
+
+def test_categorical_encoder_codes_and_spec(fitted_pre, tmp_path):
+    df = pd.DataFrame({
+        "HourDay": [1, 2], "lag_24h": [10.0, 20.0], "lag_168h": [30.0, 40.0],
+        "Sensor_Name": ["B", "unknown"], "is_holiday": [False, True], "is_lockdown": [0, 1],
+        "day_of_week": ["Monday", "Sunday"],
+    })
+    encoder = CategoricalEncoder.fit(df.iloc[:1], ["HourDay", "lag_24h", "lag_168h"],
+                                     ["Sensor_Name", "is_holiday", "is_lockdown", "day_of_week"])
+    out = encoder.transform(df)
+    np.testing.assert_array_equal(out[0], [1, 10, 30, 0, 0, 0, 0])
+    assert np.isnan(out[1, 3:]).all()  # unseen categories are missing
+    assert encoder.feature_types == ["q"] * 3 + ["c"] * 4
+
+    encoder.save(tmp_path / "spec.json")
+    loaded = load_encoder(tmp_path / "spec.json")
+    assert isinstance(loaded, CategoricalEncoder) and as_encoder(loaded) is loaded
+    columns = {name: df[name].tolist() for name in df.columns}
+    np.testing.assert_array_equal(loaded.encode(columns, 2), out)
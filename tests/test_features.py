@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import pytest
 from datetime import timedelta, timezone
+from src import features
 from src.features import (
     add_is_holiday,
     add_lockdown_flag,
@@ -9,7 +10,11 @@ from src.features import (
     add_lags,
     # add_roll3h,
     vic_holidays,
-    LOCK_WINDOWS
+    LOCK_WINDOWS,
+    calendar_features,
+    day_numbers,
+    DAY_NAMES,
+    build_features,
 )
 
 AEST = timezone(timedelta(hours=10))
@@ -68,6 +73,64 @@ def test_add_lags():
     assert df.loc[24, "lag_24h"] == 0
 
 
+def test_calendar_table_matches_rowwise_definitions():
+    days = pd.date_range("2019-12-25", "2027-01-05", freq="D")
+    is_holiday, is_lockdown, weekday = calendar_features(day_numbers(days))
+
+    midnights = days.tz_localize("Australia/Melbourne")
+    expected_lockdown = [any(s <= ts <= e for s, e in LOCK_WINDOWS) for ts in midnights]
+    # training semantics: `isin` sees only the populated years (`in` would auto-expand the years)
+    assert is_holiday.tolist() == [d.year in features.HOLIDAY_YEARS and d.date() in vic_holidays for d in days]
+    assert is_lockdown.tolist() == expected_lockdown
+    assert DAY_NAMES[weekday].tolist() == list(days.day_name())
+
+
+def test_calendar_table_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(features, "CALENDAR_CACHE", tmp_path / "calendar.npz")
+    monkeypatch.setattr(features, "_CALENDAR", None)
+    built = features.calendar_table()
+    assert (tmp_path / "calendar.npz").exists()
+
+    monkeypatch.setattr(features, "_CALENDAR", None)
+    monkeypatch.setattr(features, "_build_calendar", lambda: pytest.fail("cache not used"))
+    np.testing.assert_array_equal(features.calendar_table(), built)
+
+
+
+def hourly_frame(sensors=("X", "Y"), n_hours=200):
+    ts = pd.date_range("2024-03-01", periods=n_hours, freq="h")
+    return pd.DataFrame({
+        "Sensor_Name": np.repeat(sensors, n_hours),
+        "Sensing_Date": np.tile(ts.normalize(), len(sensors)),
+        "HourDay": np.tile(ts.hour, len(sensors)),
+        "Total_of_Directions": np.arange(n_hours * len(sensors)),
+    })
+
+
+def test_build_features_matches_pipe_chain():
+    df = hourly_frame()
+    expected = df.pipe(add_is_holiday).pipe(add_lockdown_flag).pipe(add_day_of_week).pipe(add_lags)
+
+    # rows in any order; columns are added to the same frame
+    shuffled = df.sample(frac=1, random_state=0)
+    out = build_features(shuffled)
+    assert out is shuffled
+    pd.testing.assert_frame_equal(out.sort_index(), expected, check_dtype=False)
+
+
+def test_build_features_gaps_give_nan():
+    df = hourly_frame(sensors=("X",)).drop(index=[10, 11]).reset_index(drop=True)
+    out = build_features(df, lags=(1, 24))
+
+    # hour 12 has no hour 11 before it; row shifting would have used hour 9
+    row = out.index[(out["HourDay"] == 12) & (out["Sensing_Date"] == "2024-03-01")][0]
+    assert np.isnan(out.loc[row, "lag_1h"])
+    assert np.isnan(out.loc[row, "lag_24h"])  # before the sensor's first hour
+    # hour 34 (next day, 10:00) points back at the dropped hour 10
+    row = out.index[(out["HourDay"] == 10) & (out["Sensing_Date"] == "2024-03-02")][0]
+    assert np.isnan(out.loc[row, "lag_24h"])
+    assert out.loc[row, "lag_1h"] == out.loc[row - 1, "Total_of_Directions"]
+
 # def test_add_roll3h(toy_df):
 #     df = toy_df.copy()
 #     # make sure rolling works for 3 rows
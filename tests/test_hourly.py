@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from src import hourly, inference
+from src.api import app
+from src.features import AEST
+from src.inference import init_buffers, predict_batch
+
+
+@pytest.fixture
+def hour_buffers(monkeypatch):
+    monkeypatch.setattr(hourly, "TABLE", None)
+    now = hourly.current_hour()
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=168, freq="h")
+    init_buffers(pd.DataFrame({
+        "Sensor_Name": ["X"] * 168 + ["Y"] * 100,
+        "Sensing_Date": list(dates) + list(dates[-100:]),  # Y has no 168h-old hour
+        "Total_of_Directions": list(range(168)) + [5] * 100,
+    }))
+    return now
+
+
+def test_build_table_uses_buffered_lags(hour_buffers):
+    table = hourly.build_table(hour_buffers)
+    assert table.hour == hour_buffers
+    assert list(table.predictions) == ["X"] and table.missing == ("Y",)
+    assert table.predictions["X"] == pytest.approx(predict_batch(["X"], hour_buffers, [144.0], [0.0])[0])
+    with pytest.raises(TypeError):
+        table.predictions["X"] = 0.0  # published tables are read-only
+
+
+def test_predict_served_from_table(hour_buffers, mocker):
+    hourly.publish(hourly.build_table(hour_buffers)._replace(predictions={"X": 1234.4}))
+    on_demand = mocker.patch("src.api.predict_sensor_hour")
+    client = TestClient(app)
+
+    resp = client.get("/predict", params={"sensor": "X"})
+    assert resp.json()["predicted_count"] == 1234
+    on_demand.assert_not_called()
+
+    # sensors missing from the table fall back to on-demand inference
+    on_demand.return_value = (7.0, False)
+    assert client.get("/predict", params={"sensor": "Y"}).json()["predicted_count"] == 7
+    on_demand.assert_called_once()
+
+
+def test_predictions_current_builds_and_publishes(hour_buffers):
+    client = TestClient(app)
+    data = client.get("/predictions/current").json()
+    assert data["timestamp"] == hour_buffers.isoformat()
+    assert [p["sensor_name"] for p in data["predictions"]] == ["X"]
+    assert data["missing"] == ["Y"]
+    assert hourly.current(hour_buffers) is not None
+
+
+def test_seconds_until_next_hour():
+    now = datetime(2025, 4, 17, 9, 59, 30, tzinfo=AEST)
+    assert hourly.seconds_until_next(now, delay=30) == 60
+    assert hourly.current_hour(now) == datetime(2025, 4, 17, 9, tzinfo=AEST)
@@ -1,12 +1,17 @@
-from collections import deque
 from unittest.mock import AsyncMock
 
+import joblib
+import numpy as np
 import pytest
 import pandas as pd
 from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
-from src.inference import init_buffers
+from src import inference
+from src.encoder import as_encoder
+from src.inference import (init_buffers, buffer_lags, predict_batch, predict_current_hour_with_live_lags,
+                           predict_recursive)
 from src.api import app  # for integration test
 
 AEST = timezone(timedelta(hours=10))
@@ -25,23 +30,24 @@ def buffers_setup(tmp_path):
     return df
 
 
-# def test_predict_recursive_length(buffers_setup):
-#     now = buffers_setup["Sensing_Date"].max().astimezone(AEST)
-#     start = now + timedelta(hours=1)
-#
-#     buffers = {
-#         "X": {
-#             "lag": deque(buffers_setup["Total_of_Directions"].values, maxlen=168),
-#             "roll": deque(buffers_setup["Total_of_Directions"].values[-3:], maxlen=3),
-#         }
-#     }
-#
-#     preds = predict_recursive("X", start, 5, buffers=buffers)
-#
-#     for ts, y in preds:
-#         print(f"{ts=}, {type(y)=}, {y=}")
-#         assert isinstance(y, (int, float)), f"bad type: {type(y)}"
-#         assert y >= 0, f"negative prediction: {y}"
+def test_predict_recursive_feeds_back_predictions():
+    sensors = ["X", "unknown-sensor"]
+    ts = datetime(2025, 4, 17, 0, tzinfo=AEST)
+    history = np.vstack([np.arange(168, dtype=float), np.full(168, 50.0)])
+    history[1, 10] = np.nan  # gap -> treated as missing by the model
+
+    preds = predict_recursive(sensors, ts, 30, history)
+    assert preds.shape == (2, 30)
+    assert (preds >= 0).all()
+
+    # step 0 reads both lags from history, step 24 reads lag_24h from step 0
+    step0 = predict_batch(sensors, ts, history[:, 144], history[:, 0])
+    step24 = predict_batch(sensors, ts + timedelta(hours=24), preds[:, 0], history[:, 24])
+    assert preds[:, 0] == pytest.approx(step0)
+    assert preds[:, 24] == pytest.approx(step24)
+
+    with pytest.raises(ValueError):
+        predict_recursive(sensors, ts, 169, history)
 
 
 def test_api_predict(buffers_setup, mocker):
@@ -58,3 +64,125 @@ def test_api_predict(buffers_setup, mocker):
     assert data["sensor_name"] == "X"
     assert isinstance(data["timestamp"], str)
     assert isinstance(data["predicted_count"], int)
+
+
+def test_predict_batch_matches_single_row():
+    ts = datetime(2025, 4, 17, 9, tzinfo=AEST)
+    sensors = ["X", "X", "unknown-sensor"]
+    lags_24h = [100, 20, 50]
+    lags_168h = [150, 10, 60]
+
+    batch = predict_batch(sensors, ts, lags_24h, lags_168h)
+    single = [predict_current_hour_with_live_lags(s, ts, a, b)
+              for s, a, b in zip(sensors, lags_24h, lags_168h)]
+
+    assert batch == pytest.approx(single)
+    assert predict_batch([], ts, [], []) == []
+
+
+def test_api_predict_batch(buffers_setup, mocker):
+    async def fake_fetch(sensor, current_ts, **kwargs):
+        if sensor == "missing":
+            raise HTTPException(status_code=404, detail="No data")
+        return {"lag_24h": 100, "lag_168h": 150}
+
+    mocker.patch('src.api.fetch_live_lags_from_external_api', side_effect=fake_fetch)
+
+    client = TestClient(app)
+    resp = client.get("/predict/batch", params={"sensors": ["X", "missing", "X"]})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [p["sensor_name"] for p in data["predictions"]] == ["X"]
+    assert isinstance(data["predictions"][0]["predicted_count"], int)
+    assert data["errors"] == [{"sensor_name": "missing", "status_code": 404, "detail": "No data"}]
+
+    # "all" expands to every sensor held in the buffers
+    resp = client.get("/predict/batch")
+    assert [p["sensor_name"] for p in resp.json()["predictions"]] == ["X"]
+
+
+def test_buffer_lags_cover_and_gaps():
+    dates = pd.date_range("2025-04-01", periods=200, freq="h", tz=AEST)
+    df = pd.DataFrame({
+        "Sensor_Name": ["X"] * 200,
+        "Sensing_Date": dates,
+        "Total_of_Directions": range(200),
+    }).drop(index=[150])  # a missing hour
+    init_buffers(df)
+
+    ts = dates[-1] + timedelta(hours=1)
+    assert buffer_lags("X", ts) == {"lag_24h": 176.0, "lag_168h": 32.0}
+    assert buffer_lags("X", dates[174]) == {"lag_168h": 6.0}  # 24h back is the gap
+    assert buffer_lags("Y", ts) == {}
+
+
+def test_api_predict_from_buffers(mocker):
+    now = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=168, freq="h")
+    init_buffers(pd.DataFrame({
+        "Sensor_Name": ["X"] * 168,
+        "Sensing_Date": dates,
+        "Total_of_Directions": range(168),
+    }))
+    mock_fetch_lags = mocker.patch('src.api.fetch_live_lags_from_external_api', new_callable=AsyncMock)
+
+    client = TestClient(app)
+    resp = client.get("/predict", params={"sensor": "X"})
+    assert resp.status_code == 200
+    mock_fetch_lags.assert_not_called()
+
+
+def test_native_artifacts_match_joblib_bundle(tmp_path):
+    # Export the joblib bundle the way src.train.export_native does
+    bundle = joblib.load(inference.ARTIFACT_DIR / inference.BUNDLE_FILE)
+    pre, model = bundle["pre"], bundle["model"]
+    model.save_model(tmp_path / inference.NATIVE_MODEL_FILE)
+    as_encoder(pre).save(tmp_path / inference.ENCODING_SPEC_FILE)  # any encoder the bundle holds
+
+    ts = datetime(2025, 1, 1, 8, tzinfo=AEST)
+    sensors, lags_24h, lags_168h = ["X", "X", "nope"], [10, 300, 5], [20, 250, 5]
+    expected = np.maximum(model.predict(pre.transform(
+        inference._build_rows(sensors, ts, lags_24h, lags_168h))), 0)
+    try:
+        inference.load_model(tmp_path)
+        assert type(inference.PRE) is type(as_encoder(pre))
+        assert predict_batch(sensors, ts, lags_24h, lags_168h) == pytest.approx(expected)
+        assert inference.warm_up() >= 0
+    finally:
+        inference.load_model()
+
+
+def test_api_forecast(mocker):
+    now = datetime.now(AEST).replace(minute=0, second=0, microsecond=0)
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=168, freq="h")
+    init_buffers(pd.DataFrame({
+        "Sensor_Name": ["X"] * 168 + ["Y"] * 167 + ["Z"] * 10,
+        "Sensing_Date": list(dates) + list(dates[1:]) + list(dates[-10:]),  # Y misses its oldest hour
+        "Total_of_Directions": list(range(168)) + list(range(167)) + list(range(10)),
+    }))
+
+    async def get_lag(sensor, ts, hours_back):
+        if sensor == "Z":
+            raise HTTPException(status_code=404, detail="no data")
+        return 5.0
+
+    get_lag = mocker.patch("src.upstream.UpstreamClient.get_lag", new_callable=AsyncMock, side_effect=get_lag)
+
+    client = TestClient(app)
+    resp = client.get("/forecast", params={"sensor": "all", "hours": 48})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["timestamps"]) == 48
+    assert [f["sensor_name"] for f in data["forecasts"]] == ["X", "Y"]
+    assert all(len(f["predicted_counts"]) == 48 for f in data["forecasts"])
+    # Z is reported, not forecast from missing lags: 48 lag_168h values and 14 of its lag_24h values
+    assert data["errors"] == [{"sensor_name": "Z", "status_code": 503,
+                               "detail": "62 lag values needed for a 48h forecast are unavailable"}]
+    y_calls = [c for c in get_lag.await_args_list if c.args[0] == "Y"]
+    assert len(y_calls) == 1  # only Y's 168h-old hour had to come from the API
+    assert type(y_calls[0].args[-1]) is int  # a numpy int breaks timedelta() in get_lag
+
+    only_z = client.get("/forecast", params={"sensor": "Z", "hours": 2}).json()
+    assert only_z["forecasts"] == [] and only_z["errors"][0]["sensor_name"] == "Z"
+
+    assert client.get("/forecast", params={"sensor": "X", "hours": 169}).status_code == 422
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pandas as pd
+import pytest
+
+from src.buffers import LagRing, hour_index
+from src.features import AEST
+from src.ingest import ingest_new_hours, run_elected_ingestion, run_ingestion
+from src.upstream import UpstreamClient
+
+NOW = datetime(2025, 4, 20, 12, tzinfo=AEST)
+
+
+def fake_records_api(published: list[dict], requests_seen: list):
+    """Records endpoint serving `published` with limit/offset paging (filters ignored)."""
+    def handler(request):
+        params = request.url.params
+        requests_seen.append(dict(params))
+        offset, limit = int(params["offset"]), int(params["limit"])
+        return httpx.Response(200, json={
+            "total_count": len(published),
+            "results": published[offset:offset + limit],
+        })
+    return handler
+
+
+def make_records(sensors, start, hours):
+    out = []
+    for h in range(hours):
+        ts = start + timedelta(hours=h)
+        for i, sensor in enumerate(sensors):
+            out.append({"sensor_name": sensor, "sensing_date": ts.strftime("%Y-%m-%d"),
+                        "hourday": ts.hour, "pedestriancount": 100 * i + h})
+    return out
+
+
+@pytest.mark.asyncio
+async def test_ingest_new_hours_pages_and_appends(tmp_path):
+    published = make_records(["A", "B", "C"], NOW - timedelta(hours=48), 48)
+    seen = []
+    ring = LagRing()
+    async with UpstreamClient(transport=httpx.MockTransport(fake_records_api(published, seen))) as client:
+        written = await ingest_new_hours(client, ring, now=NOW)
+
+    assert written == 144
+    assert len(seen) == 2  # 144 records at 100 per page
+    assert "where" in seen[0] and seen[1]["offset"] == "100"
+    assert ring.latest == hour_index(NOW) - 1
+    assert ring.get("B", hour_index(NOW) - 1) == 147.0
+    assert ring.get("C", hour_index(NOW) - 48) == 200.0
+
+    # The checkpoint restores the same ring
+    ring.save(tmp_path / "ckpt.npz")
+    restored = LagRing()
+    restored.load(tmp_path / "ckpt.npz")
+    assert restored.latest == ring.latest and sorted(restored) == ["A", "B", "C"]
+    assert restored.get("B", hour_index(NOW) - 1) == 147.0
+
+
+@pytest.mark.asyncio
+async def test_run_ingestion_checkpoints_on_shutdown(tmp_path):
+    published = make_records(["A"], NOW - timedelta(hours=2), 2)
+    ring = LagRing()
+    path = tmp_path / "ckpt.npz"
+    async with UpstreamClient(transport=httpx.MockTransport(fake_records_api(published, []))) as client:
+        task = asyncio.create_task(run_ingestion(client, ring, interval=3600, checkpoint_path=path))
+        for _ in range(100):
+            if ring.latest >= 0:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert path.exists()
+    restored = LagRing()
+    restored.load(path)
+    assert pd.isna(restored.values).sum() < restored.values.size
+    assert restored.latest == ring.latest
+
+
+@pytest.mark.asyncio
+async def test_run_ingestion_survives_unexpected_errors(tmp_path, monkeypatch):
+    published = make_records(["A"], NOW - timedelta(hours=2), 2)
+    ring = LagRing()
+    write, calls = ring.write, []
+
+    def flaky_write(*args):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("malformed page")
+        write(*args)
+
+    monkeypatch.setattr(ring, "write", flaky_write)
+    async with UpstreamClient(transport=httpx.MockTransport(fake_records_api(published, []))) as client:
+        task = asyncio.create_task(run_ingestion(client, ring, interval=0.01,
+                                                 checkpoint_path=tmp_path / "ckpt.npz"))
+        for _ in range(100):
+            if ring.latest >= 0:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    assert ring.latest >= 0  # the poll after the failure went through
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_is_elected_ingester(tmp_path):
+    published = make_records(["A"], NOW - timedelta(hours=2), 2)
+    lock = tmp_path / "ingest.lock"
+    rings = [LagRing(), LagRing()]
+    async with UpstreamClient(transport=httpx.MockTransport(fake_records_api(published, []))) as client:
+        # two "workers" in one process: separate opens of the lock file conflict like processes do
+        workers = [asyncio.create_task(run_elected_ingestion(client, ring, lock, interval=0.05,
+                                                             checkpoint_path=tmp_path / f"ckpt{i}.npz"))
+                   for i, ring in enumerate(rings)]
+        await asyncio.sleep(0.3)
+        assert rings[0].latest >= 0 and rings[1].latest == -1
+
+        # the ingester exits and releases the lock: the other worker takes over
+        workers[0].cancel()
+        await asyncio.gather(workers[0], return_exceptions=True)
+        await asyncio.sleep(0.3)
+        assert rings[1].latest >= 0
+        workers[1].cancel()
+        await asyncio.gather(workers[1], return_exceptions=True)
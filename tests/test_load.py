@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from src import load
+
+
+@pytest.fixture
+def counts_csv(tmp_path):
+    rows = [
+        # Location_ID, Sensing_Date, HourDay, Direction_1, Direction_2, Total_of_Directions, Sensor_Name
+        (1, "2019-12-31", 23, 1, 2, 3, "A"),
+        (1, "2024-06-01", 8, 10, 5, 15, "A"),
+        (2, "2024-06-01", 8, 7, 7, 14, "B"),
+        (1, "2024-06-01", 8, 99, 99, 198, "A"),   # duplicate of row 2, next chunk
+        (1, "not a date", 9, 1, 1, 2, "A"),
+        (2, "2025-01-02", 0, 3, 3, 6, "B"),
+        (2, "2025-01-02", 0, 4, 4, 8, "B"),       # duplicate in the same chunk
+        (1, "2025-03-01", 12, 20, 21, 41, "A"),
+    ]
+    path = tmp_path / "counts.csv"
+    pd.DataFrame(rows, columns=["Location_ID", "Sensing_Date", "HourDay", "Direction_1", "Direction_2",
+                                "Total_of_Directions", "Sensor_Name"]).to_csv(path, index=False)
+    return path
+
+
+def test_cache_matches_pandas_cleaning(counts_csv, tmp_path):
+    cache = load.build_counts_cache(counts_csv, tmp_path / "cache", chunk_rows=3)
+    assert sorted(p.name for p in cache.glob("year=*")) == ["year=2019", "year=2024", "year=2025"]
+
+    df = load.load_counts(csv_path=counts_csv, cache_dir=cache)
+    assert df["Sensor_Name"].dtype == "category"
+    assert df["HourDay"].dtype == "int16"
+    assert df["Total_of_Directions"].dtype == "int32"
+    assert pd.api.types.is_datetime64_any_dtype(df["Sensing_Date"])
+
+    # Reference: the previous whole-frame pandas cleaning
+    ref = pd.read_csv(counts_csv)
+    ref["Sensing_Date"] = pd.to_datetime(ref["Sensing_Date"], errors="coerce")
+    ref = ref.drop_duplicates(["Sensor_Name", "Sensing_Date", "HourDay"]).dropna(subset=["Sensing_Date"])
+
+    key = ["Sensor_Name", "Sensing_Date", "HourDay"]
+    got = df.astype({"Sensor_Name": str}).sort_values(key).reset_index(drop=True)
+    ref = ref.sort_values(key).reset_index(drop=True)
+    assert got["Total_of_Directions"].tolist() == ref["Total_of_Directions"].tolist() == [3, 15, 41, 14, 6]
+
+
+def test_load_counts_pushes_down_columns_and_dates(counts_csv, tmp_path):
+    cache_dir = tmp_path / "cache"
+    df = load.load_counts(["Sensor_Name", "Total_of_Directions"], start="2024-06-01", end="2025-03-01",
+                          csv_path=counts_csv, cache_dir=cache_dir)
+    assert list(df.columns) == ["Sensor_Name", "Total_of_Directions"]
+    assert sorted(df["Total_of_Directions"]) == [6, 14, 15]
+
+    # Cache is reused while the CSV is unchanged, and rebuilt when it changes
+    stamp = (cache_dir / "_source.json").stat().st_mtime_ns
+    load.load_counts(csv_path=counts_csv, cache_dir=cache_dir)
+    assert (cache_dir / "_source.json").stat().st_mtime_ns == stamp
+
+    with counts_csv.open("a") as f:
+        f.write("3,2025-03-02,1,1,1,2,C\n")
+    df = load.load_counts(start="2025-03-02", csv_path=counts_csv, cache_dir=cache_dir)
+    assert df["Sensor_Name"].astype(str).tolist() == ["C"]
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from datetime import timedelta
+
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from src import hourly, inference, metrics
+from src.api import app
+from src.inference import init_buffers, predict_batch
+
+
+def test_histogram_and_counter_text():
+    hist = metrics.Histogram("t_seconds", "Test.", "stage", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 3.0):
+        hist.observe("a", value)
+    assert hist.render().splitlines()[2:] == [
+        't_seconds_bucket{stage="a",le="0.1"} 1',
+        't_seconds_bucket{stage="a",le="1.0"} 2',
+        't_seconds_bucket{stage="a",le="+Inf"} 3',
+        't_seconds_sum{stage="a"} 3.55',
+        't_seconds_count{stage="a"} 3',
+    ]
+    counter = metrics.Counter("t_total", "Test.", "status")
+    counter.inc("200")
+    counter.inc("200")
+    assert counter.render().splitlines()[-1] == 't_total{status="200"} 2.0'
+    assert metrics.gauge("g", "Test.", {'a"b': 1}, label="sensor").splitlines()[-1] == 'g{sensor="a\\"b"} 1.0'
+    assert metrics.counter("c_total", "Test.", 4).splitlines()[1:] == ["# TYPE c_total counter", "c_total 4.0"]
+
+
+def test_histogram_observations_from_threads():
+    hist = metrics.Histogram("t_seconds", "Test.", "stage", buckets=(0.1, 1.0))
+    threads = [threading.Thread(target=lambda: [hist.observe("a", 0.5) for _ in range(20000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    child = hist._children["a"]
+    assert child.count == sum(child.counts) == 80000 and child.sum == 40000.0
+
+
+def test_timed_context_and_decorators(monkeypatch):
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", metrics.Histogram("s", "Test.", "stage"))
+
+    with metrics.timed("block"):
+        pass
+
+    @metrics.timed("sync")
+    def f(x):
+        return x + 1
+
+    @metrics.timed("async")
+    async def g(x):
+        return x * 2
+
+    assert f(1) == 2 and asyncio.run(g(2)) == 4
+    assert {k: c.count for k, c in metrics.STAGE_SECONDS._children.items()} == {"block": 1, "sync": 1, "async": 1}
+
+    # disabled: a shared no-op, and decorated functions are returned as they are
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    assert metrics.timed("x") is metrics.timed("y")
+    assert metrics.timed("x")(f.__wrapped__) is f.__wrapped__
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(hourly, "TABLE", None)
+    now = hourly.current_hour()
+    dates = pd.date_range(end=now - timedelta(hours=3), periods=168, freq="h")
+    init_buffers(pd.DataFrame({"Sensor_Name": ["X"] * 168, "Sensing_Date": dates,
+                               "Total_of_Directions": range(168)}))
+    predict_batch(["X"], now, [1.0], [2.0])
+
+    resp = TestClient(app).get("/metrics")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+    lines = resp.text.splitlines()
+    assert 'peds_buffer_staleness_hours{sensor="X"} 3.0' in lines
+    assert any(line.startswith('peds_stage_seconds_count{stage="model_predict"}') for line in lines)
+    assert any(line.startswith('peds_stage_seconds_count{stage="encode"}') for line in lines)
+    assert f"peds_model_load_seconds {inference.MODEL_LOAD_SECONDS!r}" in lines
+    assert "# TYPE peds_lag_cache_lookups_total counter" in lines
+    assert "# TYPE peds_upstream_requests_total counter" in lines
@@ -0,0 +1,158 @@
+import asyncio
+from datetime import timedelta
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import api, hourly, inference, registry, train
+from src.inference import init_buffers, predict_batch
+from tests.test_train import counts_frame
+
+
+@pytest.fixture(scope="module")
+def runs(tmp_path_factory):
+    """Two training runs that give different predictions."""
+    ped = counts_frame()
+    dirs = []
+    for i, rounds in enumerate((5, 40)):
+        out_dir = tmp_path_factory.mktemp(f"run{i}")
+        train.train(ped.copy(), rounds=rounds, nthread=1, cut_date=pd.Timestamp("2024-12-01"),
+                    out_dir=out_dir, cache_dir=out_dir / "features")
+        dirs.append(out_dir)
+    return dirs
+
+
+@pytest.fixture
+def root(tmp_path, runs, monkeypatch):
+    monkeypatch.setattr(registry, "REGISTRY_DIR", tmp_path / "registry")
+    registry.publish(runs[0], note="first")
+    registry.publish(runs[1])
+    return tmp_path / "registry"
+
+
+def test_publish_activate_and_rollback(root):
+    manifest = registry.read_manifest()
+    assert [v["version"] for v in manifest["versions"]] == ["v1", "v2"]
+    assert manifest["versions"][0]["trained_through"] == "2024-11-30"
+    assert (manifest["current"], manifest["history"]) == ("v2", ["v1"])
+    assert registry.previous_version() == "v1"
+
+    assert registry.rollback() == "v1"
+    assert registry.current_version() == "v1" and registry.previous_version() is None
+    with pytest.raises(LookupError):
+        registry.rollback()
+    with pytest.raises(KeyError):
+        registry.activate("v9")
+    assert registry.load("v2").version == "v2"
+
+
+@pytest.fixture
+def serving(root, monkeypatch):
+    """Buffers for the training sensors up to the current hour, v1 installed."""
+    monkeypatch.setattr(hourly, "TABLE", None)
+    for name in ("ACTIVE", "BUNDLE", "PRE", "MODEL", "ENCODER", "MODEL_LOAD_SECONDS"):
+        monkeypatch.setattr(inference, name, getattr(inference, name))  # restored after the test
+    now = hourly.current_hour()
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=200, freq="h")
+    init_buffers(pd.DataFrame({
+        "Sensor_Name": np.repeat(["A", "B"], len(dates)),
+        "Sensing_Date": np.tile(dates, 2),
+        "Total_of_Directions": np.tile(np.arange(200.0), 2),
+    }))
+    inference.install(registry.load("v1"))
+    return now
+
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def admin_client(serving, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "secret")
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test", headers=ADMIN)
+
+
+@pytest.mark.asyncio
+async def test_admin_swaps_the_served_model(admin_client):
+    async with admin_client as client:
+        before = await client.get("/predict/batch")
+        swapped = await client.post("/admin/models/v2/activate")
+        after = await client.get("/predict/batch")
+        single = await client.get("/predict", params={"sensor": "A"})
+        table = hourly.TABLE
+        unknown = await client.post("/admin/models/v9/activate")
+        listed = (await client.get("/admin/models")).json()
+        rolled = await client.post("/admin/models/rollback")
+        again = await client.post("/admin/models/rollback")
+
+    assert before.headers["X-Model-Version"] == "v1"
+    assert swapped.json() == {"serving": "v2", "previous": "v1"}
+    assert after.headers["X-Model-Version"] == "v2"
+    assert after.json()["predictions"] != before.json()["predictions"]
+    # the hourly table was rebuilt with the new model
+    assert single.headers["X-Model-Version"] == "v2"
+    assert table.model_version == "v2"
+    assert single.json()["predicted_count"] == round(table.predictions["A"])
+    assert unknown.status_code == 404
+    assert listed["serving"] == "v2" and listed["current"] == "v2"
+    assert rolled.json() == {"serving": "v1", "previous": "v2"}
+    assert registry.current_version() == "v1"
+    assert again.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_concurrent_swaps_keep_the_manifest_and_the_model_together(admin_client):
+    watcher = asyncio.create_task(api.run_model_watcher(interval=0))
+    try:
+        async with admin_client as client:
+            await client.post("/admin/models/v2/activate")  # history [v1]: room for one rollback
+            rollbacks = await asyncio.gather(*(client.post("/admin/models/rollback") for _ in range(2)))
+    finally:
+        watcher.cancel()
+    assert sorted(r.status_code for r in rollbacks) == [200, 409]
+    assert registry.current_version() == inference.active().version == "v1"
+
+
+@pytest.mark.asyncio
+async def test_admin_token(serving, monkeypatch):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+        monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+        disabled = await client.post("/admin/models/v2/activate", headers=ADMIN)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "secret")
+        denied = await client.post("/admin/models/v2/activate", headers={"X-Admin-Token": "wrong"})
+        allowed = await client.post("/admin/models/v2/activate", headers=ADMIN)
+    assert disabled.status_code == 403 and "disabled" in disabled.json()["detail"]
+    assert denied.status_code == 403
+    assert allowed.status_code == 200
+    assert inference.active().version == "v2"
+
+
+@pytest.mark.asyncio
+async def test_request_keeps_the_model_it_started_with(serving):
+    old = inference.active()
+    inference.install(registry.load("v2"))
+    # submitted together, so batched together: each item is predicted with its own model
+    (pinned, _), (latest, _) = await asyncio.gather(api.predict_sensor_hour("A", serving, old),
+                                                    api.predict_sensor_hour("A", serving))
+    lags = inference.buffer_lags("A", serving)
+    args = (["A"], serving, [lags["lag_24h"]], [lags["lag_168h"]])
+    assert pinned == pytest.approx(float(predict_batch(*args, model=old)[0]))
+    assert latest == pytest.approx(float(predict_batch(*args)[0]))
+    assert pinned != pytest.approx(latest)
+
+
+@pytest.mark.asyncio
+async def test_watcher_follows_the_manifest(serving):
+    registry.activate("v2")
+    watcher = asyncio.create_task(api.run_model_watcher(interval=0.01))
+    try:
+        for _ in range(200):
+            if hourly.TABLE is not None:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        watcher.cancel()
+    assert inference.active().version == "v2"
+    assert hourly.TABLE.model_version == "v2"
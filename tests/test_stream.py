@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import api, hourly, stream
+from src.inference import init_buffers
+
+
+def ndjson(chunks) -> list[dict]:
+    return [json.loads(line) for chunk in chunks for line in chunk.splitlines() if line.strip()]
+
+
+def test_frame_formats_and_json_fallback(monkeypatch):
+    items = [("prediction", {"sensor_name": "A", "predicted_count": 3}), ("hour", {"missing": []})]
+    assert stream.frame("ndjson", items) == (b'{"event":"prediction","sensor_name":"A","predicted_count":3}\n'
+                                             b'{"event":"hour","missing":[]}\n')
+    sse = stream.frame("sse", items)
+    assert sse.startswith(b'event: prediction\ndata: {"sensor_name":"A","predicted_count":3}\n\n')
+    monkeypatch.setattr(stream, "orjson", None)
+    assert stream.frame("sse", items) == sse
+
+
+@pytest.mark.asyncio
+async def test_stream_route_serves_the_published_table(monkeypatch):
+    now = hourly.current_hour()
+    monkeypatch.setattr(hourly, "TABLE", hourly.make_table(now, {"A": 10.4, "B": 20.0, "C": 30.0}, ("D",), "v7"))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test") as client:
+        resp = await client.get("/predictions/stream", params={"updates": 0, "sensors": ["A", "D"]})
+        sse = await client.get("/predictions/stream", params={"updates": 0, "format": "sse"})
+
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert ndjson([resp.content]) == [
+        {"event": "prediction", "sensor_name": "A", "timestamp": now.isoformat(), "predicted_count": 10,
+         "model_version": "v7"},
+        {"event": "hour", "timestamp": now.isoformat(), "computed_at": hourly.TABLE.computed_at.isoformat(),
+         "model_version": "v7", "missing": ["D"]},
+    ]
+    assert sse.headers["content-type"].startswith("text/event-stream")
+    assert sse.text.count("event: prediction\n") == 3 and sse.text.count("event: hour\n") == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_computes_in_chunks_then_pushes_refreshes(monkeypatch):
+    monkeypatch.setattr(hourly, "TABLE", None)
+    monkeypatch.setattr(api, "STREAM_CHUNK", 2)
+    monkeypatch.setattr(api, "STREAM_KEEP_ALIVE", 0.01)
+    now = hourly.current_hour()
+    dates = pd.date_range(end=now - timedelta(hours=1), periods=200, freq="h")
+    sensors = ["A", "B", "C", "D", "E"]
+    init_buffers(pd.DataFrame({
+        "Sensor_Name": np.repeat(sensors, len(dates)),
+        "Sensing_Date": np.tile(dates, len(sensors)),
+        "Total_of_Directions": np.tile(np.arange(200.0), len(sensors)),
+    }))
+
+    gen = api.prediction_stream(None, "ndjson", updates=1)
+    first = [await anext(gen) for _ in range(4)]
+    assert [len(ndjson([c])) for c in first] == [2, 2, 1, 1]  # three scored chunks, then the hour record
+    assert [r["sensor_name"] for r in ndjson(first[:3])] == sensors
+    own = hourly.TABLE
+    assert own is not None and own.hour == now  # the computed table was published
+
+    assert await anext(gen) == stream.KEEP_ALIVE["ndjson"]  # idle
+    refreshed = hourly.make_table(now, {"A": 1.0}, (), "v2")
+    hourly.publish(refreshed)
+    rest = [chunk async for chunk in gen if chunk != stream.KEEP_ALIVE["ndjson"]]
+    assert ndjson(rest) == [
+        {"event": "prediction", "sensor_name": "A", "timestamp": now.isoformat(), "predicted_count": 1,
+         "model_version": "v2"},
+        {"event": "hour", "timestamp": now.isoformat(), "computed_at": refreshed.computed_at.isoformat(),
+         "model_version": "v2", "missing": []},
+    ]
+    assert not hourly._WAITERS
+
+
+@pytest.mark.asyncio
+async def test_next_table_is_resolved_from_another_thread():
+    waiter = asyncio.ensure_future(hourly.next_table())
+    await asyncio.sleep(0)
+    table = hourly.make_table(hourly.current_hour(), {}, (), None)
+    await asyncio.to_thread(hourly.publish, table)
+    assert await asyncio.wait_for(waiter, 1) is table
+    hourly.publish(None)
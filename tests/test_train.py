@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from src import inference, train
+from src.inference import read_artifacts
+
+AEST = timezone(timedelta(hours=10))
+
+
+def counts_frame(start="2024-10-01", days=70, sensors=("A", "B", "C")):
+    rng = np.random.default_rng(0)
+    ts = pd.date_range(start, periods=days * 24, freq="h")
+    base = np.repeat([50, 300, 900], len(ts))[: len(ts) * len(sensors)]
+    daily = np.tile(1.2 + np.sin((ts.hour.to_numpy() - 6) / 24 * 2 * np.pi), len(sensors))
+    return pd.DataFrame({
+        "Sensor_Name": np.repeat(sensors, len(ts)),
+        "Sensing_Date": np.tile(ts.normalize(), len(sensors)),
+        "HourDay": np.tile(ts.hour, len(sensors)),
+        "Total_of_Directions": (base * daily + rng.integers(0, 20, len(base))).astype(np.int64),
+    })
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    return {"out_dir": tmp_path / "artifacts", "cache_dir": tmp_path / "features"}
+
+
+def test_train_caches_features_and_saves_artifacts(dirs, monkeypatch):
+    ped = counts_frame()
+    _, model = train.train(ped.copy(), rounds=20, nthread=1, cut_date=pd.Timestamp("2024-12-01"), **dirs)
+    assert model.get_booster().attr("trained_through") == "2024-11-30"  # the last day before the cut
+
+    loaded = read_artifacts(dirs["out_dir"])
+    assert loaded["model"].best_iteration == model.best_iteration
+    assert len(list(dirs["cache_dir"].iterdir())) == 1
+
+    # Same rows again: the encoded matrices come from the cache, without building features
+    monkeypatch.setattr(train, "make_features", lambda *a, **k: pytest.fail("feature cache not used"))
+    monkeypatch.setattr(train, "encode", lambda *a, **k: pytest.fail("feature cache not used"))
+    _, again = train.train(ped.copy(), rounds=20, nthread=1, cut_date=pd.Timestamp("2024-12-01"), **dirs)
+    assert again.best_iteration == model.best_iteration
+
+
+def test_continue_training_boosts_on_new_rows(dirs):
+    ped = counts_frame()
+    first = ped[ped["Sensing_Date"] < "2024-11-20"]
+    _, model = train.train(first.copy(), rounds=20, nthread=1, cut_date=pd.Timestamp("2024-11-06"), **dirs)
+    rounds_before = model.best_iteration + 1
+
+    previous = read_artifacts(dirs["out_dir"])
+    _, model = train.continue_training(ped[ped["Sensing_Date"] >= "2024-11-10"].copy(), previous,
+                                       rounds=10, nthread=1, val_days=7, **dirs)
+    assert model.get_booster().attr("trained_through") == "2024-12-02"  # the last week validates
+    assert rounds_before < model.get_booster().num_boosted_rounds() <= rounds_before + 10
+    # the encoder (and so the input layout) is the one the first model was trained with
+    assert read_artifacts(dirs["out_dir"])["model"].n_features_in_ == previous["model"].n_features_in_
+
+
+@pytest.mark.parametrize("encoding", train.ENCODINGS)
+def test_served_predictions_match_training_encoding(dirs, encoding, monkeypatch):
+    pre, model = train.train(counts_frame(), rounds=20, nthread=1, cut_date=pd.Timestamp("2024-12-01"),
+                             encoding=encoding, **dirs)
+    assert train.encoding_of(pre) == encoding
+
+    for name in ("BUNDLE", "PRE", "MODEL", "ENCODER"):
+        monkeypatch.setattr(inference, name, getattr(inference, name))
+    inference.load_model(dirs["out_dir"])  # native model + encoding spec
+
+    feats = train.make_features(counts_frame())
+    rows = feats[(feats["Sensing_Date"] == "2024-12-05") & (feats["HourDay"] == 9)]
+    rows = pd.concat([rows, rows.iloc[:1].assign(Sensor_Name="unknown")])
+    expected = np.maximum(model.predict(train.transform(pre, rows)), 0)
+
+    got = inference.predict_batch(rows["Sensor_Name"].tolist(), datetime(2024, 12, 5, 9, tzinfo=AEST),
+                                  rows["lag_24h"].to_numpy(), rows["lag_168h"].to_numpy())
+    np.testing.assert_allclose(got, expected, rtol=1e-6)
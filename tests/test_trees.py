@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+from datetime import datetime
+from scipy import sparse
+
+from src import inference, trees
+from src.features import AEST
+from src.inference import predict_batch
+
+
+def regression_data(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.integers(0, 40, n), rng.normal(size=n), rng.integers(0, 7, n), rng.normal(size=n)])
+    y = 10 * np.sin(X[:, 0]) + 3 * X[:, 1] + 5 * (X[:, 2] == 3) + 50 + rng.normal(size=n)
+    X[rng.random(n) < 0.1, 1] = np.nan
+    return X.astype(float), y
+
+
+def test_matches_booster_with_missing_values_and_early_stopping():
+    X, y = regression_data()
+    model = xgb.XGBRegressor(n_estimators=200, max_depth=6, learning_rate=0.3, early_stopping_rounds=5)
+    model.fit(X[:1500], y[:1500], eval_set=[(X[1500:], y[1500:])], verbose=False)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+
+    compiled = trees.compile_model(model)
+    assert compiled.n_trees == model.best_iteration + 1  # same trees as model.predict uses
+    X[:3, 3] = [np.nan, np.inf, -np.inf]
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(compiled.predict(X[:1]), model.predict(X[:1]), rtol=1e-5, atol=1e-4)
+
+
+def test_matches_booster_on_categorical_splits_and_sparse_input():
+    X, y = regression_data()
+    types = ["c", "q", "c", "q"]
+    booster = xgb.train({"max_depth": 6, "tree_method": "hist", "max_cat_to_onehot": 1},
+                        xgb.DMatrix(X, y, feature_types=types, enable_categorical=True), 30)
+    compiled = trees.compile_booster(booster)
+    assert compiled.categories is not None
+    X[:4, 0] = [45, -1, np.nan, 39]  # unseen, invalid and missing codes
+    expected = booster.predict(xgb.DMatrix(X, feature_types=types, enable_categorical=True))
+    np.testing.assert_allclose(compiled.predict(X), expected, rtol=1e-5, atol=1e-4)
+
+    # entries absent from a sparse matrix are missing, not zero
+    S = sparse.random(200, 4, density=0.5, format="csr", random_state=1)
+    booster = xgb.train({"max_depth": 4}, xgb.DMatrix(S, np.arange(200.0)), 20)
+    np.testing.assert_allclose(trees.compile_booster(booster).predict(S), booster.predict(xgb.DMatrix(S)),
+                               rtol=1e-5, atol=1e-4)
+
+
+def test_log_link_and_unsupported_objectives():
+    X, y = regression_data()
+    booster = xgb.train({"objective": "count:poisson", "max_depth": 4}, xgb.DMatrix(X, y), 20)
+    np.testing.assert_allclose(trees.compile_booster(booster).predict(X), booster.predict(xgb.DMatrix(X)),
+                               rtol=1e-5)
+
+    booster = xgb.train({"objective": "binary:logistic"}, xgb.DMatrix(X, y > 50), 5)
+    with pytest.raises(NotImplementedError):
+        trees.compile_booster(booster)
+
+
+def test_inference_uses_compiled_trees_for_small_batches(monkeypatch):
+    model = inference.read_model(predictor="xgboost")
+    loaded = inference.read_model(predictor="compiled")
+    assert model.compiled is None and loaded.compiled is not None
+
+    ts = datetime(2025, 4, 17, 9, tzinfo=AEST)
+    sensors = [f"S{i}" for i in range(inference.COMPILED_MAX_ROWS + 1)]
+    lags_24h, lags_168h = np.linspace(0, 900, len(sensors)), np.linspace(10, 1000, len(sensors))
+    small = (sensors[:-1], ts, lags_24h[:-1], lags_168h[:-1])
+    np.testing.assert_allclose(predict_batch(*small, model=loaded), predict_batch(*small, model=model),
+                               rtol=1e-5, atol=1e-3)
+
+    calls = []
+    monkeypatch.setattr(loaded.compiled, "predict", lambda rows: calls.append(len(rows)) or np.zeros(len(rows)))
+    predict_batch(sensors[:2], ts, lags_24h[:2], lags_168h[:2], model=loaded)
+    predict_batch(sensors, ts, lags_24h, lags_168h, model=loaded)
+    assert calls == [2]  # the larger batch went to XGBoost
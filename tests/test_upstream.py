@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from src.upstream import MAX_RECORDS, LagCache, UpstreamClient, _MISSING
+
+
+def test_lag_cache_lru_eviction():
+    cache = LagCache(maxsize=2)
+    t = datetime(2025, 1, 1, 9)
+    cache.put("A", t, 1.0)
+    cache.put("B", t, 2.0)
+    assert cache.get("A", t) == 1.0  # A becomes most recently used
+    cache.put("C", t, 3.0)           # evicts B
+
+    assert cache.get("B", t) is _MISSING and len(cache) == 2
+    assert cache.get("C", t) == 3.0
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_lag_cache_negative_ttl(clock):
+    cache = LagCache(negative_ttl=60, clock=clock)
+    t = datetime(2025, 1, 1, 9)
+    cache.put("A", t, None)
+    cache.put("B", t, 5.0)
+
+    clock.now = 59
+    assert cache.get("A", t) is None
+    clock.now = 61
+    assert cache.get("A", t) is _MISSING  # expired
+    assert cache.get("B", t) == 5.0       # found values do not expire
+    assert len(cache) == 1
+
+    # a complete hour: sensors missing from it have no data until the TTL passes
+    cache.put_hour(t, {"B": 5.0})
+    assert cache.get("C", t) is None and cache.get("B", t) == 5.0
+    clock.now = 122
+    assert cache.get("C", t) is _MISSING and cache.get("B", t) == 5.0
+
+
+def test_lag_cache_evicted_hour_entries_are_misses():
+    cache = LagCache(maxsize=3)
+    t = datetime(2025, 1, 1, 9)
+    cache.put_hour(t, {"A": 1.0, "B": 2.0, "C": 3.0})
+    cache.put("Z", t + timedelta(hours=1), 5.0)  # evicts A
+    assert cache.get("A", t) is _MISSING  # A had data: not "no data"
+    assert cache.get("D", t) is None
+
+
+@pytest.mark.asyncio
+async def test_get_lag_uses_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params["refine.sensor_name"])
+        if request.url.params["refine.sensor_name"] == "empty":
+            return httpx.Response(200, json={"results": []})
+        return httpx.Response(200, json={"results": [{"pedestriancount": 7}]})
+
+    ts = datetime(2025, 1, 8, 9)
+    async with UpstreamClient(transport=httpx.MockTransport(handler), cache=LagCache(), bulk=False) as client:
+        assert await client.get_lag("A", ts, 24) == 7.0
+        assert await client.get_lag("A", ts, 24) == 7.0
+        # the 168h lag of one hour is the 24h lag of another: same (sensor, target) key
+        assert await client.get_lag("A", datetime(2025, 1, 14, 9), 168) == 7.0
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                await client.get_lag("empty", ts, 24)
+            assert exc.value.status_code == 404
+
+    assert calls == ["A", "empty"]
+
+
+class FakeRecordsAPI:
+    """v2.1 records endpoint over `records`: refine.* filters, limit/offset paging, request count."""
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        params = request.url.params
+        offset, limit = int(params["offset"]), int(params["limit"])
+        assert limit <= 100 and offset + limit <= MAX_RECORDS
+        refine = {k.removeprefix("refine."): v for k, v in params.items() if k.startswith("refine.")}
+        matched = [r for r in self.records if all(str(r[k]) == v for k, v in refine.items())]
+        fields = params["select"].split(",")
+        return httpx.Response(200, json={
+            "total_count": len(matched),
+            "results": [{k: r[k] for k in fields} for r in matched[offset:offset + limit]],
+        })
+
+
+@pytest.mark.asyncio
+async def test_bulk_lag_lookups_share_paged_hour_queries():
+    ts = datetime(2025, 1, 8, 9)
+    sensors = [f"S{i:03d}" for i in range(250)]
+    api = FakeRecordsAPI([
+        {"sensor_name": s, "sensing_date": (ts - timedelta(hours=lag)).strftime("%Y-%m-%d"),
+         "hourday": (ts - timedelta(hours=lag)).hour, "pedestriancount": i + lag}
+        for lag in (24, 168) for i, s in enumerate(sensors)
+    ])
+
+    async with UpstreamClient(transport=httpx.MockTransport(api), cache=LagCache()) as client:
+        values = await asyncio.gather(*(client.get_lag(s, ts, lag) for s in sensors for lag in (24, 168)))
+        assert values == [float(i + lag) for i in range(250) for lag in (24, 168)]
+        assert api.requests == 2 * 3  # two hours, three pages each (vs 500 single-row queries)
+        assert client.hour_flight.stats()["started"] == 2
+
+        # every sensor of a fetched hour is cached; sensors missing from it are a 404
+        # without another query for the hour
+        assert await client.get_lag("S007", ts + timedelta(hours=24), 48) == 31.0
+        for sensor in ("unknown", "other"):
+            with pytest.raises(HTTPException) as exc:
+                await client.get_lag(sensor, ts, 24)
+            assert exc.value.status_code == 404
+        assert api.requests == 6